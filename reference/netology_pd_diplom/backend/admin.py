@@ -1,6 +1,19 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from backend.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem, Contact
+from backend.models import (
+    User, Shop, Category, Product, ProductInfo, Order, OrderItem, Contact, ImportJob, PriceListSource,
+    CategoryFacet, OutgoingEmail, DeviceToken,
+)
+from backend.pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Список большой таблицы: без фильтров число строк оценивается вместо COUNT(*),
+    с фильтрами не считается ещё и вся таблица
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(User)
@@ -27,34 +40,88 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('name', 'user', 'state')
+    list_filter = ('state',)
+    list_select_related = ('user',)
+    search_fields = ('name',)
+    raw_id_fields = ('user',)
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+    autocomplete_fields = ('shops',)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    pass
+class ProductAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'category')
+    list_filter = ('category',)
+    list_select_related = ('category',)
+    search_fields = ('name',)
+    autocomplete_fields = ('category',)
 
 
 @admin.register(ProductInfo)
-class ProductInfoAdmin(admin.ModelAdmin):
-    pass
+class ProductInfoAdmin(LargeTableAdmin):
+    list_display = ('id', 'product', 'shop', 'model', 'quantity', 'price')
+    # Фильтры по индексам: shop_id и product.category_id
+    list_filter = ('shop', 'product__category')
+    list_select_related = ('product', 'shop')
+    raw_id_fields = ('product',)
+    autocomplete_fields = ('shop',)
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    pass
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'state', 'dt', 'total_sum', 'updated_at')
+    list_filter = ('state',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user', 'contact')
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
-    pass
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'order', 'product_name', 'model', 'shop_name', 'price', 'quantity')
+    list_filter = ('shop',)
+    list_select_related = ('order',)
+    raw_id_fields = ('order', 'product_info')
+    autocomplete_fields = ('shop',)
 
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('user', 'city', 'street', 'phone')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'phase', 'processed', 'created_at')
+    list_filter = ('phase',)
+
+
+@admin.register(PriceListSource)
+class PriceListSourceAdmin(admin.ModelAdmin):
+    list_display = ('url', 'user', 'checked_at', 'imported_at')
+
+
+@admin.register(CategoryFacet)
+class CategoryFacetAdmin(admin.ModelAdmin):
+    list_display = ('category', 'parameter_name', 'value', 'count')
+    list_select_related = ('category',)
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'dedup_key')
+
+
+@admin.register(DeviceToken)
+class DeviceTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'device', 'created_at', 'expires_at', 'revoked_at')
+    list_select_related = ('user',)
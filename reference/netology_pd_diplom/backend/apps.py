@@ -6,5 +6,6 @@ class BackendConfig(AppConfig):
     name = 'backend'
 
     def ready(self):
+        import backend.checks
         import backend.signals
         
@@ -0,0 +1,202 @@
+"""
+Асинхронные варианты представлений для запуска под ASGI (ASYNC_VIEWS=True)
+и поток событий заказов order/events.
+
+DRF 3.14 не умеет асинхронные обработчики, поэтому AsyncAPIViewMixin повторяет
+APIView.dispatch с await. Аутентификация, проверка прав и throttling обращаются
+к базе синхронно и выполняются в потоке через sync_to_async; запись в базу
+(корзина, оформление заказа) тоже идёт в потоке - транзакции в Django только синхронные.
+
+Асинхронные методы ORM (afirst, aget_or_create) и встроенных бэкендов кеша Django
+(LocMem, файловый, Redis) сами вызывают синхронный код через sync_to_async, поэтому версия
+каталога и ответы из кеша тоже читаются в потоке - короткими вызовами, а не всем обработчиком.
+Без потока на всё время соединения обходится только order/events
+"""
+import asyncio
+import inspect
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from backend.catalog import aget_catalog_version, catalog_cache_key
+from backend.events import get_order_events, order_event, parse_since
+from backend.models import Order
+from backend.renderers import EventStreamRenderer
+from backend.serializers import OrderSerializer
+from backend.views import (
+    ORDERED_ITEMS_PREFETCH, BasketView, CategoryView, OrderView, ProductInfoView, ShopView,
+)
+
+
+def in_thread(handler):
+    """
+    Синхронный обработчик представления, выполняемый в потоке
+    """
+    async def wrapper(self, request, *args, **kwargs):
+        return await sync_to_async(handler)(self, request, *args, **kwargs)
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+
+class AsyncAPIViewMixin:
+    """
+    APIView.dispatch для асинхронных обработчиков: get/post/... объявляются через async def
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncCatalogListMixin(AsyncAPIViewMixin):
+    """
+    Условный GET каталога: 304 отдаётся после одного запроса версии каталога, без выборки и сериализации
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.catalog_state = await aget_catalog_version(self.get_catalog_scope(request))
+        etag, last_modified = self.get_validators(request, self.catalog_state)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await self.alist(request, *args, **kwargs)
+        return self.add_validators(response, etag, last_modified)
+
+    async def alist(self, request, *args, **kwargs):
+        return await sync_to_async(self.list)(request, *args, **kwargs)
+
+
+class AsyncCategoryView(AsyncCatalogListMixin, CategoryView):
+    pass
+
+
+class AsyncShopView(AsyncCatalogListMixin, ShopView):
+    pass
+
+
+class AsyncProductInfoView(AsyncCatalogListMixin, ProductInfoView):
+    """
+    Ответ из кеша отдаётся одним чтением кеша; выборка и сериализация страницы - одним вызовом в потоке
+    """
+
+    async def alist(self, request, *args, **kwargs):
+        key = catalog_cache_key(request, self.catalog_state.version)
+        data = await cache.aget(key)
+        if data is None:
+            data = await sync_to_async(self.build_page)(request, *args, **kwargs)
+            await cache.aset(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return Response(data)
+
+
+class AsyncBasketView(AsyncAPIViewMixin, BasketView):
+
+    async def get(self, request, *args, **kwargs):
+        baskets = Order.objects.with_total().select_related('contact').prefetch_related(ORDERED_ITEMS_PREFETCH)
+        basket, created = await baskets.aget_or_create(user=request.user, state='basket')
+        if created:
+            # Новая корзина создаётся без аннотации total и выбранных позиций
+            basket = await baskets.aget(pk=basket.pk)
+        # Всё нужное сериализатору уже выбрано, к базе он не обращается
+        return Response(OrderSerializer(basket).data)
+
+    post = in_thread(BasketView.post)
+    delete = in_thread(BasketView.delete)
+
+
+class AsyncOrderView(AsyncAPIViewMixin, OrderView):
+    """
+    Оформление заказа - транзакция с резервированием товара, поэтому выполняется в потоке.
+    Письма записываются в очередь OutgoingEmail: с брокером их после фиксации отправляет
+    воркер, без брокера - задача в том же потоке после фиксации
+    """
+    post = in_thread(OrderView.post)
+    get = in_thread(OrderView.get)
+
+
+def sse_event(event):
+    return f'id: {event["updated_at"]}\nevent: order\ndata: {json.dumps(event)}\n\n'
+
+
+class OrderEventsView(AsyncAPIViewMixin, APIView):
+    """
+    Поток изменений заказов покупателя и его корзины (server-sent events) вместо опроса order/.
+    Событие order: {"id", "state", "updated_at"}, id события - updated_at. При переподключении
+    с Last-Event-ID (или ?since=) сначала отдаются заказы, изменённые после этого времени.
+    Под WSGI поток не удерживается: отдаются изменения и соединение закрывается,
+    клиент переподключается через retry
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    async def get(self, request, *args, **kwargs):
+        raw = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('since')
+        since = parse_since(raw) if raw else None
+        if raw and since is None:
+            return Response({'status': False, 'error': 'Неверный формат since'}, status=400)
+
+        keep_open = isinstance(request._request, ASGIRequest)
+        response = StreamingHttpResponse(
+            self.stream(request.user.pk, since, keep_open), content_type='text/event-stream'
+        )
+        patch_cache_control(response, no_cache=True)
+        # Отключает буферизацию ответа в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, user_id, since, keep_open):
+        options = settings.ORDER_EVENTS
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (options['STREAM_TIMEOUT'] if keep_open else 0)
+        sent = {}
+        # Подписка до выборки пропущенных изменений, чтобы не потерять событие между ними
+        with get_order_events().subscribe(user_id) as queue:
+            yield f'retry: {options["RETRY_MS"]}\n\n'
+            if since is not None:
+                changed = Order.objects.filter(user_id=user_id, updated_at__gt=since).order_by(
+                    'updated_at'
+                ).values_list('id', 'state', 'updated_at')
+                async for order_id, state, updated_at in changed:
+                    event = order_event(order_id, state, updated_at)
+                    sent[order_id] = event['updated_at']
+                    yield sse_event(event)
+
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(queue.get(), min(options['HEARTBEAT'], remaining))
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if sent.get(event['id'], '') >= event['updated_at']:
+                    continue
+                sent[event['id']] = event['updated_at']
+                yield sse_event(event)
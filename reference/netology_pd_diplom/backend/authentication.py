@@ -0,0 +1,280 @@
+import base64
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from backend.models import DeviceToken, User
+
+SIGNED_TOKEN_SALT = 'backend.authentication.DeviceToken'
+SignedToken = namedtuple('SignedToken', ['id', 'user_id', 'expires'])
+# В кеше токена только его поля, пользователь с хешем пароля в общий кеш не попадает
+CachedToken = namedtuple('CachedToken', ['key', 'user_id', 'created'])
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def token_cache_key(key):
+    # В ключах кеша хранится хеш, а не сам токен
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    Кеш токенов: LRU в памяти процесса с ограниченным временем жизни и,
+    по желанию, общий кеш Django для нескольких процессов.
+
+    Удаление из общего кеша видно всем процессам сразу, локальные копии в других
+    процессах живут не дольше TTL. Записи с shared=False (пользователи) остаются
+    только в памяти процесса.
+    """
+
+    def __init__(self, maxsize, ttl, shared_alias=None, shared_ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self.shared_ttl = shared_ttl or ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = dict.fromkeys(('hits', 'shared_hits', 'misses', 'evictions', 'invalidations'), 0)
+
+    @classmethod
+    def from_settings(cls):
+        options = settings.TOKEN_AUTH_CACHE
+        return cls(options['MAXSIZE'], options['TTL'], options.get('SHARED_CACHE'), options.get('SHARED_TTL'))
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def _count(self, name):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def get(self, key, shared=True):
+        cache_key = token_cache_key(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(cache_key)
+                    self.metrics['hits'] += 1
+                    return entry[1]
+                del self._entries[cache_key]
+
+        if shared and self.shared is not None:
+            token = self.shared.get(cache_key)
+            if token is not None:
+                self._count('shared_hits')
+                self._store(cache_key, token)
+                return token
+        self._count('misses')
+        return None
+
+    def _store(self, cache_key, token):
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic() + self.ttl, token)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.metrics['evictions'] += 1
+
+    def set(self, key, token, shared=True):
+        cache_key = token_cache_key(key)
+        self._store(cache_key, token)
+        if shared and self.shared is not None:
+            self.shared.set(cache_key, token, self.shared_ttl)
+
+    def invalidate(self, *keys):
+        cache_keys = [token_cache_key(key) for key in keys]
+        with self._lock:
+            for cache_key in cache_keys:
+                self._entries.pop(cache_key, None)
+            self.metrics['invalidations'] += len(cache_keys)
+        if self.shared is not None:
+            self.shared.delete_many(cache_keys)
+
+    def invalidate_user(self, user_id):
+        self.invalidate(user_cache_key(user_id), *Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics, size=len(self._entries), maxsize=self.maxsize, ttl=self.ttl)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['shared_hits']) / lookups, 4) if lookups else None
+        return stats
+
+
+token_cache = TokenCache.from_settings()
+
+
+def get_cached_user(user_id):
+    """
+    Пользователь из кеша процесса или из базы; None, если пользователя нет
+    """
+    user = token_cache.get(user_cache_key(user_id), shared=False)
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            return None
+        token_cache.set(user_cache_key(user_id), user, shared=False)
+    # Копия, чтобы запросы не делили между собой один объект пользователя
+    return copy.copy(user)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к базе для уже проверенных токенов
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, CachedToken(token.key, token.user_id, token.created))
+            token_cache.set(user_cache_key(user.pk), user, shared=False)
+            return copy.copy(user), token
+
+        user = get_cached_user(cached.user_id)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Неверный токен')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('Пользователь не активен')
+        token = Token(key=cached.key, user_id=cached.user_id, created=cached.created)
+        # Токен прочитан из базы раньше: без _state.db присваивание user спросило бы роутер о записи
+        token._state.db, token._state.adding = user._state.db, False
+        token.user = user
+        return user, token
+
+
+def _signature(user, token_id, expires):
+    # Хеш пароля входит в подпись: после смены пароля старые токены недействительны
+    message = f'{user.pk}.{token_id}.{expires}.{user.password}'
+    digest = salted_hmac(SIGNED_TOKEN_SALT, message, algorithm='sha256').digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def issue_device_token(user, device=''):
+    """
+    Выдаёт подписанный токен вида <user_id>.<id>.<expires>.<подпись>
+    """
+    now = timezone.now()
+    prune_device_tokens(DeviceToken.objects.filter(user=user), now)
+    expires_at = now + settings.AUTH_TOKEN_TTL
+    record = DeviceToken.objects.create(user=user, device=device[:100], expires_at=expires_at)
+    expires = int(expires_at.timestamp())
+    return f'{user.pk}.{record.id.hex}.{expires}.{_signature(user, record.id.hex, expires)}', record
+
+
+def parse_signed_token(key):
+    try:
+        user_id, token_id, expires, signature = key.split('.')
+        return int(user_id), uuid.UUID(hex=token_id).hex, int(expires), signature
+    except ValueError:
+        return None
+
+
+class RevocationList:
+    """
+    Отозванные и ещё не истёкшие токены. Список небольшой, поэтому процесс держит его
+    в памяти и перечитывает из базы не чаще раза в AUTH_TOKEN_REVOCATION_REFRESH секунд
+    """
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self._revoked = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        revoked = DeviceToken.objects.filter(
+            revoked_at__isnull=False, expires_at__gt=timezone.now()
+        ).values_list('id', flat=True)
+        self._revoked = frozenset(token_id.hex for token_id in revoked)
+        self._loaded_at = time.monotonic()
+
+    def __contains__(self, token_id):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh:
+                    self._reload()
+        return token_id in self._revoked
+
+    def add(self, token_id):
+        with self._lock:
+            self._revoked = self._revoked | {token_id}
+
+    def reset(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+revocation_list = RevocationList(settings.AUTH_TOKEN_REVOCATION_REFRESH)
+
+
+def revoke_device_tokens(tokens):
+    """
+    Отзывает токены устройств; отзыв сразу виден в этом процессе, в остальных -
+    после очередного обновления списка отзыва
+    """
+    ids = list(tokens.filter(revoked_at__isnull=True).values_list('id', flat=True))
+    DeviceToken.objects.filter(id__in=ids).update(revoked_at=timezone.now())
+    for token_id in ids:
+        revocation_list.add(token_id.hex)
+    return len(ids)
+
+
+def prune_device_tokens(tokens=None, now=None):
+    """
+    Удаляет истёкшие токены устройств. Отозванные токены хранятся до истечения срока:
+    по ним строится список отзыва
+    """
+    if tokens is None:
+        tokens = DeviceToken.objects.all()
+    deleted, _ = tokens.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
+
+
+class SignedTokenAuthentication(CachedTokenAuthentication):
+    """
+    Подписанные токены устройств проверяются без обращения к базе: подпись, срок
+    действия и список отзыва, пользователь берётся из кеша токенов.
+    Старые токены модели Token по-прежнему принимаются
+    """
+
+    def authenticate_credentials(self, key):
+        parsed = parse_signed_token(key)
+        if parsed is None:
+            return super().authenticate_credentials(key)
+
+        user_id, token_id, expires, signature = parsed
+        if expires < time.time():
+            raise exceptions.AuthenticationFailed('Срок действия токена истёк')
+        if token_id in revocation_list:
+            raise exceptions.AuthenticationFailed('Токен отозван')
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Неверный токен')
+        if not constant_time_compare(signature, _signature(user, token_id, expires)):
+            raise exceptions.AuthenticationFailed('Неверный токен')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('Пользователь не активен')
+        return user, SignedToken(token_id, user_id, expires)
@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.utils import timezone
+
+from backend.events import publish_order_change
+from backend.models import Order, OrderItem, ProductInfo
+
+
+class BasketError(ValueError):
+    """
+    Позиции корзины не прошли проверку; results содержит результат по каждой позиции
+    """
+
+    def __init__(self, results):
+        super().__init__('Ошибка в позициях корзины')
+        self.results = results
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_items(items, with_quantity=True):
+    """
+    Разбирает список позиций запроса в словарь product_info -> количество.
+    Повторная позиция с тем же product_info заменяет предыдущую
+    """
+    if not isinstance(items, list):
+        raise BasketError([{'product_info': None, 'error': 'Ожидается список позиций'}])
+    parsed, errors = {}, []
+    for item in items:
+        item = item if isinstance(item, dict) else {'product_info': item}
+        product_info_id = _to_int(item.get('product_info'))
+        if product_info_id is None:
+            errors.append({'product_info': item.get('product_info'), 'error': 'Неверный product_info'})
+            continue
+        quantity = _to_int(item.get('quantity', 1)) if with_quantity else None
+        if with_quantity and (quantity is None or quantity < 1):
+            errors.append({'product_info': product_info_id, 'error': 'Количество должно быть положительным числом'})
+            continue
+        parsed[product_info_id] = quantity
+    if errors:
+        raise BasketError(errors)
+    return parsed
+
+
+def _touch(basket):
+    """
+    Отмечает изменение корзины в той же транзакции: order/?since= и поток order/events видят правку позиций
+    """
+    basket.updated_at = timezone.now()
+    Order.objects.filter(pk=basket.pk).update(updated_at=basket.updated_at)
+    publish_order_change(basket.user_id, basket.pk, basket.state, basket.updated_at)
+
+
+def add_items(basket, items):
+    """
+    Добавляет позиции в корзину или меняет их количество.
+
+    Все product_info читаются одним запросом и проверяются вместе; если хотя бы одна
+    позиция не прошла проверку, корзина не меняется. Изменения записываются одним upsert.
+    """
+    quantities = parse_items(items)
+    offers = {
+        product_info_id: (quantity, shop_id)
+        for product_info_id, quantity, shop_id in ProductInfo.objects.filter(
+            id__in=quantities
+        ).values_list('id', 'quantity', 'shop_id')
+    }
+    errors = []
+    for product_info_id, quantity in quantities.items():
+        if product_info_id not in offers:
+            errors.append({'product_info': product_info_id, 'error': 'Товар не найден'})
+        elif quantity > offers[product_info_id][0]:
+            errors.append({'product_info': product_info_id, 'error': f'Доступно только {offers[product_info_id][0]} шт.'})
+    if errors:
+        raise BasketError(errors)
+
+    with transaction.atomic():
+        existing = set(basket.ordered_items.filter(
+            product_info_id__in=quantities
+        ).values_list('product_info_id', flat=True))
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(order=basket, product_info_id=product_info_id,
+                          shop_id=offers[product_info_id][1], quantity=quantity)
+                for product_info_id, quantity in quantities.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['order', 'product_info'],
+            update_fields=['quantity', 'shop'],
+        )
+        _touch(basket)
+    return [
+        {
+            'product_info': product_info_id,
+            'quantity': quantity,
+            'result': 'updated' if product_info_id in existing else 'created',
+        }
+        for product_info_id, quantity in quantities.items()
+    ]
+
+
+def remove_items(basket, items):
+    """
+    Удаляет позиции из корзины одним запросом DELETE
+    """
+    product_info_ids = list(parse_items(items, with_quantity=False))
+    with transaction.atomic():
+        items = basket.ordered_items.filter(product_info_id__in=product_info_ids)
+        existing = set(items.values_list('product_info_id', flat=True))
+        if existing:
+            items.delete()
+            _touch(basket)
+    return [
+        {'product_info': product_info_id, 'result': 'deleted' if product_info_id in existing else 'not_found'}
+        for product_info_id in product_info_ids
+    ]
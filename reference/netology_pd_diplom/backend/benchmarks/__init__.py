@@ -0,0 +1,3 @@
+"""
+Инструменты для нагрузочных замеров: генерация синтетических данных и измерения
+"""
@@ -0,0 +1,193 @@
+import json
+import os
+import random
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APIClient
+
+from backend.benchmarks.generator import generate_categories, write_price_list
+from backend.benchmarks.measure import peak_rss_mb, summarize
+from backend.checkout import snapshot_orders
+from backend.metrics import collect_metrics
+from backend.models import CatalogEntry, Category, Contact, Order, OrderItem, Parameter, ProductInfo, User
+
+# call(client, index) выполняет запрос номер index от имени user(index);
+# limit - предел числа запросов, например когда запрос расходует корзину покупателя
+Scenario = namedtuple('Scenario', ['name', 'user', 'call', 'limit'])
+
+
+def create_suppliers(shops):
+    users = []
+    for index in range(shops):
+        user, _ = User.objects.get_or_create(
+            email=f'bench-partner-{index}@example.com', defaults={'type': 'shop', 'is_active': True}
+        )
+        users.append(user)
+    return users
+
+
+def write_price_lists(directory, offers, shops, seed=0):
+    """
+    Прайс-листы магазинов в формате data/shop1.yaml с общим набором категорий
+    """
+    categories = generate_categories()
+    per_shop = offers // shops
+    paths = []
+    for index in range(shops):
+        count = per_shop if index < shops - 1 else offers - per_shop * (shops - 1)
+        path = os.path.join(directory, f'shop{index}.yaml')
+        write_price_list(path, count, shop=f'Магазин {index}', categories=categories, seed=seed + index)
+        paths.append(path)
+    return paths
+
+
+def upload(client, path):
+    with open(path, 'rb') as stream:
+        upload_file = SimpleUploadedFile(os.path.basename(path), stream.read(), content_type='application/x-yaml')
+    return client.post('/api/v1/partner/update', {'file': upload_file}, format='multipart')
+
+
+def seed_buyers(buyers, orders, lines, seed=0):
+    """
+    Покупатели с контактом, полной корзиной и историей из orders заказов по lines позиций
+    """
+    rnd = random.Random(seed)
+    offers = list(ProductInfo.objects.values_list('id', 'shop_id'))
+    User.objects.bulk_create([
+        User(email=f'bench-buyer-{index}@example.com', is_active=True, password='!') for index in range(buyers)
+    ])
+    users = list(User.objects.filter(email__startswith='bench-buyer-').order_by('id'))
+    Contact.objects.bulk_create([Contact(user=user, city='Москва', street='Ленина', phone='1') for user in users])
+    Order.objects.bulk_create([
+        Order(user=user, state=state, total_sum=None)
+        for user in users
+        for state in ['basket'] + ['delivered'] * orders
+    ])
+    items = []
+    for order in Order.objects.filter(user__in=users):
+        items += [
+            OrderItem(order=order, product_info_id=offer_id, shop_id=shop_id, quantity=rnd.randint(1, 3))
+            for offer_id, shop_id in rnd.sample(offers, min(lines, len(offers)))
+        ]
+    OrderItem.objects.bulk_create(items, batch_size=5000)
+    snapshot_orders(Order.objects.filter(user__in=users).exclude(state='basket'))
+    # Остатков должно хватить на оформление всех корзин
+    ProductInfo.objects.update(quantity=1000)
+    CatalogEntry.objects.update(quantity=1000)
+    contacts = dict(Contact.objects.filter(user__in=users).values_list('user_id', 'id'))
+    return [(user, contacts[user.id]) for user in users]
+
+
+def import_scenario(suppliers, paths):
+    """
+    Загрузка прайс-листов: первый проход создаёт каталог, повторный обновляет его
+    """
+    return Scenario('partner/update', lambda index: suppliers[index % len(suppliers)],
+                    lambda client, index: upload(client, paths[index % len(paths)]), len(paths))
+
+
+def api_scenarios(buyers, lines, seed=0):
+    rnd = random.Random(seed)
+    offer_ids = list(ProductInfo.objects.values_list('id', flat=True))
+    category = Category.objects.order_by('id').values_list('id', flat=True).first()
+    color = Parameter.objects.filter(name='Цвет').values_list('id', flat=True).first()
+    additions = [
+        [{'product_info': offer_id, 'quantity': 1} for offer_id in rnd.sample(offer_ids, min(lines, len(offer_ids)))]
+        for _ in buyers
+    ]
+
+    def get(url):
+        return lambda client, index: client.get(url)
+
+    def buyer(index):
+        return buyers[index % len(buyers)]
+
+    def remove_one(client, index):
+        item = OrderItem.objects.filter(order__user=buyer(index)[0], order__state='basket').values_list(
+            'product_info_id', flat=True
+        ).first()
+        return client.delete('/api/v1/basket', {'items': [item]}, format='json')
+
+    # Удаление и оформление меняют корзину, поэтому каждый покупатель участвует в них один раз
+    once = len(buyers) - 1
+    return [
+        Scenario('products', None, get('/api/v1/products'), None),
+        Scenario('products?category', None, get(f'/api/v1/products?product__category={category}'), None),
+        Scenario('products?search', None, get('/api/v1/products?search=apple'), None),
+        Scenario('products?cursor', None, get('/api/v1/products?pagination=cursor&ordering=price'), None),
+        Scenario('products?facets', None, get(f'/api/v1/products?param_{color}=черный&facets=true'), None),
+        Scenario('basket GET', lambda index: buyer(index)[0], get('/api/v1/basket'), None),
+        Scenario('basket POST', lambda index: buyer(index)[0],
+                 lambda client, index: client.post('/api/v1/basket', {'items': additions[index % len(buyers)]},
+                                                   format='json'), None),
+        Scenario('basket DELETE', lambda index: buyer(index)[0], remove_one, once),
+        Scenario('order GET', lambda index: buyer(index)[0], get('/api/v1/order/'), None),
+        Scenario('order POST', lambda index: buyer(index)[0],
+                 lambda client, index: client.post('/api/v1/order/', {'contact': buyer(index)[1]}, format='json'),
+                 once),
+    ]
+
+
+def run_scenario(scenario, repeat):
+    """
+    Первый запрос выполняется под tracemalloc (пиковая память Python-объектов, он же прогрев),
+    остальные замеряются по времени и числу SQL-запросов
+    """
+    client = APIClient()
+    count = repeat if scenario.limit is None else min(repeat, scenario.limit)
+
+    def request(index):
+        client.force_authenticate(scenario.user(index) if scenario.user else None)
+        with collect_metrics() as metrics:
+            started = time.perf_counter()
+            response = scenario.call(client, index)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f'{scenario.name}: ответ {response.status_code} {response.content[:200]!r}')
+        return elapsed, metrics.queries
+
+    tracemalloc.start()
+    try:
+        request(0)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies, queries = [], []
+    for index in range(1, count + 1):
+        elapsed, query_count = request(index)
+        latencies.append(elapsed)
+        queries.append(query_count)
+    return dict(summarize(latencies), queries=max(queries, default=0), peak_kb=peak / 1024)
+
+
+def regressions(results, baseline, tolerance, noise_ms=1.0):
+    """
+    Сравнение с сохранёнными замерами: рост p95 больше чем на tolerance (и больше шума noise_ms)
+    или рост числа SQL-запросов
+    """
+    found = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            found.append(f'{key}: SQL-запросов {previous["queries"]} -> {current["queries"]}')
+        limit = previous['p95_ms'] * (1 + tolerance)
+        if current['p95_ms'] > limit and current['p95_ms'] - previous['p95_ms'] > noise_ms:
+            found.append(f'{key}: p95 {previous["p95_ms"]:.1f} -> {current["p95_ms"]:.1f} мс')
+    return found
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as stream:
+        return json.load(stream)['results']
+
+
+def save_baseline(path, results, options):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump({'options': options, 'peak_rss_mb': peak_rss_mb(), 'results': results},
+                  stream, ensure_ascii=False, indent=2, sort_keys=True)
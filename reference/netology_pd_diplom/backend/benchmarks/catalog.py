@@ -0,0 +1,51 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from backend.benchmarks.generator import generate_categories, generate_goods
+from backend.importer import PriceListImporter
+from backend.models import Shop, User
+
+
+@contextmanager
+def benchmark_database(on_disk=False):
+    """
+    Временная тестовая база, чтобы замеры не трогали рабочие данные.
+    on_disk: SQLite в файле вместо памяти, чтобы потоки работали с базой как с настоящей
+    """
+    if on_disk:
+        for connection in connections.all():
+            if connection.vendor == 'sqlite':
+                name = os.path.join(tempfile.gettempdir(), f'bench_{connection.alias}.sqlite3')
+                connection.settings_dict['TEST']['NAME'] = name
+                connection.settings_dict['OPTIONS'].setdefault('timeout', 30)
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(config, verbosity=0)
+        teardown_test_environment()
+
+
+def populate_catalog(offers, shops=1, batch_size=5000, seed=0):
+    """
+    Заполняет каталог синтетическими предложениями через импорт прайс-листов
+    """
+    categories = generate_categories()
+    per_shop = offers // shops
+    created = []
+    for index in range(shops):
+        user, _ = User.objects.get_or_create(
+            email=f'bench-shop-{index}@example.com', defaults={'type': 'shop', 'is_active': True}
+        )
+        shop, _ = Shop.objects.get_or_create(name=f'Магазин {index}', user=user)
+        count = per_shop if index < shops - 1 else offers - per_shop * (shops - 1)
+        PriceListImporter(shop, batch_size=batch_size).run(
+            categories, generate_goods(count, categories, seed=seed + index)
+        )
+        created.append(shop)
+    return created
@@ -0,0 +1,65 @@
+import json
+import random
+
+import yaml
+
+Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+CATEGORIES = ['Смартфоны', 'Аксессуары', 'Flash-накопители', 'Телевизоры', 'Ноутбуки', 'Планшеты']
+BRANDS = ['apple', 'samsung', 'xiaomi', 'sony', 'lg', 'huawei', 'asus', 'lenovo']
+COLORS = ['черный', 'белый', 'золотистый', 'красный', 'синий', 'серебристый']
+MEMORY = [32, 64, 128, 256, 512]
+
+
+def generate_categories(count=len(CATEGORIES)):
+    return [
+        {'id': index + 1, 'name': CATEGORIES[index % len(CATEGORIES)] + ('' if index < len(CATEGORIES) else f' {index}')}
+        for index in range(count)
+    ]
+
+
+def generate_goods(count, categories, seed=0):
+    """
+    Генерирует позиции прайс-листа в формате data/shop1.yaml
+    """
+    rnd = random.Random(seed)
+    for index in range(count):
+        brand = rnd.choice(BRANDS)
+        memory = rnd.choice(MEMORY)
+        color = rnd.choice(COLORS)
+        price = rnd.randrange(500, 150000, 10)
+        yield {
+            'id': 1000000 + index,
+            'category': rnd.choice(categories)['id'],
+            'model': f'{brand}/model-{index % 5000}',
+            'name': f'Товар {brand.capitalize()} {index} {memory}GB ({color})',
+            'price': price,
+            'price_rrc': price + price // 10,
+            'quantity': rnd.randrange(0, 50),
+            'parameters': {
+                'Диагональ (дюйм)': round(rnd.uniform(4.0, 75.0), 1),
+                'Встроенная память (Гб)': memory,
+                'Цвет': color,
+            },
+        }
+
+
+def write_price_list(path, items, fmt='yaml', shop='Синтетический магазин', categories=None, seed=0):
+    """
+    Записывает синтетический прайс-лист на диск построчно, не держа его в памяти
+    """
+    categories = categories or generate_categories()
+    with open(path, 'w', encoding='utf-8') as stream:
+        if fmt == 'json':
+            stream.write('{"shop": %s, "categories": %s, "goods": [' % (
+                json.dumps(shop, ensure_ascii=False), json.dumps(categories, ensure_ascii=False)
+            ))
+            for index, item in enumerate(generate_goods(items, categories, seed)):
+                stream.write(('\n' if index == 0 else ',\n') + json.dumps(item, ensure_ascii=False))
+            stream.write('\n]}\n')
+        else:
+            yaml.dump({'shop': shop, 'categories': categories}, stream, Dumper=Dumper, allow_unicode=True, sort_keys=False)
+            stream.write('goods:\n')
+            for item in generate_goods(items, categories, seed):
+                stream.write(yaml.dump([item], Dumper=Dumper, allow_unicode=True, sort_keys=False))
+    return path
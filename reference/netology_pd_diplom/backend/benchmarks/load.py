@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+
+from backend.benchmarks.measure import percentile, summarize
+
+
+class LoadError(Exception):
+    pass
+
+
+async def _read_response(reader):
+    """
+    Читает ответ HTTP/1.1: код, нужно ли закрыть соединение. Тело с Content-Length или chunked
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise LoadError('сервер закрыл соединение')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif status not in (204, 304):
+        await reader.read()
+        return status, True
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+async def _client(host, port, requests, counter, total, latencies, statuses):
+    """
+    Одно keep-alive соединение: отправляет запросы, пока не выполнено total на всех клиентов
+    """
+    reader = writer = None
+    try:
+        while counter[0] < total:
+            index = counter[0]
+            counter[0] += 1
+            path, headers, *body = requests(index)
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            method, payload = ('POST', json.dumps(body[0]).encode()) if body else ('GET', b'')
+            head = f'{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n'
+            if body:
+                head += f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+            head += ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+            started = time.perf_counter()
+            writer.write((head + '\r\n').encode('latin-1') + payload)
+            await writer.drain()
+            try:
+                status, close = await _read_response(reader)
+            except (LoadError, ConnectionError, asyncio.IncompleteReadError):
+                status, close = 0, True
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            if close:
+                writer.close()
+                reader = writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def _run(host, port, requests, concurrency, total):
+    counter, latencies, statuses = [0], [], {}
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, requests, counter, total, latencies, statuses) for _ in range(concurrency)
+    ])
+    return time.perf_counter() - started, latencies, statuses
+
+
+def run_load(host, port, requests, concurrency, total):
+    """
+    Нагрузка из concurrency одновременных keep-alive соединений, всего total запросов.
+    requests(index) -> (путь, заголовки) для GET или (путь, заголовки, тело) для POST с телом в JSON.
+    Пропускная способность, задержки, коды ответов
+    """
+    elapsed, latencies, statuses = asyncio.run(_run(host, port, requests, concurrency, total))
+    return dict(
+        summarize(latencies),
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        rps=len(latencies) / elapsed if elapsed else 0.0,
+        errors=sum(count for status, count in statuses.items() if not 200 <= status < 400),
+        statuses=statuses,
+    )
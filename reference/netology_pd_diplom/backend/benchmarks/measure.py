@@ -0,0 +1,61 @@
+import math
+import multiprocessing
+import resource
+import sys
+import time
+
+
+def peak_rss_mb():
+    """
+    Пиковое потребление памяти текущим процессом в мегабайтах
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux в килобайтах
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _child(target, args, queue):
+    started = time.perf_counter()
+    result = target(*args)
+    queue.put({
+        'seconds': time.perf_counter() - started,
+        'peak_rss_mb': peak_rss_mb(),
+        'result': result,
+    })
+
+
+def run_isolated(target, *args):
+    """
+    Выполняет функцию в отдельном процессе, чтобы пиковая память не смешивалась
+    между замерами
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(target, args, queue))
+    process.start()
+    measurement = queue.get()
+    process.join()
+    return measurement
+
+
+def percentile(values, fraction):
+    """
+    Перцентиль по ближайшему рангу, fraction от 0 до 1
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """
+    Сводка по замерам в миллисекундах
+    """
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'max_ms': max(latencies, default=0) * 1000,
+    }
@@ -0,0 +1,26 @@
+from backend.parsers import iter_price_list, load_price_list
+
+
+def parse_full(path, fmt):
+    """
+    Текущий путь: прайс-лист загружается в память целиком
+    """
+    with open(path, 'rb') as stream:
+        data = load_price_list(stream, fmt)
+    return len(data.get('goods', []))
+
+
+def parse_streaming(path, fmt, batch_size=1000):
+    """
+    Потоковый путь: позиции собираются в пачки ограниченного размера
+    """
+    count, batch = 0, []
+    with open(path, 'rb') as stream:
+        for section, entry in iter_price_list(stream, fmt):
+            if section != 'goods':
+                continue
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                count += len(batch)
+                batch = []
+    return count + len(batch)
@@ -0,0 +1,112 @@
+import hashlib
+from collections import namedtuple
+
+from django.db.models import F
+from django.utils import timezone
+
+from backend.models import CatalogEntry, CatalogVersion, ProductInfo
+
+CATALOG_SCOPE = 'catalog'
+CATALOG_ENTRY_FIELDS = (
+    'product_name', 'category_id', 'category_name', 'shop_id', 'shop_name', 'shop_state',
+    'model', 'quantity', 'price', 'price_rrc',
+)
+CatalogState = namedtuple('CatalogState', ['version', 'updated_at'])
+
+
+def shop_scope(shop_id):
+    return f'shop:{shop_id}'
+
+
+def _version_row(shop_id):
+    scope = CATALOG_SCOPE if shop_id is None else shop_scope(shop_id)
+    return CatalogVersion.objects.filter(key=scope).values_list('version', 'updated_at')
+
+
+def get_catalog_version(shop_id=None):
+    """
+    Версия всего каталога или предложений одного магазина и время её последнего изменения
+    """
+    row = _version_row(shop_id).first()
+    return CatalogState(*row) if row else CatalogState(0, None)
+
+
+async def aget_catalog_version(shop_id=None):
+    row = await _version_row(shop_id).afirst()
+    return CatalogState(*row) if row else CatalogState(0, None)
+
+
+def bump_catalog_version(shop_ids=()):
+    """
+    Отмечает изменение каталога: увеличивает общий счётчик и счётчики магазинов.
+    Закешированные ответы и ETag прежних версий перестают совпадать
+    """
+    keys = [CATALOG_SCOPE, *(shop_scope(shop_id) for shop_id in set(shop_ids))]
+    now = timezone.now()
+    updated = CatalogVersion.objects.filter(key__in=keys).update(version=F('version') + 1, updated_at=now)
+    if updated < len(keys):
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(key=key, version=1, updated_at=now) for key in keys], ignore_conflicts=True
+        )
+
+
+def request_fingerprint(request):
+    """
+    Адрес запроса с упорядоченными параметрами и форматом ответа
+    """
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    raw = f'{request.build_absolute_uri(request.path)}?{params}|{request.accepted_renderer.format}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def catalog_cache_key(request, version):
+    """
+    Ключ кеша ответа: версия каталога и адрес запроса
+    """
+    return f'catalog:{version}:{request_fingerprint(request)}'
+
+
+def catalog_etag(request, state, epoch=None):
+    """
+    Строгий ETag ответа: адрес запроса, версия каталога и, для ответов с остатками, номер
+    интервала CATALOG_CACHE_TIMEOUT (остатки обновляются без смены версии)
+    """
+    raw = f'{request_fingerprint(request)}|{state.version}|{epoch}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def refresh_catalog_entries(product_info_ids):
+    """
+    Пересобирает записи каталога для указанных предложений одним выбором и одной вставкой
+    """
+    rows = ProductInfo.objects.filter(id__in=product_info_ids).values_list(
+        'id', 'product__name', 'product__category_id', 'product__category__name',
+        'shop_id', 'shop__name', 'shop__state', 'model', 'quantity', 'price', 'price_rrc',
+    )
+    entries = [
+        CatalogEntry(product_info_id=row[0], **dict(zip(CATALOG_ENTRY_FIELDS, row[1:])))
+        for row in rows
+    ]
+    CatalogEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['product_info'],
+        update_fields=CATALOG_ENTRY_FIELDS,
+    )
+    return len(entries)
+
+
+def rebuild_catalog(batch_size=5000):
+    """
+    Полная пересборка каталога, например после развёртывания
+    """
+    ids = ProductInfo.objects.order_by('id').values_list('id', flat=True)
+    total, last_id = 0, 0
+    while True:
+        chunk = list(ids.filter(id__gt=last_id)[:batch_size])
+        if not chunk:
+            break
+        total += refresh_catalog_entries(chunk)
+        last_id = chunk[-1]
+    bump_catalog_version(ProductInfo.objects.values_list('shop_id', flat=True).distinct().order_by())
+    return total
@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from backend.events import publish_order_change
+from backend.models import CatalogEntry, Order, OrderItem, ProductInfo, items_total
+
+# Состояния, из которых заказ ещё можно отменить с возвратом товара на склад
+CANCELLABLE_STATES = (Order.NEW, Order.CONFIRMED, Order.ASSEMBLED)
+
+
+class CheckoutError(Exception):
+    """
+    Заказ не оформлен; short содержит позиции, которых не хватает на складе
+    """
+
+    def __init__(self, message, short=None):
+        super().__init__(message)
+        self.short = short or []
+
+
+class UnavailableItemsError(CheckoutError):
+    """
+    В корзине позиции предложений, удалённых из каталога после добавления в корзину
+    """
+
+    def __init__(self):
+        super().__init__('Часть товаров снята с продажи и удалена из корзины, проверьте корзину')
+
+
+class _OutOfStock(Exception):
+    pass
+
+
+def _per_offer(lines):
+    """
+    Количество по каждому предложению как выражение CASE для одного UPDATE
+    """
+    return Case(
+        *[When(pk=product_info_id, then=Value(quantity)) for product_info_id, quantity in lines.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def adjust_stock(lines, sign):
+    """
+    Меняет остатки всех предложений одним UPDATE.
+    При списании (sign=-1) строка меняется только если остатка хватает;
+    возвращает False, если хватило не всем позициям
+    """
+    offers = ProductInfo.objects.filter(pk__in=lines)
+    if sign < 0:
+        offers = offers.filter(quantity__gte=_per_offer(lines))
+    if offers.update(quantity=F('quantity') + sign * _per_offer(lines)) != len(lines):
+        return False
+    # Остатки копируются в каталог без сброса кеша ответов: он устареет не позже CATALOG_CACHE_TIMEOUT
+    CatalogEntry.objects.filter(product_info_id__in=lines).update(
+        quantity=Subquery(ProductInfo.objects.filter(pk=OuterRef('product_info_id')).values('quantity'))
+    )
+    return True
+
+
+def fill_item_shops(items):
+    """
+    Проставляет магазин позициям, добавленным до появления поля OrderItem.shop
+    """
+    return items.update(shop=Subquery(ProductInfo.objects.filter(pk=OuterRef('product_info_id')).values('shop_id')))
+
+
+def snapshot_items(items):
+    """
+    Копирует в позиции название товара, модель, магазин и цену предложения одним UPDATE
+    """
+    offer = ProductInfo.objects.filter(pk=OuterRef('product_info_id'))
+    return items.update(
+        shop=Subquery(offer.values('shop_id')),
+        product_name=Subquery(offer.values('product__name')),
+        model=Subquery(offer.values('model')),
+        shop_name=Subquery(offer.values('shop__name')),
+        price=Subquery(offer.values('price')),
+    )
+
+
+def snapshot_orders(orders):
+    """
+    Снимок позиций и сумма для заказов, созданных в обход checkout (данные замеров и проверок)
+    """
+    snapshot_items(OrderItem.objects.filter(order__in=orders))
+    return orders.update(total_sum=Coalesce(Subquery(items_total(OuterRef('pk'))), 0))
+
+
+def drop_unavailable_items(basket):
+    """
+    Удаляет из корзины позиции предложений, удалённых из каталога после добавления в корзину.
+    Вызывается после отказа в оформлении, вне его транзакции: иначе удаление откатится вместе с ней
+    """
+    removed, _ = OrderItem.objects.filter(
+        order_id=basket.pk, order__state='basket', product_info__isnull=True,
+    ).delete()
+    return removed
+
+
+def short_lines(lines):
+    available = dict(ProductInfo.objects.filter(pk__in=lines).values_list('pk', 'quantity'))
+    return [
+        {'product_info': product_info_id, 'requested': quantity, 'available': available.get(product_info_id, 0)}
+        for product_info_id, quantity in lines.items()
+        if quantity > available.get(product_info_id, 0)
+    ]
+
+
+def checkout(basket, contact):
+    """
+    Оформляет корзину в заказ и резервирует товар.
+
+    Смена состояния заказа и списание остатков по всем позициям выполняются двумя
+    условными UPDATE без блокировки строк: если хотя бы одной позиции не хватило,
+    транзакция откатывается и возвращается список недостающих позиций.
+    Корзина с позициями удалённых предложений не оформляется: UnavailableItemsError.
+    """
+    try:
+        with transaction.atomic():
+            # Условие на состояние не даёт оформить одну корзину дважды
+            placed = Order.objects.filter(pk=basket.pk, state='basket').update(
+                state=Order.NEW, contact=contact,
+                total_sum=Coalesce(Subquery(items_total(OuterRef('pk'))), 0),
+                updated_at=timezone.now(),
+            )
+            if not placed:
+                raise CheckoutError('Корзина уже оформлена')
+            lines = dict(basket.ordered_items.values_list('product_info_id', 'quantity'))
+            if not lines:
+                raise CheckoutError('Корзина пуста')
+            # У позиции удалённого предложения нет данных для снимка
+            if None in lines:
+                raise UnavailableItemsError
+            # Снимок в той же транзакции, что и сумма заказа: цены позиций совпадают с total_sum
+            snapshot_items(basket.ordered_items.all())
+            if not adjust_stock(lines, -1):
+                raise _OutOfStock
+    except _OutOfStock:
+        raise CheckoutError('Недостаточно товара на складе', short_lines(lines))
+
+    basket.refresh_from_db(fields=['state', 'contact', 'total_sum', 'updated_at'])
+    publish_order_change(basket.user_id, basket.pk, basket.state, basket.updated_at)
+    return basket
+
+
+def cancel_order(order):
+    """
+    Отменяет заказ и возвращает зарезервированный товар на склад
+    """
+    with transaction.atomic():
+        canceled = Order.objects.filter(pk=order.pk, state__in=CANCELLABLE_STATES).update(
+            state=Order.CANCELED, updated_at=timezone.now(),
+        )
+        if not canceled:
+            raise CheckoutError('Заказ нельзя отменить')
+        # Предложения, удалённые из каталога после оформления, на склад не возвращаются
+        lines = dict(order.ordered_items.filter(product_info__isnull=False).values_list('product_info_id', 'quantity'))
+        if lines:
+            adjust_stock(lines, 1)
+    order.refresh_from_db(fields=['state', 'updated_at'])
+    publish_order_change(order.user_id, order.pk, order.state, order.updated_at)
+    return order
@@ -0,0 +1,38 @@
+"""
+Проверки настроек: состояние, которое читают несколько процессов, должно храниться в общем кеше
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_process_local(alias):
+    return alias is None or settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@register()
+def check_import_progress_cache(app_configs, **kwargs):
+    if settings.CELERY_TASK_ALWAYS_EAGER or not is_process_local(settings.IMPORT_PROGRESS_CACHE):
+        return []
+    return [Error(
+        f'Кеш хода импорта {settings.IMPORT_PROGRESS_CACHE!r} виден только одному процессу, '
+        f'а импорт выполняет воркер Celery',
+        hint='Задайте SHARED_CACHE_URL (Redis) для общего кеша',
+        id='backend.E001',
+    )]
+
+
+@register()
+def check_replica_pin_cache(app_configs, **kwargs):
+    if not settings.DATABASE_REPLICAS or not is_process_local(settings.DB_REPLICA_PIN_CACHE):
+        return []
+    return [Error(
+        f'Кеш закрепления за основной базой {settings.DB_REPLICA_PIN_CACHE!r} виден только одному процессу: '
+        f'запрос после записи в другом процессе прочитал бы устаревшие данные с реплики',
+        hint='Задайте SHARED_CACHE_URL для общего кеша или уберите DB_REPLICAS',
+        id='backend.E002',
+    )]
@@ -0,0 +1,172 @@
+"""
+События изменения заказов для потока order/events: смена состояния и правка позиций корзины.
+
+Событие публикуется после фиксации транзакции, в которой изменился заказ, и доставляется
+открытым потокам покупателя. Бэкенд доставки задаётся в ORDER_EVENTS: LocalOrderEvents
+работает в памяти одного процесса, CacheOrderEvents передаёт события между процессами
+через общий кеш
+"""
+import asyncio
+import threading
+from contextlib import contextmanager
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+
+def format_timestamp(value):
+    """
+    Время изменения в UTC с микросекундами: строки сравниваются в хронологическом порядке
+    и не требуют кодирования в адресе
+    """
+    return value.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def parse_since(value):
+    """
+    Время из ?since= или Last-Event-ID, None для неверного значения
+    """
+    try:
+        parsed = parse_datetime(value.strip())
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def order_event(order_id, state, updated_at):
+    return {'id': order_id, 'state': state, 'updated_at': format_timestamp(updated_at)}
+
+
+class LocalOrderEvents:
+    """
+    Подписчики в памяти процесса: событие доходит только до потоков, открытых в этом же процессе
+    """
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        # Публикация идёт из потока обработки запроса, очереди живут в цикле событий потока order/events
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # Цикл событий уже закрыт, подписка будет снята при выходе из subscribe()
+                pass
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """
+        Очередь событий покупателя; вызывается из работающего цикла событий
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(user_id)
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def subscribers(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class CacheOrderEvents(LocalOrderEvents):
+    """
+    События через общий кеш (Redis, Memcached): у покупателя счётчик событий и по ключу на событие.
+    Каждый открытый поток раз в poll_interval секунд проверяет счётчик и забирает новые события
+    """
+
+    def __init__(self, cache='default', poll_interval=1.0, ttl=300, **options):
+        super().__init__(**options)
+        self.cache_alias = cache
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, user_id):
+        return f'order-events:{user_id}'
+
+    def publish(self, user_id, event):
+        key = self._key(user_id)
+        self.cache.add(key, 0, self.ttl)
+        try:
+            number = self.cache.incr(key)
+        except ValueError:
+            # Счётчик вытеснен из кеша между add и incr
+            self.cache.set(key, 1, self.ttl)
+            number = 1
+        self.cache.set(f'{key}:{number}', event, self.ttl)
+        self.cache.touch(key, self.ttl)
+
+    async def _poll(self, user_id, queue):
+        key = self._key(user_id)
+        last = await self.cache.aget(key, 0)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = await self.cache.aget(key, 0)
+            if current > last:
+                keys = [f'{key}:{number}' for number in range(last + 1, current + 1)]
+                found = await self.cache.aget_many(keys)
+                for event_key in keys:
+                    if event_key in found:
+                        queue.put_nowait(found[event_key])
+            last = current
+
+    @contextmanager
+    def subscribe(self, user_id):
+        with super().subscribe(user_id) as queue:
+            task = asyncio.get_running_loop().create_task(self._poll(user_id, queue))
+            try:
+                yield queue
+            finally:
+                task.cancel()
+
+
+_order_events = None
+
+
+def get_order_events():
+    global _order_events
+    if _order_events is None:
+        options = settings.ORDER_EVENTS
+        _order_events = import_string(options['BACKEND'])(**options.get('OPTIONS', {}))
+    return _order_events
+
+
+@receiver(setting_changed)
+def reset_order_events(setting, **kwargs):
+    global _order_events
+    if setting == 'ORDER_EVENTS':
+        _order_events = None
+
+
+def publish_order_change(user_id, order_id, state, updated_at):
+    """
+    Публикует новое состояние заказа после фиксации текущей транзакции
+    """
+    event = order_event(order_id, state, updated_at)
+    transaction.on_commit(lambda: get_order_events().publish(user_id, event))
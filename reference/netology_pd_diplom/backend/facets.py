@@ -0,0 +1,127 @@
+import re
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from rest_framework.filters import BaseFilterBackend
+
+from backend.models import CatalogEntry, CategoryFacet, ProductParameter
+
+PARAMETER_FILTER_RE = re.compile(r'^param_(\d+)$')
+FACETS_QUERY_PARAM = 'facets'
+# Параметры запроса, не сужающие выборку
+NON_FILTER_PARAMS = {'page', 'cursor', 'pagination', 'ordering', 'format', FACETS_QUERY_PARAM}
+
+
+def get_parameter_filters(query_params):
+    """
+    Фильтры вида param_<id>=значение; несколько значений одного параметра объединяются через ИЛИ
+    """
+    filters = {}
+    for key in query_params:
+        match = PARAMETER_FILTER_RE.match(key)
+        if match:
+            values = [value for value in query_params.getlist(key) if value != '']
+            if values:
+                filters[int(match.group(1))] = values
+    return filters
+
+
+def apply_parameter_filters(queryset, filters):
+    for parameter_id, values in filters.items():
+        queryset = queryset.filter(product_info_id__in=ProductParameter.objects.filter(
+            parameter_id=parameter_id, value__in=values
+        ).values('product_info_id'))
+    return queryset
+
+
+class ParameterFilterBackend(BaseFilterBackend):
+    """
+    Фильтрация каталога по значениям параметров товаров
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        return apply_parameter_filters(queryset, get_parameter_filters(request.query_params))
+
+
+def facets_requested(request):
+    return request.query_params.get(FACETS_QUERY_PARAM, '').lower() in ('1', 'true', 'yes')
+
+
+def _group(rows):
+    facets = {}
+    for parameter_id, name, value, count in rows:
+        facet = facets.setdefault(parameter_id, {'id': parameter_id, 'name': name, 'values': []})
+        facet['values'].append({'value': value, 'count': count})
+    limit = settings.FACET_VALUES_LIMIT
+    for facet in facets.values():
+        facet['values'].sort(key=lambda item: (-item['count'], item['value']))
+        del facet['values'][limit:]
+    return facets
+
+
+def _live_counts(queryset, parameter_id=None):
+    parameters = ProductParameter.objects.filter(product_info_id__in=queryset.values('product_info_id'))
+    if parameter_id is not None:
+        parameters = parameters.filter(parameter_id=parameter_id)
+    return parameters.values_list('parameter_id', 'parameter__name', 'value').annotate(count=Count('id'))
+
+
+def _precomputed_counts(category_id):
+    facets = CategoryFacet.objects.all()
+    if category_id is not None:
+        return facets.filter(category_id=category_id).values_list('parameter_id', 'parameter_name', 'value', 'count')
+    return facets.values_list('parameter_id', 'parameter_name', 'value').annotate(total=Sum('count'))
+
+
+def compute_facets(request, queryset):
+    """
+    Количество предложений по значениям параметров в пределах текущего фильтра.
+
+    queryset должен быть отфильтрован всем, кроме параметров. Для выбранного параметра
+    его собственный фильтр не учитывается, чтобы клиент видел альтернативные значения.
+    Если сужение только по категории, используется предрасчитанная сводка CategoryFacet.
+    """
+    filters = get_parameter_filters(request.query_params)
+    narrowing = {
+        key for key in request.query_params
+        if key not in NON_FILTER_PARAMS and not PARAMETER_FILTER_RE.match(key)
+    }
+    if not filters and narrowing <= {'product__category'}:
+        category = request.query_params.get('product__category')
+        category_id = int(category) if category and category.isdigit() else None
+        facets = _group(_precomputed_counts(category_id))
+    else:
+        facets = _group(_live_counts(apply_parameter_filters(queryset, filters)))
+        for parameter_id in filters:
+            others = {key: values for key, values in filters.items() if key != parameter_id}
+            facets.update(_group(_live_counts(apply_parameter_filters(queryset, others), parameter_id)))
+    return sorted(facets.values(), key=lambda facet: facet['id'])
+
+
+def rebuild_category_facets(category_ids):
+    """
+    Пересчитывает сводку значений параметров для категорий
+    """
+    category_ids = list(category_ids)
+    if not category_ids:
+        return
+    CategoryFacet.objects.filter(category_id__in=category_ids).delete()
+    rows = ProductParameter.objects.filter(
+        product_info__catalog_entry__category_id__in=category_ids
+    ).values_list(
+        'product_info__catalog_entry__category_id', 'parameter_id', 'parameter__name', 'value'
+    ).annotate(count=Count('id')).order_by()
+    CategoryFacet.objects.bulk_create(
+        [
+            CategoryFacet(category_id=category_id, parameter_id=parameter_id,
+                          parameter_name=name, value=value, count=count)
+            for category_id, parameter_id, name, value, count in rows
+        ],
+        batch_size=5000,
+    )
+
+
+def rebuild_all_facets():
+    category_ids = CatalogEntry.objects.values_list('category_id', flat=True).distinct().order_by()
+    CategoryFacet.objects.all().delete()
+    rebuild_category_facets(set(category_ids))
@@ -0,0 +1,111 @@
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.parsers import PriceListError, detect_format
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+CONTENT_TYPES = {
+    'application/json': 'json',
+    'text/json': 'json',
+    'application/yaml': 'yaml',
+    'application/x-yaml': 'yaml',
+    'text/yaml': 'yaml',
+    'text/x-yaml': 'yaml',
+}
+
+_session = None
+
+
+def get_session():
+    """
+    Общая HTTP-сессия с пулом соединений и повторами при сетевых сбоях
+    """
+    global _session
+    if _session is None:
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+@dataclass
+class FetchedPriceList:
+    stream: object
+    format: str
+    etag: str
+    last_modified: str
+    content_hash: str
+
+    @property
+    def not_modified(self):
+        return self.stream is None
+
+
+def _response_format(url, response):
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    return CONTENT_TYPES.get(content_type) or detect_format(urlparse(url).path)
+
+
+def fetch_price_list(source):
+    """
+    Скачивает прайс-лист источника.
+
+    Отправляет условный запрос по сохранённым ETag/Last-Modified. Если сервер ответил 304,
+    возвращает None; если содержимое совпало по хешу, возвращает результат без потока
+    (not_modified), чтобы сохранить новые заголовки валидации.
+
+    Тело ответа не накапливается в памяти, а пишется во временный файл, из которого
+    затем читает парсер.
+    """
+    headers = {}
+    if source.etag:
+        headers['If-None-Match'] = source.etag
+    if source.last_modified:
+        headers['If-Modified-Since'] = source.last_modified
+
+    with get_session().get(source.url, headers=headers, stream=True,
+                           timeout=settings.PRICE_LIST_FETCH_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        fmt = _response_format(source.url, response)
+        if fmt is None:
+            raise PriceListError('Не удалось определить формат прайс-листа')
+
+        digest = hashlib.sha256()
+        stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        size = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            if size > settings.PRICE_LIST_MAX_SIZE:
+                stream.close()
+                raise PriceListError('Прайс-лист превышает допустимый размер')
+            digest.update(chunk)
+            stream.write(chunk)
+
+        fetched = FetchedPriceList(
+            stream=stream,
+            format=fmt,
+            etag=response.headers.get('ETag', ''),
+            last_modified=response.headers.get('Last-Modified', ''),
+            content_hash=digest.hexdigest(),
+        )
+
+    if fetched.content_hash == source.content_hash:
+        stream.close()
+        fetched.stream = None
+    else:
+        stream.seek(0)
+    return fetched
@@ -0,0 +1,15 @@
+import django_filters
+
+from backend.models import CatalogEntry
+
+
+class CatalogEntryFilter(django_filters.FilterSet):
+    """
+    Фильтры каталога с прежними именами параметров ProductInfoView
+    """
+    shop = django_filters.NumberFilter(field_name='shop_id')
+    product__category = django_filters.NumberFilter(field_name='category_id')
+
+    class Meta:
+        model = CatalogEntry
+        fields = ['shop', 'product__category']
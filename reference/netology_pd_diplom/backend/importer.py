@@ -0,0 +1,315 @@
+from dataclasses import dataclass
+from itertools import islice
+
+from django.db import transaction
+
+from backend.catalog import bump_catalog_version, refresh_catalog_entries
+from backend.facets import rebuild_category_facets
+from backend.models import CatalogEntry, Category, OrderItem, Parameter, Product, ProductInfo, ProductParameter, Shop
+from backend.parsers import PriceListError, iter_price_list
+from backend.search import get_search_backend
+
+
+def chunked(iterable, size):
+    """
+    Разбивает итерируемый объект на списки длиной не более size
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@dataclass
+class ImportResult:
+    """
+    Итоги импорта прайс-листа
+    """
+    created: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    processed: int = 0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'removed': self.removed,
+            'unchanged': self.unchanged,
+            'processed': self.processed,
+        }
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа магазина с вычислением разницы относительно текущих предложений.
+
+    Существующие предложения магазина загружаются в память один раз, товары и параметры
+    разрешаются пачками, а изменения применяются через bulk_create/bulk_update,
+    поэтому число запросов растёт с количеством пачек, а не строк.
+    """
+
+    OFFER_FIELDS = ('quantity', 'price', 'price_rrc')
+
+    def __init__(self, shop, batch_size=1000, progress=None):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.progress = progress
+        self.result = ImportResult()
+        self._parameters = {}
+        self._offers = {}
+        self._seen = set()
+        self._search = get_search_backend()
+        self._facet_categories = set()
+
+    def run(self, categories, goods):
+        """
+        Выполняет импорт в одной транзакции и возвращает ImportResult
+        """
+        with transaction.atomic():
+            self.import_categories(categories)
+            self._load_offers()
+            for batch in chunked(goods, self.batch_size):
+                self.import_goods(batch)
+            self.finish()
+        return self.result
+
+    def run_stream(self, entries):
+        """
+        Выполняет импорт из потока пар (раздел, запись), не накапливая позиции
+        сверх одной пачки
+        """
+        with transaction.atomic():
+            self._load_offers()
+            categories, batch = [], []
+            for section, entry in entries:
+                if section == 'categories':
+                    categories.append(entry)
+                elif section == 'goods':
+                    if categories:
+                        self.import_categories(categories)
+                        categories = []
+                    batch.append(entry)
+                    if len(batch) >= self.batch_size:
+                        self.import_goods(batch)
+                        batch = []
+            self.import_categories(categories)
+            if batch:
+                self.import_goods(batch)
+            self.finish()
+        return self.result
+
+    def import_categories(self, categories):
+        categories = {int(item['id']): item['name'] for item in categories}
+        if not categories:
+            return
+
+        existing = Category.objects.in_bulk(list(categories))
+        to_create, to_update = [], []
+        for category_id, name in categories.items():
+            category = existing.get(category_id)
+            if category is None:
+                to_create.append(Category(id=category_id, name=name))
+            elif category.name != name:
+                category.name = name
+                to_update.append(category)
+
+        Category.objects.bulk_create(to_create, batch_size=self.batch_size)
+        Category.objects.bulk_update(to_update, ['name'], batch_size=self.batch_size)
+        for category in to_update:
+            CatalogEntry.objects.filter(category=category).update(category_name=category.name)
+        self.shop.categories.add(*categories)
+
+    def _load_offers(self):
+        rows = ProductInfo.objects.filter(shop=self.shop).values_list(
+            'id', 'product_id', 'model', *self.OFFER_FIELDS
+        )
+        for offer_id, product_id, model, *values in rows:
+            self._offers[(product_id, model)] = (offer_id, tuple(values))
+
+    def _resolve_products(self, batch):
+        keys = {(item['name'], int(item['category'])) for item in batch}
+        names = {name for name, _ in keys}
+        category_ids = {category_id for _, category_id in keys}
+
+        products = {
+            (name, category_id): product_id
+            for product_id, name, category_id in Product.objects.filter(
+                name__in=names, category_id__in=category_ids
+            ).values_list('id', 'name', 'category_id')
+        }
+
+        missing = [
+            Product(name=name, category_id=category_id)
+            for name, category_id in keys if (name, category_id) not in products
+        ]
+        if missing:
+            Product.objects.bulk_create(missing, batch_size=self.batch_size)
+            for product in missing:
+                products[(product.name, product.category_id)] = product.pk
+        return products
+
+    def _resolve_parameters(self, batch):
+        names = {name for item in batch for name in item.get('parameters', {})}
+        names -= self._parameters.keys()
+        if not names:
+            return
+
+        self._parameters.update(
+            Parameter.objects.filter(name__in=names).values_list('name', 'id')
+        )
+        missing = [Parameter(name=name) for name in names if name not in self._parameters]
+        if missing:
+            Parameter.objects.bulk_create(missing, batch_size=self.batch_size)
+            self._parameters.update((parameter.name, parameter.pk) for parameter in missing)
+
+    def import_goods(self, batch):
+        """
+        Применяет одну пачку позиций прайс-листа
+        """
+        products = self._resolve_products(batch)
+        self._resolve_parameters(batch)
+
+        # Повторяющиеся позиции внутри файла: побеждает последняя
+        offers = {}
+        for item in batch:
+            key = (products[(item['name'], int(item['category']))], item.get('model', ''))
+            offers[key] = item
+
+        to_create, to_update, parameters = [], [], {}
+        for (product_id, model), item in offers.items():
+            values = tuple(item.get(field, 0) for field in self.OFFER_FIELDS)
+            parameters[(product_id, model)] = {
+                self._parameters[name]: str(value)
+                for name, value in item.get('parameters', {}).items()
+            }
+
+            existing = self._offers.get((product_id, model))
+            if existing is None:
+                to_create.append(ProductInfo(
+                    product_id=product_id, shop=self.shop, model=model,
+                    **dict(zip(self.OFFER_FIELDS, values))
+                ))
+                continue
+
+            offer_id, current = existing
+            self._seen.add(offer_id)
+            if current != values:
+                to_update.append(ProductInfo(
+                    id=offer_id, **dict(zip(self.OFFER_FIELDS, values))
+                ))
+                self._offers[(product_id, model)] = (offer_id, values)
+                self.result.updated += 1
+            else:
+                self.result.unchanged += 1
+
+        ProductInfo.objects.bulk_update(to_update, self.OFFER_FIELDS, batch_size=self.batch_size)
+        if to_create:
+            ProductInfo.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if any(offer.pk is None for offer in to_create):
+                self._reload_created(to_create)
+            for offer in to_create:
+                key = (offer.product_id, offer.model)
+                self._offers[key] = (offer.pk, tuple(getattr(offer, f) for f in self.OFFER_FIELDS))
+                self._seen.add(offer.pk)
+            self.result.created += len(to_create)
+
+        refresh_catalog_entries([offer.pk for offer in to_update + to_create])
+        touched = self._sync_parameters(parameters)
+        self._search.index({self._offers[key][0] for key in touched} | {offer.pk for offer in to_create})
+        self._facet_categories.update(int(offers[key]['category']) for key in touched)
+        self.result.processed += len(batch)
+        if self.progress is not None:
+            self.progress(self.result)
+
+    def _reload_created(self, offers):
+        """
+        Восстанавливает первичные ключи для СУБД без RETURNING в bulk_create
+        """
+        ids = {
+            (product_id, model): offer_id
+            for offer_id, product_id, model in ProductInfo.objects.filter(
+                shop=self.shop, product_id__in={offer.product_id for offer in offers}
+            ).values_list('id', 'product_id', 'model')
+        }
+        for offer in offers:
+            offer.pk = ids[(offer.product_id, offer.model)]
+
+    def _sync_parameters(self, parameters):
+        offer_ids = {key: self._offers[key][0] for key in parameters}
+
+        current = {}
+        for offer_id, parameter_id, value in ProductParameter.objects.filter(
+            product_info_id__in=offer_ids.values()
+        ).values_list('product_info_id', 'parameter_id', 'value'):
+            current.setdefault(offer_id, {})[parameter_id] = value
+
+        changed, touched, to_create = [], set(), []
+        for key, values in parameters.items():
+            offer_id = offer_ids[key]
+            if current.get(offer_id, {}) == values:
+                continue
+            touched.add(key)
+            if offer_id in current:
+                changed.append(offer_id)
+            to_create.extend(
+                ProductParameter(product_info_id=offer_id, parameter_id=parameter_id, value=value)
+                for parameter_id, value in values.items()
+            )
+
+        if changed:
+            ProductParameter.objects.filter(product_info_id__in=changed).delete()
+        ProductParameter.objects.bulk_create(to_create, batch_size=self.batch_size)
+        return touched
+
+    def finish(self):
+        """
+        Завершает импорт: удаляет пропавшие предложения, пересчитывает сводку параметров
+        затронутых категорий и сбрасывает кеш каталога после фиксации транзакции
+        """
+        self.remove_missing()
+        rebuild_category_facets(self._facet_categories)
+        if self.result.created or self.result.updated or self.result.removed or self._facet_categories:
+            shop_id = self.shop.id
+            transaction.on_commit(lambda: bump_catalog_version([shop_id]))
+
+    def remove_missing(self):
+        """
+        Удаляет предложения магазина, отсутствующие в новом прайс-листе
+        """
+        missing = [offer_id for offer_id, _ in self._offers.values() if offer_id not in self._seen]
+        for chunk in chunked(missing, self.batch_size):
+            self._facet_categories.update(
+                CatalogEntry.objects.filter(product_info_id__in=chunk).values_list('category_id', flat=True).distinct()
+            )
+            # Из корзин пропавшие предложения убираются, оформленные заказы хранят снимок позиции
+            OrderItem.objects.filter(product_info_id__in=chunk, order__state='basket').delete()
+            # Строки поискового индекса убирает сигнал post_delete
+            ProductInfo.objects.filter(id__in=chunk).delete()
+        self.result.removed = len(missing)
+
+
+def import_price_list(user, data, batch_size=1000):
+    """
+    Импортирует разобранный прайс-лист от имени пользователя-магазина
+    """
+    shop, _ = Shop.objects.get_or_create(name=data['shop'], user=user)
+    importer = PriceListImporter(shop, batch_size=batch_size)
+    return importer.run(data.get('categories', []), data.get('goods', []))
+
+
+def import_price_list_stream(user, stream, fmt, batch_size=1000, progress=None):
+    """
+    Потоково импортирует прайс-лист из файла: имя магазина должно идти первым ключом
+    """
+    entries = iter_price_list(stream, fmt)
+    section, name = next(entries, (None, None))
+    if section != 'shop':
+        raise PriceListError('Прайс-лист должен начинаться с ключа shop')
+
+    shop, _ = Shop.objects.get_or_create(name=name, user=user)
+    importer = PriceListImporter(shop, batch_size=batch_size, progress=progress)
+    return importer.run_stream(entries)
@@ -0,0 +1,137 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.models import OutgoingEmail
+
+
+def _send_after_commit():
+    from backend.tasks import send_queued_emails_task  # задачи импортируют этот модуль
+
+    send_queued_emails_task.delay()
+
+
+def _schedule_send():
+    """
+    Одна задача отправки на транзакцию, сколько бы писем в ней ни было. Отправка уже запланирована,
+    если она есть среди функций on_commit соединения; при откате точки сохранения или транзакции
+    Django убирает её оттуда, и следующее письмо запланирует отправку заново
+    """
+    connection = transaction.get_connection()
+    if any(func is _send_after_commit for _, func, _ in connection.run_on_commit):
+        return
+    transaction.on_commit(_send_after_commit)
+
+
+def queue_email(subject, body, to, from_email=None, dedup_key=None):
+    """
+    Ставит письмо в очередь; отправка запускается задачей Celery после фиксации транзакции.
+    Без брокера (задачи выполняются сразу) задача отправляет письма в том же процессе после фиксации,
+    до ответа на запрос; ошибка SMTP не ломает ответ, письмо повторит периодический запуск
+    """
+    fields = {
+        'subject': subject,
+        'body': body,
+        'to': list(to),
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+    }
+    if dedup_key:
+        email, created = OutgoingEmail.objects.get_or_create(dedup_key=dedup_key, defaults=fields)
+        if not created:
+            return email
+    else:
+        email = OutgoingEmail.objects.create(**fields)
+    _schedule_send()
+    return email
+
+
+def retry_delay(attempts):
+    """
+    Экспоненциальная задержка перед следующей попыткой
+    """
+    return timedelta(seconds=min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), 60 * 60))
+
+
+def claim_due_emails(batch_size):
+    """
+    Помечает пачку писем, готовых к отправке, как занятую этим обработчиком.
+    Зависшие в отправке дольше EMAIL_OUTBOX_CLAIM_TIMEOUT письма забираются снова
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+    due = (
+        Q(status=OutgoingEmail.PENDING, next_attempt_at__lte=now)
+        | Q(status=OutgoingEmail.SENDING, claimed_at__lt=stale)
+    )
+    ids = list(OutgoingEmail.objects.filter(due).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    # Условие повторяется в UPDATE, чтобы параллельный обработчик не взял те же письма
+    OutgoingEmail.objects.filter(due, id__in=ids).update(status=OutgoingEmail.SENDING, claim=claim, claimed_at=now)
+    return list(OutgoingEmail.objects.filter(claim=claim, status=OutgoingEmail.SENDING))
+
+
+def _fail(email, error, now):
+    email.attempts += 1
+    email.last_error = error
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutgoingEmail.FAILED
+    else:
+        email.status = OutgoingEmail.PENDING
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+
+def send_batch(emails):
+    """
+    Отправляет пачку писем через одно SMTP-соединение
+    """
+    now = timezone.now()
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            _fail(email, f'Ошибка соединения: {e}', now)
+    else:
+        try:
+            for email in emails:
+                message = EmailMultiAlternatives(
+                    email.subject, email.body, email.from_email, email.to, connection=connection
+                )
+                try:
+                    message.send()
+                except Exception as e:
+                    _fail(email, str(e), now)
+                else:
+                    email.status = OutgoingEmail.SENT
+                    email.attempts += 1
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+        finally:
+            connection.close()
+
+    OutgoingEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    )
+    return sum(1 for email in emails if email.status == OutgoingEmail.SENT)
+
+
+def send_queued_emails(batch_size=None, max_batches=None):
+    """
+    Отправляет письма из очереди, пока есть готовые к отправке
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    sent = batches = 0
+    while max_batches is None or batches < max_batches:
+        emails = claim_due_emails(batch_size)
+        if not emails:
+            break
+        sent += send_batch(emails)
+        batches += 1
+    return sent
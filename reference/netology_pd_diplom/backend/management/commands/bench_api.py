@@ -0,0 +1,80 @@
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from backend.benchmarks.api import (
+    api_scenarios, create_suppliers, import_scenario, load_baseline, regressions, run_scenario, save_baseline,
+    seed_buyers, write_price_lists,
+)
+from backend.benchmarks.catalog import benchmark_database
+from backend.benchmarks.measure import peak_rss_mb
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = ('Замеры API на синтетических данных: загрузка прайс-листов, каталог, корзина, заказы. '
+            'Задержка p50/p95, SQL-запросы на запрос, пиковая память; сравнение с сохранёнными замерами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', nargs='+', type=int, default=[1000, 10_000],
+                            help='Размеры каталога, предложений')
+        parser.add_argument('--shops', type=int, default=3)
+        parser.add_argument('--buyers', type=int, default=30)
+        parser.add_argument('--orders', type=int, default=10, help='Заказов в истории каждого покупателя')
+        parser.add_argument('--lines', type=int, default=10, help='Позиций в корзине и в заказе')
+        parser.add_argument('--repeat', type=int, default=20, help='Запросов на сценарий')
+        parser.add_argument('--cache', action='store_true', help='Не отключать кеш ответов каталога')
+        parser.add_argument('--baseline', help='Файл с прежними замерами для поиска регрессий')
+        parser.add_argument('--save-baseline', help='Сохранить замеры в файл')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимый рост p95, доля')
+
+    def handle(self, *args, **options):
+        if not settings.CELERY_TASK_ALWAYS_EAGER:
+            raise CommandError('Импорт должен выполняться в процессе: запустите без CELERY_BROKER_URL')
+        if options['buyers'] < 2:
+            raise CommandError('Нужно хотя бы два покупателя')
+
+        results = {}
+        self.stdout.write(
+            f'{"offers":>8} {"сценарий":>18} {"p50, мс":>9} {"p95, мс":>9} {"SQL":>5} {"пик, КБ":>9}'
+        )
+        for size in options['offers']:
+            with tempfile.TemporaryDirectory() as directory, benchmark_database(), override_settings(
+                MEDIA_ROOT=directory,
+                EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend',
+                **({} if options['cache'] else {'CACHES': NO_CACHE}),
+            ):
+                paths = write_price_lists(directory, size, options['shops'])
+                suppliers = create_suppliers(options['shops'])
+                scenario = import_scenario(suppliers, paths)
+                results[f'{size}:{scenario.name}'] = self.report(size, scenario, options['repeat'])
+
+                buyers = seed_buyers(options['buyers'], options['orders'], options['lines'])
+                for scenario in api_scenarios(buyers, options['lines']):
+                    results[f'{size}:{scenario.name}'] = self.report(size, scenario, options['repeat'])
+        self.stdout.write(f'Пиковая память процесса: {peak_rss_mb():.0f} МБ')
+
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results, {
+                key: options[key] for key in ('offers', 'shops', 'buyers', 'orders', 'lines', 'repeat', 'cache')
+            })
+            self.stdout.write(f'Замеры сохранены в {options["save_baseline"]}')
+        if options['baseline']:
+            found = regressions(results, load_baseline(options['baseline']), options['tolerance'])
+            if found:
+                raise CommandError('Регрессии относительно ' + options['baseline'] + ':\n' + '\n'.join(found))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def report(self, size, scenario, repeat):
+        try:
+            result = run_scenario(scenario, repeat)
+        except RuntimeError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            f'{size:>8} {scenario.name:>18} {result["p50_ms"]:>9.1f} {result["p95_ms"]:>9.1f} '
+            f'{result["queries"]:>5} {result["peak_kb"]:>9.0f}'
+        )
+        return result
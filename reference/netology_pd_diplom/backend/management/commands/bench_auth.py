@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from backend.authentication import (
+    CachedTokenAuthentication, SignedTokenAuthentication, issue_device_token, token_cache,
+)
+from backend.benchmarks.catalog import benchmark_database
+from backend.benchmarks.measure import summarize
+from backend.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает стоимость аутентификации запроса: Token в базе, кеш токенов, подписанные токены'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=100)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with benchmark_database():
+            users = [
+                User.objects.create_user(f'auth-{index}@example.com', 'password', is_active=True)
+                for index in range(options['users'])
+            ]
+            legacy = [Token.objects.create(user=user).key for user in users]
+            signed = [issue_device_token(user, 'bench')[0] for user in users]
+
+            cases = [
+                ('Token (база)', TokenAuthentication(), legacy, False),
+                ('Token + кеш', CachedTokenAuthentication(), legacy, True),
+                ('подписанный', SignedTokenAuthentication(), signed, True),
+                ('подписанный, холодный', SignedTokenAuthentication(), signed, False),
+            ]
+            self.stdout.write(f'{"способ":>24} {"мкс/запрос":>11} {"p95, мкс":>9} {"запросов к БД":>14}')
+            for name, authenticator, keys, warm in cases:
+                token_cache.clear()
+                latencies = []
+                with CaptureQueriesContext(connection) as queries:
+                    for index in range(options['requests']):
+                        if not warm:
+                            token_cache.clear()
+                        request = factory.get('/', HTTP_AUTHORIZATION=f'Token {keys[index % len(keys)]}')
+                        started = time.perf_counter()
+                        authenticator.authenticate(request)
+                        latencies.append(time.perf_counter() - started)
+                stats = summarize(latencies)
+                self.stdout.write(
+                    f'{name:>24} {stats["p50_ms"] * 1000:>11.1f} {stats["p95_ms"] * 1000:>9.1f} '
+                    f'{len(queries) / options["requests"]:>14.2f}'
+                )
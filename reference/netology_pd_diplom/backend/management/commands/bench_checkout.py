@@ -0,0 +1,109 @@
+import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend.benchmarks.catalog import benchmark_database, populate_catalog
+from backend.benchmarks.measure import summarize
+from backend.models import CatalogEntry, Contact, Order, OrderItem, ProductInfo, User
+from backend.views import OrderView
+
+
+def create_buyers(count, offer_ids, lines, seed=0):
+    """
+    Покупатели с корзинами из нескольких популярных предложений
+    """
+    rnd = random.Random(seed)
+    shops = dict(ProductInfo.objects.filter(id__in=offer_ids).values_list('id', 'shop_id'))
+    User.objects.bulk_create([
+        User(email=f'buyer-{index}@example.com', is_active=True, password='!')
+        for index in range(count)
+    ])
+    users = list(User.objects.filter(email__startswith='buyer-').order_by('id'))
+    Contact.objects.bulk_create([Contact(user=user, city='Москва', street='Ленина', phone='1') for user in users])
+    Order.objects.bulk_create([Order(user=user, state='basket') for user in users])
+    baskets = Order.objects.filter(state='basket', user__in=users)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=basket, product_info_id=offer_id, shop_id=shops[offer_id], quantity=rnd.randint(1, 3))
+        for basket in baskets
+        for offer_id in rnd.sample(offer_ids, lines)
+    ])
+    contacts = dict(Contact.objects.filter(user__in=users).values_list('user_id', 'id'))
+    return [(user, contacts[user.id]) for user in users]
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест оформления заказов: параллельные покупки популярных товаров без перепродажи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--buyers', type=int, default=500)
+        parser.add_argument('--offers', type=int, default=20, help='Число популярных предложений')
+        parser.add_argument('--stock', type=int, default=100, help='Начальный остаток каждого предложения')
+        parser.add_argument('--lines', type=int, default=3, help='Позиций в корзине')
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True), override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend'
+        ):
+            populate_catalog(options['offers'])
+            ProductInfo.objects.update(quantity=options['stock'])
+            CatalogEntry.objects.update(quantity=options['stock'])
+            offer_ids = list(ProductInfo.objects.values_list('id', flat=True))
+            buyers = create_buyers(options['buyers'], offer_ids, min(options['lines'], len(offer_ids)))
+
+            factory = APIRequestFactory()
+            view = OrderView.as_view()
+
+            def place(buyer):
+                user, contact_id = buyer
+                request = factory.post('/api/v1/order/', {'contact': contact_id}, format='json')
+                force_authenticate(request, user=user)
+                started = time.perf_counter()
+                try:
+                    response = view(request)
+                    return response.status_code, time.perf_counter() - started
+                finally:
+                    connection.close()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['threads']) as executor:
+                results = list(executor.map(place, buyers))
+            elapsed = time.perf_counter() - started
+
+            statuses = Counter(code for code, _ in results)
+            stats = summarize([latency for _, latency in results])
+            self.stdout.write(
+                f'Оформлений: {len(results)} за {elapsed:.2f} с ({len(results) / elapsed:.0f}/с), '
+                f'потоков: {options["threads"]}'
+            )
+            self.stdout.write(f'Ответы: {dict(sorted(statuses.items()))}')
+            self.stdout.write(
+                f'Задержка, мс: p50 {stats["p50_ms"]:.1f}, p95 {stats["p95_ms"]:.1f}, max {stats["max_ms"]:.1f}'
+            )
+            self.check_stock(options['stock'])
+
+    def check_stock(self, stock):
+        """
+        Остаток каждого предложения равен начальному за вычетом оформленных заказов
+        """
+        sold = defaultdict(int)
+        for offer_id, quantity in OrderItem.objects.filter(order__state=Order.NEW).values_list(
+            'product_info_id', 'quantity'
+        ):
+            sold[offer_id] += quantity
+        catalog = dict(CatalogEntry.objects.values_list('product_info_id', 'quantity'))
+        errors = []
+        for offer_id, quantity in ProductInfo.objects.values_list('id', 'quantity'):
+            if quantity < 0 or quantity != stock - sold[offer_id] or catalog[offer_id] != quantity:
+                errors.append(f'{offer_id}: остаток {quantity}, продано {sold[offer_id]}, в каталоге {catalog[offer_id]}')
+        if errors:
+            raise CommandError('Остатки не сходятся:\n' + '\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS(
+            f'Перепродаж нет: продано {sum(sold.values())} из {stock * len(catalog)} шт.'
+        ))
@@ -0,0 +1,159 @@
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.authentication import issue_device_token
+from backend.benchmarks.api import seed_buyers
+from backend.benchmarks.catalog import benchmark_database, populate_catalog
+from backend.benchmarks.load import run_load
+from backend.models import Category
+
+HOST = '127.0.0.1'
+
+# Команды запуска серверов: WSGI - gunicorn с потоками, ASGI - uvicorn с асинхронными представлениями
+SERVERS = {
+    'wsgi': ('gunicorn', lambda port, options: [
+        'netology_pd_diplom.wsgi:application', '--bind', f'{HOST}:{port}', '--worker-class', 'gthread',
+        '--workers', str(options['workers']), '--threads', str(options['threads']), '--log-level', 'warning',
+    ]),
+    'asgi': ('uvicorn', lambda port, options: [
+        'netology_pd_diplom.asgi:application', '--host', HOST, '--port', str(port),
+        '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+    ]),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'Сервер завершился с кодом {process.returncode}')
+        try:
+            with socket.create_connection((HOST, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'Сервер не начал принимать соединения за {timeout} с')
+
+
+@contextmanager
+def server(mode, options):
+    """
+    Сервер в отдельном процессе на временной базе замера
+    """
+    module, arguments = SERVERS[mode]
+    port = free_port()
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='netology_pd_diplom.settings',
+        DB_NAME=connection.settings_dict['NAME'],
+        ASYNC_VIEWS=str(mode == 'asgi'),
+        METRICS_SERVER_TIMING='False',
+    )
+    process = subprocess.Popen([sys.executable, '-m', module] + arguments(port, options),
+                               cwd=settings.BASE_DIR, env=env)
+    try:
+        wait_for(port, process)
+        yield port
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность и задержки под нагрузкой: WSGI (gunicorn, потоки) '
+            'против ASGI (uvicorn, асинхронные представления) на каталоге, корзине и заказах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=2000)
+        parser.add_argument('--buyers', type=int, default=50)
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 16, 64, 256],
+                            help='Одновременных соединений')
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на замер')
+        parser.add_argument('--checkouts', type=int, default=100,
+                            help='Оформлений заказа на замер (у каждого свой покупатель с корзиной)')
+        parser.add_argument('--workers', type=int, default=2, help='Процессов сервера')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков в процессе gunicorn')
+        parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['wsgi', 'asgi'])
+
+    def handle(self, *args, **options):
+        missing = [SERVERS[mode][0] for mode in options['modes'] if not importlib.util.find_spec(SERVERS[mode][0])]
+        if missing:
+            raise CommandError('Не установлены: ' + ', '.join(missing) + ' (pip install -r requirements.txt)')
+
+        with benchmark_database(on_disk=True):
+            populate_catalog(options['offers'], shops=2)
+            category = Category.objects.order_by('id').values_list('id', flat=True).first()
+            # Корзина оформляется один раз: для каждого оформления в замере отдельный покупатель
+            checkouts = len(options['modes']) * len(options['concurrency']) * options['checkouts']
+            buyers = seed_buyers(options['buyers'] + checkouts, 1, 5)
+            tokens = [issue_device_token(user)[0] for user, _ in buyers]
+            connection.close()
+            placing = iter([
+                ('/api/v1/order/', {'Authorization': 'Token ' + token}, {'contact': contact_id})
+                for token, (_, contact_id) in zip(tokens[options['buyers']:], buyers[options['buyers']:])
+            ])
+            tokens = tokens[:options['buyers']]
+
+            catalog = [
+                '/api/v1/products', f'/api/v1/products?product__category={category}',
+                '/api/v1/products?pagination=cursor&ordering=price', '/api/v1/categories/', '/api/v1/shops/',
+            ]
+            scenarios = [
+                ('catalog', lambda index: (catalog[index % len(catalog)], {}), options['requests'], True),
+                ('basket GET', lambda index: (
+                    '/api/v1/basket', {'Authorization': 'Token ' + tokens[index % len(tokens)]}
+                ), options['requests'], True),
+                ('order GET', lambda index: (
+                    '/api/v1/order/', {'Authorization': 'Token ' + tokens[index % len(tokens)]}
+                ), options['requests'], True),
+                # Без прогрева: он оформил бы корзины покупателей замера
+                ('order POST', lambda index: next(placing), options['checkouts'], False),
+            ]
+
+            self.stdout.write(
+                f'{"режим":>6} {"сценарий":>11} {"клиентов":>9} {"запр/с":>8} '
+                f'{"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9} {"ошибок":>7}'
+            )
+            results = {}
+            for mode in options['modes']:
+                with server(mode, options) as port:
+                    for name, requests, total, warm_up in scenarios:
+                        # Прогрев: кеш каталога и токенов в каждом процессе сервера
+                        if warm_up:
+                            run_load(HOST, port, requests, 4, 100 + len(tokens) * options['workers'] * 4)
+                        for concurrency in options['concurrency']:
+                            result = run_load(HOST, port, requests, concurrency, total)
+                            results[mode, name, concurrency] = result
+                            self.stdout.write(
+                                f'{mode:>6} {name:>11} {concurrency:>9} {result["rps"]:>8.0f} '
+                                f'{result["p50_ms"]:>9.1f} {result["p95_ms"]:>9.1f} {result["p99_ms"]:>9.1f} '
+                                f'{result["errors"]:>7}'
+                            )
+
+            if set(options['modes']) == set(SERVERS):
+                self.stdout.write('Отношение ASGI / WSGI:')
+                for name, *_ in scenarios:
+                    for concurrency in options['concurrency']:
+                        wsgi, asgi = results['wsgi', name, concurrency], results['asgi', name, concurrency]
+                        self.stdout.write(
+                            f'{name:>11} {concurrency:>9}: запр/с {asgi["rps"] / wsgi["rps"]:.2f}x, '
+                            f'p99 {asgi["p99_ms"] / wsgi["p99_ms"]:.2f}x'
+                        )
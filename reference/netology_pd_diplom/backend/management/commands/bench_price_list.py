@@ -0,0 +1,40 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from backend.benchmarks.generator import write_price_list
+from backend.benchmarks.measure import run_isolated
+from backend.benchmarks.price_list import parse_full, parse_streaming
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пиковую память и время разбора прайс-листа целиком и потоково'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--format', choices=['yaml', 'json'], default='yaml')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Не удалять сгенерированные файлы')
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        self.stdout.write(f'{"items":>10} {"size, MB":>9} {"mode":>10} {"time, s":>9} {"peak RSS, MB":>13}')
+        for size in options['sizes']:
+            fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+            os.close(fd)
+            try:
+                write_price_list(path, size, fmt)
+                file_mb = os.path.getsize(path) / (1024 * 1024)
+                for mode, target, args in (
+                    ('full', parse_full, (path, fmt)),
+                    ('streaming', parse_streaming, (path, fmt, options['batch_size'])),
+                ):
+                    measurement = run_isolated(target, *args)
+                    self.stdout.write(
+                        f'{size:>10} {file_mb:>9.1f} {mode:>10} '
+                        f'{measurement["seconds"]:>9.2f} {measurement["peak_rss_mb"]:>13.1f}'
+                    )
+            finally:
+                if not options['keep']:
+                    os.remove(path)
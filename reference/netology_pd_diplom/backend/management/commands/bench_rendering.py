@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from backend.benchmarks.catalog import benchmark_database, populate_catalog
+from backend.models import CatalogEntry, Category
+from backend.renderers import UJSONRenderer
+from backend.serializers import (
+    CatalogEntrySerializer, CatalogEntryValuesSerializer, CategorySerializer, CategoryValuesSerializer,
+)
+from backend.views import CategoryView, ProductInfoView
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def cpu_per_call(func, repeat):
+    """
+    Процессорное время одного вызова в микросекундах (лучшее из трёх серий)
+    """
+    best = None
+    for _ in range(3):
+        started = time.process_time()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.process_time() - started) / repeat * 1_000_000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Процессорное время на страницу каталога: ModelSerializer + JSONRenderer против values() + ujson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=40)
+        parser.add_argument('--repeat', type=int, default=500)
+
+    def handle(self, *args, **options):
+        size, repeat = options['page_size'], options['repeat']
+        with benchmark_database(), override_settings(CACHES=NO_CACHE):
+            populate_catalog(max(size * 5, 1000))
+            for index in range(size):
+                Category.objects.get_or_create(name=f'Категория {index}')
+
+            factory = APIRequestFactory()
+            pages = [
+                ('products', CatalogEntry.objects.order_by('product_info_id')[:size],
+                 CatalogEntrySerializer, CatalogEntryValuesSerializer, ProductInfoView),
+                ('categories', Category.objects.order_by('id')[:size],
+                 CategorySerializer, CategoryValuesSerializer, CategoryView),
+            ]
+            self.stdout.write(f'{"страница":>11} {"этап":>14} {"DRF, мкс":>10} {"values, мкс":>12} {"ускорение":>10}')
+            for name, queryset, serializer_class, values_class, view in pages:
+                objects = list(queryset)
+                rows = list(values_class.prepare(queryset))
+                data = serializer_class(objects, many=True).data
+                assert values_class(rows).data == data, 'вывод values() отличается от ModelSerializer'
+                assert UJSONRenderer().render(data) == JSONRenderer().render(data), 'вывод ujson отличается'
+
+                legacy = type('Legacy', (view,), {
+                    'values_serializer_class': None, 'renderer_classes': [JSONRenderer],
+                }).as_view()
+                fast = view.as_view()
+
+                def request(view_func):
+                    response = view_func(factory.get('/'))
+                    response.render()
+
+                stages = [
+                    ('сериализация', lambda: serializer_class(objects, many=True).data,
+                     lambda: values_class(rows).data),
+                    ('рендеринг', lambda: JSONRenderer().render(data), lambda: UJSONRenderer().render(data)),
+                    ('запрос целиком', lambda: request(legacy), lambda: request(fast)),
+                ]
+                for stage, slow_call, fast_call in stages:
+                    calls = repeat if stage != 'запрос целиком' else max(repeat // 10, 10)
+                    slow, quick = cpu_per_call(slow_call, calls), cpu_per_call(fast_call, calls)
+                    self.stdout.write(
+                        f'{name:>11} {stage:>14} {slow:>10.0f} {quick:>12.0f} {slow / quick:>9.1f}x'
+                    )
@@ -0,0 +1,69 @@
+import time
+
+from django.test import override_settings
+from django.core.management.base import BaseCommand
+from rest_framework.filters import SearchFilter
+from rest_framework.generics import ListAPIView
+from rest_framework.test import APIRequestFactory
+
+from backend.benchmarks.catalog import benchmark_database, populate_catalog
+from backend.benchmarks.measure import summarize
+from backend.models import CatalogEntry, ProductInfo
+from backend.serializers import ProductInfoSerializer
+from backend.views import ProductInfoView
+
+# Общие запросы совпадают с большой долей каталога, точные - с единицами предложений
+QUERIES = {
+    'broad': ['apple', 'samsung 512', 'товар', 'золотистый', 'xiao', 'sony черный'],
+    'selective': ['1000123', 'model-4321', '1004567 золотистый', 'товар 1002345', 'model-17 apple', '1009'],
+}
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class LikeSearchView(ListAPIView):
+    """
+    Прежняя реализация списка товаров: соединение таблиц и SearchFilter
+    """
+    queryset = ProductInfo.objects.select_related('product', 'shop', 'product__category').order_by('id')
+    serializer_class = ProductInfoSerializer
+    filter_backends = [SearchFilter]
+    search_fields = ['product__name']
+    permission_classes = []
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержку поиска товаров через индекс и через SearchFilter (LIKE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        views = {
+            'SearchFilter': LikeSearchView.as_view(),
+            'index': ProductInfoView.as_view(),
+        }
+
+        self.stdout.write(
+            f'{"offers":>9} {"queries":>10} {"mode":>13} {"p50, ms":>9} {"p95, ms":>9} {"max, ms":>9}'
+        )
+        for size in options['sizes']:
+            with benchmark_database(), override_settings(CACHES=NO_CACHE):
+                populate_catalog(size)
+                assert CatalogEntry.objects.count() == size
+                for group, queries in QUERIES.items():
+                    for mode, view in views.items():
+                        latencies = []
+                        for _ in range(options['repeat']):
+                            for query in queries:
+                                request = factory.get('/api/v1/products', {'search': query})
+                                started = time.perf_counter()
+                                response = view(request)
+                                response.render()
+                                latencies.append(time.perf_counter() - started)
+                        stats = summarize(latencies)
+                        self.stdout.write(
+                            f'{size:>9} {group:>10} {mode:>13} '
+                            f'{stats["p50_ms"]:>9.1f} {stats["p95_ms"]:>9.1f} {stats["max_ms"]:>9.1f}'
+                        )
@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import resolve
+from rest_framework.test import APIClient
+
+from backend.authentication import issue_device_token, revocation_list, token_cache
+from backend.benchmarks.catalog import benchmark_database, populate_catalog
+from backend.checkout import snapshot_orders
+from backend.metrics import QueryBudgetExceeded, collect_metrics
+from backend.models import CatalogEntry, Contact, Order, OrderItem, ProductInfo, Shop, User
+
+
+def seed(lines):
+    """
+    Покупатель с корзиной и оформленными заказами по lines позиций, поставщик первого магазина
+    """
+    shops = populate_catalog(max(lines * 4, 200), shops=2)
+    ProductInfo.objects.update(quantity=100)
+    CatalogEntry.objects.update(quantity=100)
+    offers = list(ProductInfo.objects.values_list('id', 'shop_id')[:lines * 3])
+    buyer = User.objects.create(email='budget-buyer@example.com', is_active=True)
+    contact = Contact.objects.create(user=buyer, city='Москва', street='Ленина', phone='1')
+    for state, chunk in (('basket', offers[:lines]), ('new', offers[lines:lines * 2]), ('new', offers[lines * 2:])):
+        order = Order.objects.create(user=buyer, state=state, contact=None if state == 'basket' else contact)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_info_id=offer_id, shop_id=shop_id, quantity=1) for offer_id, shop_id in chunk
+        ])
+    snapshot_orders(Order.objects.filter(user=buyer).exclude(state='basket'))
+    return buyer, shops[0].user, contact, offers
+
+
+def requests(buyer, partner, contact, offers):
+    """
+    Запросы к маршрутам с бюджетом: (пользователь, метод, адрес, тело). Каталог тоже
+    запрашивается с токеном: аутентификация выполняется и на открытых маршрутах
+    """
+    category = ProductInfo.objects.values_list('product__category_id', flat=True).first()
+    return [
+        (buyer, 'get', '/api/v1/products', None),
+        (buyer, 'get', f'/api/v1/products?product__category={category}', None),
+        (buyer, 'get', '/api/v1/products?pagination=cursor&ordering=price', None),
+        (buyer, 'get', f'/api/v1/products?product__category={category}&facets=1', None),
+        (buyer, 'get', '/api/v1/categories/', None),
+        (buyer, 'get', '/api/v1/shops/', None),
+        (buyer, 'get', '/api/v1/basket', None),
+        (buyer, 'post', '/api/v1/basket', {'items': [{'product_info': offer_id, 'quantity': 1} for offer_id, _ in offers]}),
+        (buyer, 'delete', '/api/v1/basket', {'items': [offer_id for offer_id, _ in offers[-3:]]}),
+        (buyer, 'get', '/api/v1/order/', None),
+        (buyer, 'get', '/api/v1/user/contact/', None),
+        (partner, 'get', '/api/v1/partner/orders', None),
+        (buyer, 'post', '/api/v1/order/', {'contact': contact.id}),
+        # Корзина оформлена, просмотр создаёт новую
+        (buyer, 'get', '/api/v1/basket', None),
+    ]
+
+
+def authenticate(client, user, tokens):
+    """
+    Настоящая аутентификация подписанным токеном устройства на пустом кеше токенов и с устаревшим
+    списком отзыва - худший случай, его запросы входят в бюджет. tokens - выданные токены по id пользователя
+    """
+    if user.pk not in tokens:
+        tokens[user.pk], _ = issue_device_token(user)
+    token_cache.clear()
+    revocation_list.reset()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {tokens[user.pk]}')
+
+
+class Command(BaseCommand):
+    help = 'Проверяет бюджеты SQL-запросов QUERY_BUDGETS на временной базе с заполненными данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=20, help='Позиций в корзине и в каждом заказе')
+
+    def handle(self, *args, **options):
+        failures = []
+        with benchmark_database(), override_settings(
+            METRICS_ENFORCE_QUERY_BUDGETS=True,
+            EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend',
+        ):
+            buyer, partner, contact, offers = seed(options['lines'])
+            Shop.objects.update(state=True)
+            client, tokens = APIClient(), {}
+            for user, method, url, data in requests(buyer, partner, contact, offers):
+                authenticate(client, user, tokens)
+                route = resolve(url.split('?')[0]).view_name
+                try:
+                    with collect_metrics() as metrics:
+                        response = getattr(client, method)(url, data, format='json')
+                except QueryBudgetExceeded as error:
+                    failures.append(str(error))
+                    self.stdout.write(f'FAIL {method.upper()} {url}: {error}')
+                    continue
+                ok = response.status_code < 400
+                if not ok:
+                    failures.append(f'{method.upper()} {url}: ответ {response.status_code}')
+                self.stdout.write(
+                    f'{"OK  " if ok else "FAIL"} {method.upper()} {url} ({route}): '
+                    f'{metrics.queries} запросов, ответ {response.status_code}'
+                )
+        if failures:
+            raise CommandError('Бюджеты запросов превышены:\n' + '\n'.join(failures))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from backend.benchmarks.catalog import benchmark_database
+from backend.models import (
+    CatalogEntry, Order, OrderItem, OutgoingEmail, Product, ProductInfo, ProductParameter,
+)
+
+
+def hot_queries():
+    """
+    Частые запросы и индекс, которым каждый из них должен пользоваться
+    """
+    return [
+        ('корзина пользователя', Order.objects.filter(user_id=1, state='basket'), 'order_user_state_idx'),
+        ('история заказов', Order.objects.filter(user_id=1).exclude(state='basket').order_by('-dt')[:20], 'order_user_dt_idx'),
+        ('товар при импорте', Product.objects.filter(name='Смартфон', category_id=1), 'product_name_category_idx'),
+        ('позиции поставщика', OrderItem.objects.filter(shop_id=1).values('order'), 'order_item_shop_idx'),
+        ('каталог по категории', CatalogEntry.objects.filter(category_id=1).order_by('product_info_id')[:20],
+         'catalog_category_idx'),
+        ('каталог по цене', CatalogEntry.objects.order_by('price', 'product_info_id')[:20], 'catalog_price_idx'),
+        ('фильтр по параметру', ProductParameter.objects.filter(parameter_id=1, value='черный').values('product_info_id'),
+         'product_parameter_value_idx'),
+        ('очередь писем', OutgoingEmail.objects.filter(status='pending', next_attempt_at__lte=timezone.now()),
+         'outgoing_email_due_idx'),
+        ('предложения магазина', ProductInfo.objects.filter(shop_id=1), 'backend_productinfo_shop_id'),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Проверяет через EXPLAIN, что частые запросы используют индексы (на временной базе из миграций)'
+
+    def handle(self, *args, **options):
+        failures = []
+        with benchmark_database():
+            if connection.vendor == 'postgresql':
+                # На пустых таблицах PostgreSQL предпочитает последовательное чтение
+                with connection.cursor() as cursor:
+                    cursor.execute('SET enable_seqscan = off')
+            for name, queryset, index in hot_queries():
+                plan = queryset.explain()
+                ok = index in plan
+                self.stdout.write(f'{"OK  " if ok else "FAIL"} {name}: {index}')
+                if not ok:
+                    failures.append(f'{name}: ожидался {index}\n{plan}')
+        if failures:
+            raise CommandError('Запросы без ожидаемых индексов:\n' + '\n'.join(failures))
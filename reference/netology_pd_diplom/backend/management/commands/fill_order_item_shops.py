@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.checkout import fill_item_shops
+from backend.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Проставляет магазин позициям заказов, созданным до появления поля OrderItem.shop'
+
+    def handle(self, *args, **options):
+        updated = fill_item_shops(OrderItem.objects.filter(shop__isnull=True))
+        self.stdout.write(self.style.SUCCESS(f'Обновлено позиций: {updated}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from backend.catalog import rebuild_catalog
+from backend.facets import rebuild_all_facets
+from backend.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает денормализованный каталог товаров, поисковый индекс и сводку параметров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        total = rebuild_catalog(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Записей каталога: {total}'))
+        indexed = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано предложений: {indexed}'))
+        rebuild_all_facets()
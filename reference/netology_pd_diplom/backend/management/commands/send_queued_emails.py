@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = ('Отправляет письма из очереди OutgoingEmail. Нужна без брокера Celery для повторов неотправленных '
+            'писем, когда очередь не разбирает планировщик (например, из cron раз в минуту)')
+
+    def handle(self, *args, **options):
+        sent = send_queued_emails()
+        self.stdout.write(self.style.SUCCESS(f'Отправлено писем: {sent}'))
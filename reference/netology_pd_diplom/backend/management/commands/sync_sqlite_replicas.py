@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик DB_REPLICAS - замена репликации '
+            'для локальной проверки чтения с реплик')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Команда нужна только для SQLite, реплики PostgreSQL обновляет репликация')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не заданы: укажите пути к файлам в DB_REPLICAS')
+
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                connections[alias].close()
+                path = connections[alias].settings_dict['NAME']
+                # backup() копирует согласованный снимок и сам берёт блокировки файла реплики
+                target = sqlite3.connect(path)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'{alias}: {path}')
+        finally:
+            source.close()
@@ -0,0 +1,309 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import BaseRenderer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы времени ответа, сек.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Запрос к API выполнил больше SQL-запросов, чем разрешено бюджетом
+    """
+
+
+class RequestMetrics:
+    """
+    Замеры одного запроса: число SQL-запросов, время в базе и в сериализаторах
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self._serializing = False
+
+    def add_query(self, duration):
+        metrics = self
+        while metrics is not None:
+            metrics.queries += 1
+            metrics.db_time += duration
+            metrics = metrics.parent
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def current_metrics():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    execute_wrapper каждого соединения: учитывает запрос в замерах текущего контекста.
+    Контекст передаётся и в потоки sync_to_async, поэтому запросы асинхронных
+    представлений тоже учитываются
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def collect_metrics():
+    """
+    Считает SQL-запросы внутри блока, в том числе во вложенных замерах
+    """
+    # Соединения, открытые до импорта модуля, не получили сигнал connection_created
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(None, connection)
+    metrics = RequestMetrics(_current.get())
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(limit, label='блок'):
+    """
+    Для тестов и замеров: QueryBudgetExceeded, если внутри блока выполнено больше limit запросов
+    """
+    with collect_metrics() as metrics:
+        yield metrics
+    if metrics.queries > limit:
+        raise QueryBudgetExceeded(f'{label}: {metrics.queries} SQL-запросов при бюджете {limit}')
+
+
+def timed_serialization(func, *args):
+    """
+    Вызывает func с учётом времени как сериализации в замерах текущего запроса.
+    Вложенные вызовы входят во время внешнего
+    """
+    metrics = _current.get()
+    if metrics is None or metrics._serializing:
+        return func(*args)
+    metrics._serializing = True
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+        metrics._serializing = False
+
+
+class SerializerTimingMixin:
+    """
+    Учитывает время сериализации в замерах текущего запроса.
+    Вложенные сериализаторы и элементы списка входят во время внешнего
+    """
+
+    def to_representation(self, instance):
+        return timed_serialization(super().to_representation, instance)
+
+
+class MetricsRegistry:
+    """
+    Накопленные счётчики по маршрутам API в памяти процесса
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._routes = {}
+
+    def observe(self, route, method, status, metrics, elapsed):
+        with self._lock:
+            key = (route, method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            series = self._routes.get((route, method))
+            if series is None:
+                series = self._routes[(route, method)] = {
+                    'count': 0, 'duration': 0.0, 'queries': 0, 'db_time': 0.0, 'serializer_time': 0.0,
+                    'buckets': [0] * len(self.buckets),
+                }
+            series['count'] += 1
+            series['duration'] += elapsed
+            series['queries'] += metrics.queries
+            series['db_time'] += metrics.db_time
+            series['serializer_time'] += metrics.serializer_time
+            index = bisect.bisect_left(self.buckets, elapsed)
+            if index < len(self.buckets):
+                series['buckets'][index] += 1
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._routes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._requests), {
+                key: dict(series, buckets=list(series['buckets'])) for key, series in self._routes.items()
+            }
+
+
+registry = MetricsRegistry()
+
+
+def _labels(**labels):
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels.items()
+    ) + '}'
+
+
+def render_prometheus(extra=None):
+    """
+    Счётчики в текстовом формате Prometheus. extra - список (имя, тип, описание, значение)
+    """
+    requests, routes = registry.snapshot()
+    lines = [
+        '# HELP api_requests_total Запросы к API по маршруту, методу и коду ответа',
+        '# TYPE api_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(requests.items()):
+        lines.append(f'api_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+    lines += [
+        '# HELP api_request_duration_seconds Время ответа',
+        '# TYPE api_request_duration_seconds histogram',
+    ]
+    for (route, method), series in sorted(routes.items()):
+        cumulative = 0
+        for bound, count in zip(registry.buckets, series['buckets']):
+            cumulative += count
+            lines.append(f'api_request_duration_seconds_bucket{_labels(route=route, method=method, le=bound)} {cumulative}')
+        lines.append(f'api_request_duration_seconds_bucket{_labels(route=route, method=method, le="+Inf")} {series["count"]}')
+        lines.append(f'api_request_duration_seconds_sum{_labels(route=route, method=method)} {series["duration"]:.6f}')
+        lines.append(f'api_request_duration_seconds_count{_labels(route=route, method=method)} {series["count"]}')
+
+    for name, field, description in (
+        ('api_db_queries_total', 'queries', 'SQL-запросы'),
+        ('api_db_duration_seconds_total', 'db_time', 'Время в базе'),
+        ('api_serializer_duration_seconds_total', 'serializer_time', 'Время сериализации'),
+    ):
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        for (route, method), series in sorted(routes.items()):
+            value = series[field]
+            lines.append(f'{name}{_labels(route=route, method=method)} {value if field == "queries" else f"{value:.6f}"}')
+
+    for name, kind, description, value in extra or ():
+        if value is not None:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def server_timing(metrics, elapsed):
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'serialize;dur={metrics.serializer_time * 1000:.1f}',
+        f'total;dur={elapsed * 1000:.1f}',
+    ])
+
+
+def check_budget(route, method, queries):
+    # Бюджет задаётся для маршрута ('backend:basket') или маршрута с методом ('GET backend:basket')
+    budget = settings.QUERY_BUDGETS.get(f'{method} {route}', settings.QUERY_BUDGETS.get(route))
+    if budget is None or queries <= budget:
+        return
+    message = f'{method} {route}: {queries} SQL-запросов при бюджете {budget}'
+    if settings.METRICS_ENFORCE_QUERY_BUDGETS:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class MetricsMiddleware:
+    """
+    Замеры каждого запроса: время ответа, число SQL-запросов, время в базе и в сериализаторах.
+    Итоги копятся в registry по имени маршрута, при METRICS_SERVER_TIMING
+    возвращаются клиенту в заголовке Server-Timing
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with collect_metrics() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with collect_metrics() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        elapsed = metrics.elapsed
+        route = route_name(request)
+        registry.observe(route, request.method, response.status_code, metrics, elapsed)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(metrics, elapsed)
+        check_budget(route, request.method, metrics.queries)
+        return response
+
+
+class MetricsPermission(BasePermission):
+    """
+    Счётчики доступны администраторам и адресам из METRICS_ALLOWED_IPS (сборщик Prometheus)
+    """
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Ошибки (например, нет доступа) выводятся простым текстом
+            data = '\n'.join(str(value) for value in data.values()) + '\n'
+        return str(data).encode(self.charset)
@@ -0,0 +1,203 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:55
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """
+    Базовая версия могла записать одно предложение в заказ дважды: такие позиции
+    сливаются в одну, иначе уникальное ограничение не создать
+    """
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    duplicates = OrderItem.objects.values('order_id', 'product_info_id').annotate(
+        lines=Count('id'), total=Sum('quantity'), keep=Min('id'),
+    ).filter(lines__gt=1)
+    for row in duplicates:
+        OrderItem.objects.filter(pk=row['keep']).update(quantity=row['total'])
+        OrderItem.objects.filter(
+            order_id=row['order_id'], product_info_id=row['product_info_id'],
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='backend.productinfo')),
+                ('product_name', models.CharField(max_length=80)),
+                ('category_name', models.CharField(max_length=40)),
+                ('shop_name', models.CharField(max_length=50)),
+                ('shop_state', models.BooleanField(default=True)),
+                ('model', models.CharField(blank=True, max_length=80)),
+                ('quantity', models.PositiveIntegerField()),
+                ('price', models.PositiveIntegerField()),
+                ('price_rrc', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameter_name', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeviceToken',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('device', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(blank=True, upload_to='price_lists/%Y/%m/%d/')),
+                ('url', models.URLField(blank=True, max_length=500)),
+                ('format', models.CharField(blank=True, max_length=10)),
+                ('phase', models.CharField(choices=[('queued', 'В очереди'), ('importing', 'Импорт'), ('done', 'Завершён'), ('failed', 'Ошибка')], default='queued', max_length=15)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('from_email', models.CharField(max_length=254)),
+                ('to', models.JSONField(default=list)),
+                ('dedup_key', models.CharField(blank=True, max_length=200, null=True, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=15)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(auto_now_add=True)),
+                ('claim', models.CharField(blank=True, max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PriceListSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500)),
+                ('etag', models.CharField(blank=True, max_length=200)),
+                ('last_modified', models.CharField(blank=True, max_length=100)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('imported_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='backend.shop'),
+        ),
+        migrations.AlterField(
+            model_name='productparameter',
+            name='parameter',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='backend.parameter'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'dt'], name='order_user_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['shop', 'order'], name='order_item_shop_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product_info'), name='order_item_unique_product'),
+        ),
+        migrations.AddField(
+            model_name='catalogentry',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.category'),
+        ),
+        migrations.AddField(
+            model_name='catalogentry',
+            name='shop',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.shop'),
+        ),
+        migrations.AddField(
+            model_name='categoryfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.category'),
+        ),
+        migrations.AddField(
+            model_name='categoryfacet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.parameter'),
+        ),
+        migrations.AddField(
+            model_name='devicetoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='device_tokens', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='outgoingemail',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='outgoing_email_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='pricelistsource',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_list_sources', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['category', 'product_info'], name='catalog_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['shop', 'product_info'], name='catalog_shop_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogentry',
+            index=models.Index(fields=['price', 'product_info'], name='catalog_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicetoken',
+            index=models.Index(fields=['revoked_at', 'expires_at'], name='device_token_revoked_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pricelistsource',
+            unique_together={('user', 'url')},
+        ),
+    ]
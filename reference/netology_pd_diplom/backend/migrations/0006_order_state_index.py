@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['state'], name='order_state_idx'),
+        ),
+    ]
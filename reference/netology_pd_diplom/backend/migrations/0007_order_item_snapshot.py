@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def snapshot_placed_orders(apps, schema_editor):
+    """
+    Снимок позиций и сумма для заказов, оформленных до появления снимка
+    """
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    offer = ProductInfo.objects.filter(pk=OuterRef('product_info_id'))
+    OrderItem.objects.exclude(order__state='basket').filter(price__isnull=True).update(
+        shop=Subquery(offer.values('shop_id')),
+        product_name=Subquery(offer.values('product__name')),
+        model=Subquery(offer.values('model')),
+        shop_name=Subquery(offer.values('shop__name')),
+        price=Subquery(offer.values('price')),
+    )
+    totals = OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(
+        total=Sum(F('quantity') * F('price'))
+    ).values('total')
+    Order.objects.exclude(state='basket').filter(total_sum__isnull=True).update(
+        total_sum=Coalesce(Subquery(totals), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_order_state_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='model',
+            field=models.CharField(blank=True, max_length=80),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=80),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop_name',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_info',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='backend.productinfo'),
+        ),
+        migrations.RunPython(snapshot_placed_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Таблица FTS5 поискового индекса (SQLiteFTSBackend); на других базах поиск идёт без индекса
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS backend_search_index USING fts5("
+            "name, model, params, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS backend_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_order_item_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
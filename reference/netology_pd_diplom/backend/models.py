@@ -1,4 +1,8 @@
+import uuid
+
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.base_user import BaseUserManager
@@ -74,6 +78,11 @@ class Product(models.Model):
     name = models.CharField(max_length=80)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'category'], name='product_name_category_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -93,6 +102,47 @@ class ProductInfo(models.Model):
         return f'{self.product.name} ({self.shop.name})'
 
 
+class CatalogEntry(models.Model):
+    """
+    Денормализованная запись каталога для быстрого чтения списка товаров
+    """
+    product_info = models.OneToOneField(ProductInfo, primary_key=True, related_name='catalog_entry',
+                                        on_delete=models.CASCADE)
+    product_name = models.CharField(max_length=80)
+    category = models.ForeignKey(Category, related_name='+', on_delete=models.CASCADE, db_index=False)
+    category_name = models.CharField(max_length=40)
+    shop = models.ForeignKey(Shop, related_name='+', on_delete=models.CASCADE, db_index=False)
+    shop_name = models.CharField(max_length=50)
+    shop_state = models.BooleanField(default=True)
+    model = models.CharField(max_length=80, blank=True)
+    quantity = models.PositiveIntegerField()
+    price = models.PositiveIntegerField()
+    price_rrc = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'product_info'], name='catalog_category_idx'),
+            models.Index(fields=['shop', 'product_info'], name='catalog_shop_idx'),
+            models.Index(fields=['price', 'product_info'], name='catalog_price_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_name} ({self.shop_name})'
+
+
+class CatalogVersion(models.Model):
+    """
+    Счётчик изменений каталога: общий (key='catalog') и по магазинам (key='shop:<id>').
+    Из него строятся ETag ответов каталога и ключи их кеша
+    """
+    key = models.CharField(max_length=30, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+
 class Contact(models.Model):
     user = models.ForeignKey(User, related_name='contacts', on_delete=models.CASCADE)
     city = models.CharField(max_length=50)
@@ -107,6 +157,31 @@ class Contact(models.Model):
         return f'{self.city}, {self.street}'
 
 
+def item_price():
+    """
+    Цена позиции: из снимка оформленного заказа, у корзины - текущая цена предложения
+    """
+    return Coalesce('price', 'product_info__price')
+
+
+def items_total(order):
+    """
+    Выражение суммы позиций заказа: количество * цена предложения
+    """
+    return OrderItem.objects.filter(order=order).values('order').annotate(
+        total=Sum(F('quantity') * item_price())
+    ).values('total')
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def with_total(self):
+        """
+        Аннотирует заказы суммой total: сохранённой при оформлении или посчитанной в базе
+        """
+        return self.annotate(total=Coalesce('total_sum', Subquery(items_total(OuterRef('pk'))), 0))
+
+
 class Order(models.Model):
     NEW = 'new'
     CONFIRMED = 'confirmed'
@@ -127,23 +202,190 @@ class Order(models.Model):
     dt = models.DateTimeField(auto_now_add=True)
     state = models.CharField(choices=STATE_CHOICES, max_length=15)
     contact = models.ForeignKey(Contact, blank=True, null=True, on_delete=models.CASCADE)
+    # Сумма фиксируется при оформлении заказа, у корзины не заполнена
+    total_sum = models.PositiveIntegerField(null=True, blank=True)
+    # Время последнего изменения: для выдачи изменённых заказов (OrderView ?since=) и потока order/events.
+    # UPDATE через queryset.update() должен выставлять его сам
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'dt'], name='order_user_dt_idx'),
+            models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+            models.Index(fields=['user', 'updated_at'], name='order_user_updated_idx'),
+            # Фильтр по состоянию в админке и выборки заказов всех покупателей
+            models.Index(fields=['state'], name='order_state_idx'),
+        ]
 
     def __str__(self):
         return f'Заказ #{self.id}'
 
+    def calculate_total(self):
+        """
+        Сумма позиций заказа, посчитанная одним агрегирующим запросом
+        """
+        return self.ordered_items.aggregate(
+            total=Coalesce(Sum(F('quantity') * item_price()), 0)
+        )['total']
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='ordered_items', on_delete=models.CASCADE)
-    product_info = models.ForeignKey(ProductInfo, on_delete=models.CASCADE)
+    # У оформленного заказа предложение может быть удалено импортом прайс-листа, позиция остаётся в истории
+    product_info = models.ForeignKey(ProductInfo, blank=True, null=True, on_delete=models.SET_NULL)
+    # Магазин предложения, чтобы поставщик получал свои позиции по индексу без соединения с ProductInfo
+    shop = models.ForeignKey(Shop, related_name='order_items', blank=True, null=True,
+                             on_delete=models.SET_NULL, db_index=False)
     quantity = models.PositiveIntegerField(default=1)
+    # Снимок предложения на момент оформления: история заказов читается без каталога.
+    # У позиций корзины не заполнен
+    product_name = models.CharField(max_length=80, blank=True)
+    model = models.CharField(max_length=80, blank=True)
+    shop_name = models.CharField(max_length=50, blank=True)
+    price = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product_info'], name='order_item_unique_product'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'order'], name='order_item_shop_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.product_info.product.name} - {self.quantity}'
+        name = self.product_name or (self.product_info.product.name if self.product_info else '')
+        return f'{name} - {self.quantity}'
 
 class Parameter(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
 class ProductParameter(models.Model):
     product_info = models.ForeignKey(ProductInfo, related_name='product_parameters', on_delete=models.CASCADE)
-    parameter = models.ForeignKey(Parameter, on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, on_delete=models.CASCADE, db_index=False)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+        ]
+
+
+class CategoryFacet(models.Model):
+    """
+    Предрасчитанное количество предложений категории по значениям параметров
+    """
+    category = models.ForeignKey(Category, related_name='facets', on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, related_name='+', on_delete=models.CASCADE)
+    parameter_name = models.CharField(max_length=100)
     value = models.CharField(max_length=100)
+    count = models.PositiveIntegerField()
+
+
+class ImportJob(models.Model):
+    QUEUED = 'queued'
+    IMPORTING = 'importing'
+    DONE = 'done'
+    FAILED = 'failed'
+    PHASE_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (IMPORTING, 'Импорт'),
+        (DONE, 'Завершён'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='import_jobs', on_delete=models.CASCADE)
+    file = models.FileField(upload_to='price_lists/%Y/%m/%d/', blank=True)
+    url = models.URLField(max_length=500, blank=True)
+    format = models.CharField(max_length=10, blank=True)
+    phase = models.CharField(choices=PHASE_CHOICES, max_length=15, default=QUEUED)
+    processed = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Импорт {self.id} ({self.phase})'
+
+
+class PriceListSource(models.Model):
+    """
+    Состояние удалённого прайс-листа для условных запросов
+    """
+    user = models.ForeignKey(User, related_name='price_list_sources', on_delete=models.CASCADE)
+    url = models.URLField(max_length=500)
+    etag = models.CharField(max_length=200, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    checked_at = models.DateTimeField(null=True, blank=True)
+    imported_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'url')
+
+    def __str__(self):
+        return self.url
+
+
+class OutgoingEmail(models.Model):
+    """
+    Очередь исходящих писем: письмо сохраняется в транзакции вместе с изменением
+    данных, а отправляется фоновой задачей
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает отправки'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    # Письмо с тем же ключом повторно в очередь не ставится
+    dedup_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(choices=STATUS_CHOICES, max_length=15, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(auto_now_add=True)
+    claim = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outgoing_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.to)}'
+
+
+class DeviceToken(models.Model):
+    """
+    Выданный устройству подписанный токен. Сам токен не хранится: он проверяется
+    по подписи, а запись нужна для списка устройств и отзыва
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='device_tokens', on_delete=models.CASCADE)
+    device = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['revoked_at', 'expires_at'], name='device_token_revoked_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} ({self.device or self.id})'
@@ -0,0 +1,212 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+Cursor = namedtuple('Cursor', ['ordering', 'position', 'reverse'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничный вывод по ключу (keyset): следующая страница выбирается условием
+    (поле, pk) > (значение, pk) последней записи, без OFFSET и без COUNT(*).
+
+    ordering_fields сопоставляет значения параметра ordering с полями модели,
+    первичный ключ добавляется к сортировке для однозначности курсора.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    mode_query_param = 'pagination'
+    ordering_fields = {'id': 'pk'}
+    default_ordering = 'id'
+    invalid_cursor_message = 'Неверный курсор'
+
+    @classmethod
+    def is_requested(cls, request):
+        return (cls.cursor_query_param in request.query_params
+                or request.query_params.get(cls.mode_query_param) == 'cursor')
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_param, self.default_ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({self.ordering_param: f'Допустимые значения: {", ".join(self.ordering_fields)}'})
+        return ordering
+
+    def decode_cursor(self, request, model):
+        """
+        Курсор из запроса. Значения позиции приводятся к типам полей модели, любой
+        подделанный или повреждённый курсор даёт 404
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            ordering, position, reverse = data['o'], data['p'], bool(data['r'])
+            if not isinstance(ordering, str) or ordering.lstrip('-') not in self.ordering_fields:
+                raise ValueError(ordering)
+            if not isinstance(position, list) or len(position) != 2 or not all(
+                isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in position
+            ):
+                raise ValueError(position)
+            name = self.ordering_fields[ordering.lstrip('-')]
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            fields = (field, model._meta.pk)
+            position = [field.to_python(value) for field, value in zip(fields, position)]
+        except (TypeError, ValueError, KeyError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(ordering, position, reverse)
+
+    def encode_cursor(self, cursor):
+        data = {'o': cursor.ordering, 'p': cursor.position, 'r': int(cursor.reverse)}
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def _key(self, obj, field):
+        values = []
+        for name in (field, 'pk'):
+            if isinstance(obj, dict):
+                # Строка queryset.values(): первичный ключ под именем поля модели
+                value = obj[self.pk_name if name == 'pk' else name]
+            else:
+                value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.pk_name = queryset.model._meta.pk.attname
+        cursor = self.decode_cursor(request, queryset.model)
+        # Курсор хранит сортировку, чтобы ссылки оставались согласованными
+        ordering = cursor.ordering if cursor else self.get_ordering(request)
+        field = self.ordering_fields[ordering.lstrip('-')]
+        reverse = cursor.reverse if cursor else False
+        descending = ordering.startswith('-') != reverse
+
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}pk')
+        if cursor:
+            value, pk = cursor.position
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = True if reverse else has_more
+        has_previous = has_more if reverse else cursor is not None
+        self.next_link = None
+        self.previous_link = None
+        if rows and has_next:
+            self.next_link = self.encode_cursor(Cursor(ordering, self._key(rows[-1], field), False))
+        if rows and has_previous:
+            self.previous_link = self.encode_cursor(Cursor(ordering, self._key(rows[0], field), True))
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CatalogKeysetPagination(KeysetPagination):
+    ordering_fields = {'id': 'product_info_id', 'price': 'price'}
+
+
+class OrderKeysetPagination(KeysetPagination):
+    ordering_fields = {'id': 'id', 'dt': 'dt'}
+    default_ordering = '-dt'
+
+
+class SwitchablePagination(BasePagination):
+    """
+    Постраничный вывод по номеру страницы по умолчанию и по курсору,
+    если клиент передал cursor или pagination=cursor
+    """
+
+    page_number_class = PageNumberPagination
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        pagination_class = self.keyset_class if self.keyset_class.is_requested(request) else self.page_number_class
+        self.paginator = pagination_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_results(self, data):
+        return data['results']
+
+    def get_schema_operation_parameters(self, view):
+        return self.page_number_class().get_schema_operation_parameters(view)
+
+
+class CatalogPagination(SwitchablePagination):
+    keyset_class = CatalogKeysetPagination
+
+
+def estimated_count(queryset):
+    """
+    Оценка числа строк таблицы без COUNT(*): reltuples из статистики PostgreSQL,
+    в SQLite - наибольший первичный ключ. None, если выборка с условиями или оценки нет
+    """
+    if not isinstance(queryset, QuerySet) or queryset.query.where or queryset.query.distinct:
+        return None
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1: таблица ещё не анализировалась
+        return int(row[0]) if row and row[0] >= 0 else None
+    if connection.vendor == 'sqlite' and model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        return model._default_manager.using(queryset.db).aggregate(last=Max('pk'))['last'] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для списков админки по большим таблицам: без фильтров число строк оценивается,
+    если оценка больше threshold; с фильтрами считается COUNT(*) по индексу
+    """
+    threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > self.threshold:
+            return estimate
+        return super().count
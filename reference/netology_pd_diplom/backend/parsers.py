@@ -0,0 +1,218 @@
+import codecs
+import json
+
+import yaml
+from yaml.events import (
+    AliasEvent, MappingEndEvent, MappingStartEvent, ScalarEvent,
+    SequenceEndEvent, SequenceStartEvent,
+)
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # libyaml недоступна
+    from yaml import SafeLoader
+
+
+SECTIONS = ('categories', 'goods')
+PRICE_LIST_FORMATS = {
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.json': 'json',
+}
+
+
+class PriceListError(ValueError):
+    """
+    Ошибка структуры прайс-листа
+    """
+
+
+def detect_format(filename):
+    """
+    Определяет формат прайс-листа по имени файла
+    """
+    for suffix, fmt in PRICE_LIST_FORMATS.items():
+        if filename.lower().endswith(suffix):
+            return fmt
+    return None
+
+
+def load_price_list(stream, fmt):
+    """
+    Загружает прайс-лист целиком в память
+    """
+    if fmt == 'yaml':
+        return yaml.load(stream, Loader=SafeLoader)
+    return json.load(stream)
+
+
+def iter_price_list(stream, fmt):
+    """
+    Потоково разбирает прайс-лист.
+
+    Возвращает пары (раздел, значение): ('shop', имя магазина), а затем по одной
+    записи ('categories', {...}) и ('goods', {...}) в порядке следования в файле.
+    """
+    if fmt == 'yaml':
+        return iter_yaml(stream)
+    if fmt == 'json':
+        return iter_json(stream)
+    raise PriceListError(f'Неизвестный формат прайс-листа: {fmt}')
+
+
+def _compose(loader, anchors):
+    event = loader.get_event()
+    if isinstance(event, AliasEvent):
+        return anchors[event.anchor]
+
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+    elif isinstance(event, SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(SequenceNode, None, event.implicit)
+        node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(SequenceEndEvent):
+            node.value.append(_compose(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(event, MappingStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(MappingNode, None, event.implicit)
+        node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(MappingEndEvent):
+            key = _compose(loader, anchors)
+            node.value.append((key, _compose(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        raise PriceListError(f'Неожиданное событие YAML: {event}')
+
+    if getattr(event, 'anchor', None):
+        anchors[event.anchor] = node
+    return node
+
+
+def _construct(loader, node):
+    data = loader.construct_object(node, deep=True)
+    # Конструктор кеширует все построенные объекты, сбрасываем кеш после каждой записи
+    loader.constructed_objects = {}
+    loader.recursive_objects = {}
+    return data
+
+
+def iter_yaml(stream):
+    """
+    Разбирает YAML по событиям, собирая в памяти только одну запись за раз
+    """
+    loader = SafeLoader(stream)
+    try:
+        loader.get_event()  # StreamStartEvent
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()  # DocumentStartEvent
+        if not loader.check_event(MappingStartEvent):
+            raise PriceListError('Прайс-лист должен быть словарём')
+        loader.get_event()
+
+        anchors = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _construct(loader, _compose(loader, anchors))
+            if key in SECTIONS and loader.check_event(SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(SequenceEndEvent):
+                    yield key, _construct(loader, _compose(loader, anchors))
+                loader.get_event()
+            else:
+                yield key, _construct(loader, _compose(loader, anchors))
+    finally:
+        loader.dispose()
+
+
+class _JSONReader:
+    """
+    Инкрементальное чтение JSON-документа фиксированной структуры
+    """
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, stream, chunk_size):
+        if isinstance(stream.read(0), bytes):
+            stream = codecs.getreader('utf-8')(stream)
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise PriceListError('Неожиданный конец JSON-документа')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise PriceListError(f'Ожидался символ {char!r} в JSON-документе')
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе буфера может оказаться началом более длинного числа
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json(stream, chunk_size=64 * 1024):
+    """
+    Разбирает JSON, декодируя элементы разделов categories и goods по одному
+    """
+    reader = _JSONReader(stream, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key in SECTIONS and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() != ']':
+                while True:
+                    yield key, reader.value()
+                    if reader.peek() == ']':
+                        break
+                    reader.expect(',')
+            reader.expect(']')
+        else:
+            yield key, reader.value()
+
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
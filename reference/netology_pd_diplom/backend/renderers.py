@@ -0,0 +1,47 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import ujson
+except ImportError:  # без ujson ответы кодируются стандартным json
+    ujson = None
+
+
+class UJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на ujson с тем же выводом, что и у стандартного.
+
+    ujson записывает числа с плавающей точкой иначе (1e-5 вместо 1e-05), поэтому
+    рендерер подключается к представлениям, в ответах которых таких чисел нет.
+    Отступы (indent в Accept) и типы, которые ujson не умеет кодировать, обрабатывает JSONRenderer
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if ujson is None or data is None or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = ujson.dumps(
+                data, ensure_ascii=self.ensure_ascii, escape_forward_slashes=False,
+                default=self.encoder_class().default,
+            )
+        except (TypeError, OverflowError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer: U+2028 и U+2029 допустимы в JSON, но не в JavaScript
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    text/event-stream для потоков событий. Сам поток отдаётся StreamingHttpResponse,
+    через рендерер проходят только ответы-ошибки (нет входа и т.п.) - одним событием error
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f'event: error\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode(self.charset)
@@ -0,0 +1,223 @@
+"""
+Чтение с реплик базы для представлений только для чтения.
+
+Представление с атрибутом replica_reads = True читает с реплики в GET/HEAD-запросах.
+Реплика выбирается по кругу один раз на запрос, недоступная реплика пропускается
+DB_REPLICA_HEALTH_INTERVAL секунд. Запись в запросе закрепляет его чтение за основной базой,
+а запросы с теми же учётными данными читают с основной базы ещё DB_REPLICA_PIN_SECONDS секунд,
+пока реплики догоняют запись. Закрепление хранится в общем кеше DB_REPLICA_PIN_CACHE,
+чтобы его видели все процессы сервера
+"""
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """
+    Маршрутизация одного запроса: можно ли читать с реплики, выбранная реплика, была ли запись
+    """
+
+    def __init__(self, pin_key=None):
+        self.pin_key = pin_key
+        self.replica_reads = False
+        self.replica = None
+        self.wrote = False
+
+
+class ReplicaHealth:
+    """
+    Доступность реплик в процессе: проверка не чаще раза в DB_REPLICA_HEALTH_INTERVAL секунд
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            healthy, checked_at = self._checked.get(alias, (True, None))
+        if checked_at is not None and now - checked_at < settings.DB_REPLICA_HEALTH_INTERVAL:
+            return healthy
+        healthy = probe(alias)
+        with self._lock:
+            self._checked[alias] = (healthy, now)
+        return healthy
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._checked[alias] = (False, time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+health = ReplicaHealth()
+
+
+def probe(alias):
+    connection = connections[alias]
+    try:
+        # Подключение к отсутствующему файлу SQLite создало бы пустую базу
+        if connection.vendor == 'sqlite' and not connection.is_in_memory_db() \
+                and not os.path.exists(connection.settings_dict['NAME']):
+            raise DatabaseError(f'нет файла {connection.settings_dict["NAME"]}')
+        # is_usable() проверяет соединение мимо execute_wrappers: проверка не считается запросом в метриках
+        connection.ensure_connection()
+        if not connection.is_usable():
+            raise DatabaseError('соединение не отвечает')
+        return True
+    except DatabaseError as error:
+        logger.warning('Реплика %s недоступна: %s', alias, error)
+        return False
+
+
+def replica_failure_recorder(alias):
+    """
+    execute_wrapper реплики: ошибка запроса исключает реплику из выбора до следующей проверки
+    """
+    def wrapper(execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError:
+            health.mark_down(alias)
+            raise
+    return wrapper
+
+
+@receiver(connection_created)
+def install_replica_failure_recorder(sender, connection, **kwargs):
+    if connection.alias in settings.DATABASE_REPLICAS:
+        connection.execute_wrappers.append(replica_failure_recorder(connection.alias))
+
+
+class ReplicaRouter:
+    """
+    Чтение с реплики в запросах, которые это разрешают; запись и миграции - на основной базе
+    """
+
+    def __init__(self):
+        self._turn = itertools.count()
+
+    def pick_replica(self):
+        replicas = settings.DATABASE_REPLICAS
+        for _ in range(len(replicas)):
+            alias = replicas[next(self._turn) % len(replicas)]
+            if health.is_healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or state.wrote:
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то, что в ней записано
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = self.pick_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает на реплики репликацией (для SQLite - командой sync_sqlite_replicas)
+        return db not in settings.DATABASE_REPLICAS
+
+
+def pin_cache():
+    return caches[settings.DB_REPLICA_PIN_CACHE]
+
+
+def pin_key(request):
+    """
+    Ключ закрепления за основной базой: по учётным данным запроса (токен или сессия)
+    """
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'replica-pin:' + hashlib.sha1(credentials.encode()).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Состояние маршрутизации на время запроса. Чтение с реплики включается для GET/HEAD
+    к представлениям с replica_reads = True, если после записи с теми же учётными данными
+    прошло больше DB_REPLICA_PIN_SECONDS секунд
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = RoutingState(pin_key(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(state)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        state = RoutingState(pin_key(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(state)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        view_class = getattr(view_func, 'view_class', None)
+        if state is None or request.method not in SAFE_METHODS or not getattr(view_class, 'replica_reads', False):
+            return None
+        state.replica_reads = not (state.pin_key and pin_cache().get(state.pin_key))
+        return None
+
+    def finish(self, state):
+        if state.wrote and state.pin_key:
+            pin_cache().set(state.pin_key, True, settings.DB_REPLICA_PIN_SECONDS)
@@ -0,0 +1,218 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+from rest_framework.filters import SearchFilter
+
+from backend.models import CatalogEntry, ProductParameter
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+def collect_documents(product_info_ids):
+    """
+    Тексты для индексации: название товара, модель и значения параметров
+    """
+    documents = {
+        offer_id: {'name': name, 'model': model, 'params': []}
+        for offer_id, name, model in CatalogEntry.objects.filter(
+            product_info_id__in=product_info_ids
+        ).values_list('product_info_id', 'product_name', 'model')
+    }
+    for offer_id, value in ProductParameter.objects.filter(
+        product_info_id__in=documents
+    ).values_list('product_info_id', 'value'):
+        documents[offer_id]['params'].append(value)
+    return documents
+
+
+class BaseSearchBackend:
+    """
+    Интерфейс поискового индекса каталога
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def index(self, product_info_ids):
+        """
+        Добавляет или обновляет документы предложений в индексе
+        """
+
+    def remove(self, product_info_ids):
+        """
+        Удаляет предложения из индекса
+        """
+
+    def clear(self):
+        """
+        Очищает индекс целиком
+        """
+
+    def search(self, query, limit):
+        """
+        Возвращает идентификаторы предложений в порядке релевантности
+        """
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query, limit):
+        """
+        Ограничивает queryset каталога найденными предложениями
+        """
+        ids = self.search(query, limit)
+        return queryset.filter(product_info_id__in=ids)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Запасной бэкенд без индекса: поиск подстроки в названии, как у SearchFilter
+    """
+
+    def search(self, query, limit):
+        queryset = self.filter_queryset(CatalogEntry.objects.order_by('product_info_id'), query, limit)
+        return list(queryset.values_list('product_info_id', flat=True)[:limit])
+
+    def filter_queryset(self, queryset, query, limit):
+        for term in tokenize(query):
+            queryset = queryset.filter(product_name__icontains=term)
+        return queryset
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Инвертированный индекс на SQLite FTS5 с префиксным поиском и ранжированием BM25.
+    Таблица создаётся миграцией 0008_search_index
+    """
+
+    table = 'backend_search_index'
+    # Веса колонок для bm25: название важнее модели, модель важнее параметров
+    weights = (10.0, 5.0, 1.0)
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    @property
+    def rank(self):
+        return f'bm25({self.table}, {", ".join(str(weight) for weight in self.weights)})'
+
+    @staticmethod
+    def match_expression(query):
+        # Каждое слово ищется по префиксу, все слова должны встретиться
+        return ' AND '.join('"%s"*' % term for term in tokenize(query))
+
+    def index(self, product_info_ids):
+        documents = collect_documents(product_info_ids)
+        if not documents:
+            return
+        self.remove(documents)
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, model, params) VALUES (%s, %s, %s, %s)',
+                [
+                    (offer_id, document['name'], document['model'], ' '.join(document['params']))
+                    for offer_id, document in documents.items()
+                ],
+            )
+
+    def remove(self, product_info_ids):
+        product_info_ids = list(product_info_ids)
+        if not product_info_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_info_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', product_info_ids)
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def search(self, query, limit):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY {self.rank} LIMIT %s',
+                [expression, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, expression, using=None):
+        with connections[using or self.using].cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table} WHERE {self.table} MATCH %s', [expression])
+            return cursor.fetchone()[0]
+
+    def filter_queryset(self, queryset, query, limit):
+        """
+        Соединяет каталог с индексом в одном запросе.
+
+        Сортировка по релевантности требует вычислить bm25 для всех совпадений, поэтому
+        для слишком общих запросов (больше limit совпадений) результаты идут в порядке
+        индекса, который FTS5 отдаёт без сортировки.
+        """
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset
+        # Счёт по той же базе, из которой будет читаться каталог (реплика при чтении с реплик)
+        if self.count(expression, queryset.db) <= limit:
+            select, order_by = {'search_rank': self.rank}, ['search_rank', f'{self.table}.rowid']
+        else:
+            select, order_by = {}, [f'{self.table}.rowid']
+        return queryset.extra(
+            select=select,
+            tables=[self.table],
+            # Колонка без имени таблицы: во вложенном запросе Django даёт таблице каталога псевдоним
+            where=[f'{self.table}.rowid = product_info_id', f'{self.table} MATCH %s'],
+            params=[expression],
+            order_by=order_by,
+        )
+
+
+def default_backend_path():
+    if connections['default'].vendor == 'sqlite':
+        return 'backend.search.SQLiteFTSBackend'
+    return 'backend.search.DatabaseSearchBackend'
+
+
+def get_search_backend_class():
+    return import_string(settings.SEARCH_BACKEND or default_backend_path())
+
+
+def get_search_backend():
+    return get_search_backend_class()()
+
+
+class CatalogSearchFilter(SearchFilter):
+    """
+    Поиск по каталогу через поисковый индекс вместо LIKE '%term%'
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_search_backend().filter_queryset(queryset, ' '.join(terms), settings.SEARCH_MAX_RESULTS)
+
+
+def rebuild_search_index(batch_size=5000):
+    """
+    Полная переиндексация каталога
+    """
+    backend = get_search_backend()
+    backend.clear()
+    ids = CatalogEntry.objects.order_by('product_info_id').values_list('product_info_id', flat=True)
+    total, last_id = 0, 0
+    while True:
+        chunk = list(ids.filter(product_info_id__gt=last_id)[:batch_size])
+        if not chunk:
+            break
+        backend.index(chunk)
+        total += len(chunk)
+        last_id = chunk[-1]
+    return total
@@ -1,12 +1,14 @@
 from rest_framework import serializers
 from backend.models import (
     User, Category, Shop, Product, ProductInfo,
-    OrderItem, Order, Contact
+    OrderItem, Order, Contact, ImportJob, CatalogEntry
 )
 from django.utils.crypto import get_random_string
+from backend.metrics import SerializerTimingMixin, timed_serialization
+from backend.tasks import get_job_progress
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     password_repeat = serializers.CharField(write_only=True)
 
@@ -30,7 +32,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
-class ContactSerializer(serializers.ModelSerializer):
+class ContactSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = (
@@ -40,7 +42,7 @@ class ContactSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
         
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     contacts = ContactSerializer(read_only=True, many=True)
 
     class Meta:
@@ -52,21 +54,21 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SerializerTimingMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name',)
         read_only_fields = ('id',)
 
 
-class ShopSerializer(serializers.ModelSerializer):
+class ShopSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     class Meta:
         model = Shop
         fields = ('id', 'name', 'state',)
         read_only_fields = ('id',)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     category = serializers.StringRelatedField()
 
     class Meta:
@@ -74,7 +76,7 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ('name', 'category',)
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -85,7 +87,89 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id',)
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class CatalogEntrySerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    """
+    Запись каталога в формате ProductInfoSerializer
+    """
+    id = serializers.IntegerField(source='product_info_id', read_only=True)
+    product = serializers.SerializerMethodField()
+    shop = serializers.IntegerField(source='shop_id', read_only=True)
+
+    class Meta:
+        model = CatalogEntry
+        fields = (
+            'id', 'model', 'product', 'shop',
+            'quantity', 'price', 'price_rrc'
+        )
+        read_only_fields = fields
+
+    def get_product(self, obj):
+        return {'name': obj.product_name, 'category': obj.category_name}
+
+
+class ValuesSerializer:
+    """
+    Сериализация строк queryset.values() без создания объектов моделей и полей DRF.
+    Вывод совпадает с соответствующим ModelSerializer, который остаётся для схемы API
+    """
+    values_fields = ()
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def prepare(cls, queryset):
+        # Поля extra(select=...) нужны в выборке, если по ним идёт сортировка
+        return queryset.values(*cls.values_fields, *queryset.query.extra_select)
+
+    def to_representation(self, row):
+        return {name: row[name] for name in self.values_fields}
+
+    def _serialize(self):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in self.rows]
+
+    @property
+    def data(self):
+        return timed_serialization(self._serialize)
+
+
+class CategoryValuesSerializer(ValuesSerializer):
+    """
+    Вывод CategorySerializer
+    """
+    values_fields = ('id', 'name')
+
+
+class ShopValuesSerializer(ValuesSerializer):
+    """
+    Вывод ShopSerializer
+    """
+    values_fields = ('id', 'name', 'state')
+
+
+class CatalogEntryValuesSerializer(ValuesSerializer):
+    """
+    Вывод CatalogEntrySerializer
+    """
+    values_fields = (
+        'product_info_id', 'model', 'product_name', 'category_name', 'shop_id',
+        'quantity', 'price', 'price_rrc',
+    )
+
+    def to_representation(self, row):
+        return {
+            'id': row['product_info_id'],
+            'model': row['model'],
+            'product': {'name': row['product_name'], 'category': row['category_name']},
+            'shop': row['shop_id'],
+            'quantity': row['quantity'],
+            'price': row['price'],
+            'price_rrc': row['price_rrc'],
+        }
+
+
+class OrderItemSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ('product_info', 'quantity')
@@ -102,7 +186,7 @@ class OrderItemCreateSerializer(OrderItemSerializer):
     product_info = ProductInfoSerializer(read_only=True)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
     total_sum = serializers.SerializerMethodField()
     contact = ContactSerializer(read_only=True)
@@ -111,12 +195,95 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = (
             'id', 'ordered_items', 'state', 'dt',
-            'total_sum', 'contact',
+            'total_sum', 'contact', 'updated_at',
         )
-        read_only_fields = ('id',)
+        read_only_fields = ('id', 'updated_at')
     
     def get_total_sum(self, obj):
-        return sum([
-            item.quantity * item.product_info.price
-            for item in obj.ordered_items.all()
-        ])
\ No newline at end of file
+        # Сумма берётся из аннотации with_total() или сохранённого значения
+        total = getattr(obj, 'total', None)
+        if total is None:
+            total = obj.total_sum if obj.total_sum is not None else obj.calculate_total()
+        return total
+
+
+class OrderItemSnapshotSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    """
+    Позиция заказа с product_info в форме ProductInfoSerializer и названием магазина shop_name.
+    Состояние заказа передаётся в контексте (order_state). У оформленного заказа данные из снимка:
+    id - null, если предложение удалено из каталога, quantity, price_rrc и категория не сохраняются и равны null.
+    У корзины - из каталога
+    """
+    product_info = serializers.SerializerMethodField()
+
+    class Meta:
+        model = OrderItem
+        fields = ('product_info', 'quantity')
+        read_only_fields = fields
+
+    def get_product_info(self, item):
+        if self.context['order_state'] != 'basket':
+            return {
+                'id': item.product_info_id, 'model': item.model,
+                'product': {'name': item.product_name, 'category': None},
+                'shop': item.shop_id, 'shop_name': item.shop_name,
+                'quantity': None, 'price': item.price, 'price_rrc': None,
+            }
+        offer = item.product_info
+        if offer is None:
+            return None
+        return {
+            'id': offer.id, 'model': offer.model,
+            'product': {'name': offer.product.name, 'category': str(offer.product.category)},
+            'shop': offer.shop_id, 'shop_name': offer.shop.name,
+            'quantity': offer.quantity, 'price': offer.price, 'price_rrc': offer.price_rrc,
+        }
+
+
+def serialize_order_items(order, items, context):
+    """
+    Позиции заказа order с его состоянием в контексте: позиции не обращаются к item.order
+    """
+    return OrderItemSnapshotSerializer(items, many=True, context={**context, 'order_state': order.state}).data
+
+
+class OrderHistorySerializer(OrderSerializer):
+    """
+    Заказы и корзина пользователя: позиции оформленных заказов и их сумма - из самого заказа
+    """
+    ordered_items = serializers.SerializerMethodField()
+
+    def get_ordered_items(self, order):
+        return serialize_order_items(order, order.ordered_items.all(), self.context)
+
+
+class PartnerOrderSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    """
+    Заказ глазами поставщика: только позиции его магазинов и их сумма
+    """
+    ordered_items = serializers.SerializerMethodField()
+    total_sum = serializers.IntegerField(source='shop_total', read_only=True)
+    contact = ContactSerializer(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact')
+        read_only_fields = fields
+
+    def get_ordered_items(self, order):
+        return serialize_order_items(order, order.shop_items, self.context)
+
+
+class ImportJobSerializer(SerializerTimingMixin, serializers.ModelSerializer):
+    processed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = (
+            'id', 'phase', 'processed', 'result', 'errors',
+            'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+
+    def get_processed(self, obj):
+        return get_job_progress(obj)
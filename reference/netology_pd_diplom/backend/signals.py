@@ -1,10 +1,16 @@
 from typing import Type
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
-from backend.models import User
+from rest_framework.authtoken.models import Token
+from backend.authentication import token_cache
+from backend.catalog import bump_catalog_version, refresh_catalog_entries
+from backend.events import publish_order_change
+from backend.mail import queue_email
+from backend.search import get_search_backend
+from backend.models import CatalogEntry, Category, Order, Product, ProductInfo, Shop, User
 
 new_user_registered = Signal()
 new_order = Signal()
@@ -12,13 +18,13 @@ new_order = Signal()
 
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token, **kwargs):
-    msg = EmailMultiAlternatives(
+    queue_email(
         f"Password Reset Token for {reset_password_token.user}",
         reset_password_token.key,
-        settings.EMAIL_HOST_USER,
-        [reset_password_token.user.email]
+        [reset_password_token.user.email],
+        from_email=settings.EMAIL_HOST_USER,
+        dedup_key=f'password-reset:{reset_password_token.key}',
     )
-    msg.send()
 
 
 @receiver(post_save, sender=User)
@@ -28,23 +34,90 @@ def new_user_registered_signal(sender: Type[User], instance: User, created: bool
         instance.confirmation_token = uuid.uuid4().hex
         instance.save(update_fields=['confirmation_token'])
 
-        msg = EmailMultiAlternatives(
+        queue_email(
             f"Email confirmation for {instance.email}",
             instance.confirmation_token,
-            settings.EMAIL_HOST_USER,
-            [instance.email]
+            [instance.email],
+            from_email=settings.EMAIL_HOST_USER,
+            dedup_key=f'confirmation:{instance.pk}:{instance.confirmation_token}',
         )
-        msg.send()
+
+
+@receiver(post_save, sender=User)
+def user_saved_token_cache_signal(sender, instance, created, **kwargs):
+    # Смена пароля, блокировка и другие изменения пользователя сбрасывают его токены в кеше
+    if not created:
+        user_id = instance.pk
+        transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted_signal(sender, instance, **kwargs):
+    key = instance.key
+    token_cache.invalidate(key)
+    transaction.on_commit(lambda: token_cache.invalidate(key))
 
 
 @receiver(new_order)
 def new_order_signal(user_id, **kwargs):
     from backend.models import Order  # чтобы не было циклического импорта
     user = User.objects.get(id=user_id)
-    msg = EmailMultiAlternatives(
+    queue_email(
         f"Обновление статуса заказа",
         'Заказ сформирован',
-        settings.EMAIL_HOST_USER,
-        [user.email]
+        [user.email],
+        from_email=settings.EMAIL_HOST_USER,
     )
-    msg.send()
+
+
+def bump_after_commit(shop_ids=()):
+    shop_ids = list(shop_ids)
+    transaction.on_commit(lambda: bump_catalog_version(shop_ids))
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_saved_signal(sender, instance, **kwargs):
+    refresh_catalog_entries([instance.pk])
+    get_search_backend().index([instance.pk])
+    bump_after_commit([instance.shop_id])
+
+
+@receiver(post_delete, sender=ProductInfo)
+def product_info_deleted_signal(sender, instance, **kwargs):
+    # Строки каталога удаляются каскадом, у таблицы поискового индекса внешнего ключа нет
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_saved_signal(sender, instance, created, **kwargs):
+    if not created:
+        CatalogEntry.objects.filter(product_info__product=instance).update(
+            product_name=instance.name, category=instance.category_id,
+            category_name=instance.category.name,
+        )
+        get_search_backend().index(instance.product_infos.values_list('id', flat=True))
+        bump_after_commit(instance.product_infos.values_list('shop_id', flat=True).distinct().order_by())
+
+
+@receiver(post_save, sender=Category)
+def category_saved_signal(sender, instance, created, **kwargs):
+    # Новая категория меняет только общий список категорий
+    if created:
+        bump_after_commit()
+        return
+    CatalogEntry.objects.filter(category=instance).update(category_name=instance.name)
+    bump_after_commit(CatalogEntry.objects.filter(category=instance).values_list('shop_id', flat=True).distinct().order_by())
+
+
+@receiver(post_save, sender=Shop)
+def shop_saved_signal(sender, instance, created, **kwargs):
+    if not created:
+        CatalogEntry.objects.filter(shop=instance).update(shop_name=instance.name, shop_state=instance.state)
+    bump_after_commit([instance.pk])
+
+
+@receiver(post_save, sender=Order)
+def order_saved_signal(sender, instance, **kwargs):
+    # Изменения через save(), например в админке; checkout и cancel_order меняют состояние UPDATE и публикуют сами
+    if instance.state != 'basket':
+        publish_order_change(instance.user_id, instance.pk, instance.state, instance.updated_at)
@@ -0,0 +1,115 @@
+import requests
+import yaml
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from backend.authentication import prune_device_tokens
+from backend.fetcher import fetch_price_list
+from backend.importer import import_price_list_stream
+from backend.mail import send_queued_emails
+from backend.models import ImportJob, PriceListSource
+
+PROGRESS_KEY = 'import-job:{}:processed'
+
+
+def progress_cache():
+    return caches[settings.IMPORT_PROGRESS_CACHE]
+
+
+def get_job_progress(job):
+    """
+    Количество обработанных строк: во время импорта берётся из кеша IMPORT_PROGRESS_CACHE,
+    так как сам импорт идёт в транзакции и изменения задачи ещё не видны
+    """
+    if job.phase == ImportJob.IMPORTING:
+        return progress_cache().get(PROGRESS_KEY.format(job.id), job.processed)
+    return job.processed
+
+
+def _import_from_url(job, progress):
+    """
+    Импорт по URL: неизменившийся прайс-лист пропускается без обращения к каталогу
+    """
+    source, _ = PriceListSource.objects.get_or_create(user=job.user, url=job.url)
+    fetched = fetch_price_list(source)
+    source.checked_at = timezone.now()
+
+    if fetched is None or fetched.not_modified:
+        if fetched is not None:
+            source.etag, source.last_modified = fetched.etag, fetched.last_modified
+        source.save(update_fields=['etag', 'last_modified', 'checked_at'])
+        return {'not_modified': True, 'processed': 0}
+
+    job.format = fetched.format
+    with fetched.stream as stream:
+        result = import_price_list_stream(job.user, stream, fetched.format, progress=progress)
+
+    source.etag, source.last_modified = fetched.etag, fetched.last_modified
+    source.content_hash = fetched.content_hash
+    source.imported_at = source.checked_at
+    source.save()
+    return result.as_dict()
+
+
+@shared_task
+def import_price_list_task(job_id):
+    """
+    Фоновый импорт загруженного или удалённого прайс-листа
+    """
+    job = ImportJob.objects.select_related('user').get(id=job_id)
+    if job.phase != ImportJob.QUEUED:
+        return job.phase
+
+    job.phase = ImportJob.IMPORTING
+    job.save(update_fields=['phase', 'updated_at'])
+    progress_key = PROGRESS_KEY.format(job.id)
+
+    def report(result):
+        progress_cache().set(progress_key, result.processed, timeout=60 * 60)
+
+    try:
+        if job.url:
+            result = _import_from_url(job, report)
+        else:
+            with job.file.open('rb') as stream:
+                result = import_price_list_stream(job.user, stream, job.format, progress=report).as_dict()
+    except requests.RequestException as e:
+        job.phase = ImportJob.FAILED
+        job.errors = [f'Ошибка загрузки прайс-листа: {str(e)}']
+    except (yaml.YAMLError, ValueError, KeyError, TypeError) as e:
+        job.phase = ImportJob.FAILED
+        job.errors = [f'Ошибка чтения файла: {str(e)}']
+    except Exception as e:
+        job.phase = ImportJob.FAILED
+        job.errors = [f'Внутренняя ошибка импорта: {str(e)}']
+        job.save(update_fields=['phase', 'errors', 'updated_at'])
+        raise
+    else:
+        job.phase = ImportJob.DONE
+        job.processed = result['processed']
+        job.result = result
+        if job.file:
+            job.file.delete(save=False)
+    finally:
+        progress_cache().delete(progress_key)
+
+    job.save(update_fields=['phase', 'format', 'processed', 'result', 'errors', 'file', 'updated_at'])
+    return job.phase
+
+
+@shared_task
+def send_queued_emails_task():
+    """
+    Отправка писем из очереди; повторные попытки подбирает периодический запуск
+    """
+    return send_queued_emails()
+
+
+@shared_task
+def prune_device_tokens_task():
+    """
+    Удаление истёкших токенов устройств
+    """
+    return prune_device_tokens()
@@ -1,3 +1,1522 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import yaml
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from backend.async_views import (
+    AsyncBasketView, AsyncCategoryView, AsyncOrderView, AsyncProductInfoView, AsyncShopView, OrderEventsView,
+    sse_event,
+)
+from backend.authentication import (
+    CachedToken, CachedTokenAuthentication, SignedTokenAuthentication, issue_device_token, revocation_list,
+    revoke_device_tokens, token_cache, token_cache_key, user_cache_key,
+)
+from backend.checks import check_replica_pin_cache
+from backend.checkout import CheckoutError, checkout
+from backend.events import format_timestamp, get_order_events, order_event
+from backend.fetcher import fetch_price_list
+from backend.importer import import_price_list, import_price_list_stream
+from backend.mail import claim_due_emails, queue_email, retry_delay, send_queued_emails
+from backend.management.commands import check_query_budgets
+from backend.management.commands.check_query_plans import hot_queries
+from backend.metrics import collect_metrics
+from backend.models import (
+    CatalogEntry, Category, Contact, DeviceToken, ImportJob, Order, OrderItem, OutgoingEmail, Parameter,
+    PriceListSource, Product, ProductInfo, ProductParameter, Shop, User,
+)
+from backend.pagination import EstimatedCountPaginator
+from backend.parsers import PriceListError, iter_json, iter_price_list
+from backend.renderers import UJSONRenderer
+from backend.routers import RoutingState, _state, health
+from backend.search import get_search_backend
+from backend.serializers import OrderSerializer
+from backend.tasks import PROGRESS_KEY, get_job_progress, progress_cache, prune_device_tokens_task
+from backend.views import (
+    ORDERED_ITEMS_PREFETCH, BasketView, CategoryView, OrderView, ProductInfoView, ShopView,
+)
+
+PRICE_LIST = os.path.join(settings.BASE_DIR, 'data', 'shop1.yaml')
+
+
+def price_list_upload(content=None, name='shop1.yaml'):
+    if content is None:
+        with open(PRICE_LIST, 'rb') as stream:
+            content = stream.read()
+    return SimpleUploadedFile(name, content, content_type='application/x-yaml')
+
+
+class ImportJobTests(TestCase):
+    """
+    Фоновый импорт прайс-листа с брокером memory:// (задачи выполняются сразу)
+    """
+
+    def setUp(self):
+        # Загруженные прайс-листы пишутся во временный каталог, а не в media проекта
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/partner/update', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        return self.client.get(f'/api/v1/partner/update/{response.json()["job"]}').json()
+
+    def test_import_done_with_counts(self):
+        status = self.upload(price_list_upload())
+
+        self.assertEqual(status['phase'], ImportJob.DONE)
+        offers = ProductInfo.objects.count()
+        self.assertGreater(offers, 0)
+        self.assertEqual(status['processed'], offers)
+        self.assertEqual(status['result']['created'], offers)
+        self.assertEqual(status['errors'], [])
+        # Файл удачно импортированного прайс-листа удаляется
+        self.assertEqual([files for _, _, files in os.walk(self.media_root) if files], [])
+
+        status = self.upload(price_list_upload())
+        self.assertEqual((status['result']['created'], status['result']['unchanged']), (0, offers))
+
+    def test_broken_file_fails(self):
+        status = self.upload(price_list_upload(b'shop: [unclosed'))
+
+        self.assertEqual(status['phase'], ImportJob.FAILED)
+        self.assertTrue(status['errors'])
+        self.assertEqual(ProductInfo.objects.count(), 0)
+
+    def test_progress_while_importing(self):
+        job = ImportJob.objects.create(user=self.user, url='http://example.com/shop.yaml', phase=ImportJob.IMPORTING)
+        self.assertEqual(get_job_progress(job), 0)
+        progress_cache().set(PROGRESS_KEY.format(job.id), 500)
+        self.addCleanup(progress_cache().delete, PROGRESS_KEY.format(job.id))
+        self.assertEqual(get_job_progress(job), 500)
+
+        job.phase, job.processed = ImportJob.DONE, 700
+        self.assertEqual(get_job_progress(job), 700)
+
+
+def price_list_goods(count, price=1000, start=0):
+    return [
+        {
+            'id': index, 'category': 1, 'model': f'model-{index}', 'name': f'Товар {index}',
+            'price': price, 'price_rrc': price + 100, 'quantity': 5,
+            'parameters': {'Цвет': 'красный', 'Номер': index},
+        }
+        for index in range(start, start + count)
+    ]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class PriceListImporterTests(TestCase):
+    """
+    Импорт с вычислением разницы: итоги по предложениям и число запросов на пачку
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+
+    def import_goods(self, goods, batch_size=1000):
+        data = {'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Товары'}], 'goods': goods}
+        return import_price_list(self.user, data, batch_size=batch_size).as_dict()
+
+    def import_queries(self, count, batch_size):
+        """
+        Число запросов импорта count новых позиций пачками по batch_size; импорт откатывается
+        """
+        with CaptureQueriesContext(connection) as queries, self.assertRaises(_Rollback):
+            with transaction.atomic():
+                self.import_goods(price_list_goods(count), batch_size)
+                raise _Rollback
+        return len(queries)
+
+    def test_diff_counts(self):
+        self.assertEqual(self.import_goods(price_list_goods(10)),
+                         {'created': 10, 'updated': 0, 'removed': 0, 'unchanged': 0, 'processed': 10})
+
+        goods = price_list_goods(8)
+        goods[0]['price'] = 900
+        goods[1]['parameters']['Цвет'] = 'синий'
+        goods += price_list_goods(2, start=100)
+        self.assertEqual(self.import_goods(goods),
+                         {'created': 2, 'updated': 1, 'removed': 2, 'unchanged': 7, 'processed': 10})
+
+        self.assertEqual(ProductInfo.objects.count(), 10)
+        offer = ProductInfo.objects.get(model='model-0')
+        self.assertEqual((offer.price, offer.catalog_entry.price), (900, 900))
+        self.assertEqual(
+            ProductInfo.objects.get(model='model-1').product_parameters.get(parameter__name='Цвет').value, 'синий'
+        )
+        self.assertFalse(ProductInfo.objects.filter(model__in=['model-8', 'model-9']).exists())
+
+    def test_queries_per_chunk_not_per_row(self):
+        per_chunk = self.import_queries(20, 10) - self.import_queries(10, 10)
+        self.assertEqual(self.import_queries(40, 10) - self.import_queries(20, 10), per_chunk * 2)
+        # Размер пачки на число запросов не влияет
+        self.assertEqual(self.import_queries(40, 40), self.import_queries(10, 10))
+
+
+class CatalogTests(TestCase):
+    """
+    Денормализованный каталог и кеш ответов списка товаров: импорт обновляет записи
+    и сменой версии каталога делает закешированные ответы недействительными
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        self.client = APIClient()
+
+    def import_goods(self, goods):
+        data = {'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Товары'}], 'goods': goods}
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(self.user, data)
+
+    def products(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/products', params)
+        self.assertEqual(response.status_code, 200)
+        return {item['model']: item for item in response.json()['results']}, len(queries)
+
+    def test_import_refreshes_entries_and_cached_pages(self):
+        self.import_goods(price_list_goods(3))
+        products, _ = self.products()
+        self.assertEqual(products['model-0'], {
+            'id': ProductInfo.objects.get(model='model-0').pk, 'model': 'model-0',
+            'product': {'name': 'Товар 0', 'category': 'Товары'}, 'shop': Shop.objects.get().pk,
+            'quantity': 5, 'price': 1000, 'price_rrc': 1100,
+        })
+        # Повторный запрос читает только версию каталога, страница берётся из кеша
+        self.assertEqual(self.products(), (products, 1))
+
+        goods = price_list_goods(2, price=900)
+        self.import_goods(goods)
+        products, queries = self.products()
+        self.assertGreater(queries, 1)
+        self.assertEqual(set(products), {'model-0', 'model-1'})
+        self.assertEqual(products['model-0']['price'], 900)
+        self.assertEqual(CatalogEntry.objects.count(), 2)
+
+    def test_catalog_follows_product_and_category_changes(self):
+        self.import_goods(price_list_goods(1))
+        self.products()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(name='Товар 0')
+            product.name = 'Новое название'
+            product.save()
+            category = Category.objects.get(pk=1)
+            category.name = 'Новая категория'
+            category.save()
+        products, _ = self.products()
+        self.assertEqual(products['model-0']['product'], {'name': 'Новое название', 'category': 'Новая категория'})
+
+    def test_other_shop_import_keeps_shop_scoped_page(self):
+        self.import_goods(price_list_goods(1))
+        shop = Shop.objects.get()
+        self.products(shop=shop.pk)
+
+        other = User.objects.create_user('other@example.com', 'password', type='shop', is_active=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(other, {'shop': 'Другой', 'categories': [{'id': 1, 'name': 'Товары'}],
+                                      'goods': price_list_goods(1, start=10)})
+        self.assertEqual(self.products(shop=shop.pk)[1], 1)
+        self.assertEqual(len(self.products()[0]), 2)
+
+    def test_conditional_get(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Смартфоны')
+        response = self.client.get('/api/v1/categories/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response['Cache-Control'].split(', ')),
+                         {'public', f'max-age={settings.CATALOG_HTTP_MAX_AGE}', 'must-revalidate'})
+
+        # 304 без выборки списка: читается только версия каталога
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual((response['ETag'], response['Last-Modified']), (etag, last_modified))
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.client.get('/api/v1/categories/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # ETag зависит от адреса запроса
+        self.assertNotEqual(self.client.get('/api/v1/categories/', {'page': 1})['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Телевизоры')
+        response = self.client.get('/api/v1/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_product_etag_changes_with_stock_interval(self):
+        self.import_goods(price_list_goods(1))
+        etag = self.client.get('/api/v1/products')['ETag']
+        self.assertEqual(self.client.get('/api/v1/products', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Остатки меняются без смены версии, ETag списка товаров живёт не дольше CATALOG_CACHE_TIMEOUT
+        with mock.patch('backend.views.time.time', return_value=time.time() + settings.CATALOG_CACHE_TIMEOUT):
+            response = self.client.get('/api/v1/products', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_error_response_without_validators(self):
+        response = self.client.get('/api/v1/products', {'shop': 'x', 'product__category': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class FacetTests(TestCase):
+    """
+    Фильтры по параметрам и сводка значений параметров (facets) в списке товаров
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        goods = []
+        for index, (category, color, memory) in enumerate([
+            (1, 'красный', 64), (1, 'красный', 128), (1, 'синий', 128), (1, 'зелёный', 256), (2, 'красный', None),
+        ]):
+            parameters = {'Цвет': color} if memory is None else {'Цвет': color, 'Память': memory}
+            goods.append({'category': category, 'model': f'model-{index}', 'name': f'Товар {index}',
+                          'price': 100, 'price_rrc': 110, 'quantity': 5, 'parameters': parameters})
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(user, {
+                'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Чехлы'}],
+                'goods': goods,
+            })
+        self.color = Parameter.objects.get(name='Цвет').pk
+        self.memory = Parameter.objects.get(name='Память').pk
+        self.client = APIClient()
+
+    def get(self, params):
+        response = self.client.get('/api/v1/products', params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        facets = {facet['name']: {item['value']: item['count'] for item in facet['values']}
+                  for facet in data.get('facets', [])}
+        return sorted(item['model'] for item in data['results']), facets
+
+    def test_precomputed_category_facets(self):
+        models, facets = self.get({'product__category': 1, 'facets': 1})
+        self.assertEqual(models, ['model-0', 'model-1', 'model-2', 'model-3'])
+        self.assertEqual(facets, {
+            'Цвет': {'красный': 2, 'синий': 1, 'зелёный': 1},
+            'Память': {'64': 1, '128': 2, '256': 1},
+        })
+        # Без категории - сумма по всем категориям
+        self.assertEqual(self.get({'facets': 1})[1]['Цвет'], {'красный': 3, 'синий': 1, 'зелёный': 1})
+        self.assertNotIn('facets', self.client.get('/api/v1/products').json())
+
+    def test_parameter_filters(self):
+        models, facets = self.get({'product__category': 1, f'param_{self.color}': 'красный', 'facets': 1})
+        self.assertEqual(models, ['model-0', 'model-1'])
+        # Значения выбранного параметра считаются без его собственного фильтра
+        self.assertEqual(facets, {
+            'Цвет': {'красный': 2, 'синий': 1, 'зелёный': 1},
+            'Память': {'64': 1, '128': 1},
+        })
+
+        # Значения одного параметра объединяются через ИЛИ, разные параметры - через И
+        params = {f'param_{self.color}': ['красный', 'синий'], f'param_{self.memory}': '128'}
+        self.assertEqual(self.get(params)[0], ['model-1', 'model-2'])
+        self.assertEqual(self.get({f'param_{self.color}': 'красный'})[0], ['model-0', 'model-1', 'model-4'])
+        self.assertEqual(self.get({f'param_{self.color}': ''})[0], [f'model-{index}' for index in range(5)])
+
+    def test_live_facets_match_precomputed(self):
+        precomputed = self.get({'product__category': 1, 'facets': 1})[1]
+        # Фильтр по магазину считает сводку по выборке, а не по CategoryFacet
+        live = self.get({'product__category': 1, 'shop': Shop.objects.get().pk, 'facets': 1})[1]
+        self.assertEqual(live, precomputed)
+
+
+class UJSONRendererTests(TestCase):
+    """
+    UJSONRenderer отдаёт те же байты, что и JSONRenderer
+    """
+
+    def test_same_output_as_json_renderer(self):
+        plain = {
+            'name': 'Смартфон "Apple" / iPhone\u2028\u2029',
+            'values': [0, -1, 2 ** 53, True, False, None, 'a\\b\n'],
+            'nested': {'empty': [], 'object': {}, 'key with spaces': '\t'},
+        }
+        # Обычные ответы кодирует сам ujson, без обращения к JSONRenderer
+        expected = JSONRenderer().render(plain)
+        with mock.patch.object(JSONRenderer, 'render') as fallback:
+            self.assertEqual(UJSONRenderer().render(plain), expected)
+        fallback.assert_not_called()
+
+        data = {**plain, 'price': Decimal('12.50'), 'dt': timezone.now()}
+        self.assertEqual(UJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(UJSONRenderer().render(None), JSONRenderer().render(None))
+        # С отступами выводит JSONRenderer
+        media_type = 'application/json; indent=2'
+        self.assertEqual(UJSONRenderer().render(data, media_type), JSONRenderer().render(data, media_type))
+
+    def test_catalog_lists(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(user, {
+                'shop': 'Магазин "Связной"', 'categories': [{'id': 1, 'name': 'Смартфоны/Аксессуары'}],
+                'goods': price_list_goods(3),
+            })
+        client = APIClient()
+        for url in ('/api/v1/products', '/api/v1/categories/', '/api/v1/shops/'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIsInstance(response.accepted_renderer, UJSONRenderer)
+                self.assertEqual(response.content, JSONRenderer().render(response.json()))
+
+
+class PriceListParserTests(TestCase):
+    """
+    Потоковый разбор YAML и JSON совпадает с загрузкой документа целиком
+    """
+
+    def setUp(self):
+        with open(PRICE_LIST, 'rb') as stream:
+            self.data = yaml.safe_load(stream)
+
+    def expected(self, data):
+        entries = []
+        for key, value in data.items():
+            if key in ('categories', 'goods'):
+                entries.extend((key, item) for item in value)
+            else:
+                entries.append((key, value))
+        return entries
+
+    def test_yaml_matches_full_load(self):
+        with open(PRICE_LIST, 'rb') as stream:
+            self.assertEqual(list(iter_price_list(stream, 'yaml')), self.expected(self.data))
+
+    def test_json_matches_full_load(self):
+        raw = json.dumps(self.data, ensure_ascii=False, indent=1).encode()
+        self.assertEqual(list(iter_price_list(io.BytesIO(raw), 'json')), self.expected(self.data))
+        # Маленький буфер: значения и числа разрываются на границах чтения
+        self.assertEqual(list(iter_json(io.BytesIO(raw), chunk_size=7)), self.expected(self.data))
+
+    def test_sections_in_any_order(self):
+        data = {'goods': self.data['goods'][:2], 'shop': 'Магазин', 'categories': self.data['categories']}
+        self.assertEqual(list(iter_json(io.StringIO(json.dumps(data)), chunk_size=5)), self.expected(data))
+        self.assertEqual(list(iter_price_list(io.StringIO(yaml.safe_dump(data, allow_unicode=True, sort_keys=False)), 'yaml')),
+                         self.expected(data))
+
+    def test_shop_not_first_rejected_by_import(self):
+        user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        data = {'categories': self.data['categories'], 'shop': 'Магазин', 'goods': self.data['goods']}
+        for fmt, raw in (('json', json.dumps(data)), ('yaml', yaml.safe_dump(data, allow_unicode=True, sort_keys=False))):
+            with self.subTest(fmt), self.assertRaisesMessage(PriceListError, 'ключа shop'):
+                import_price_list_stream(user, io.StringIO(raw), fmt)
+        self.assertFalse(Shop.objects.exists())
+        self.assertFalse(ProductInfo.objects.exists())
+
+    def test_broken_documents(self):
+        for fmt, raw in (('json', '{"shop": "Магазин", "goods": [{"id": 1'), ('yaml', 'shop: Магазин\n- goods')):
+            with self.subTest(fmt), self.assertRaises((PriceListError, ValueError, yaml.YAMLError)):
+                list(iter_price_list(io.StringIO(raw), fmt))
+        with self.assertRaisesMessage(PriceListError, 'словарём'):
+            list(iter_price_list(io.StringIO('- shop'), 'yaml'))
+
+
+class PriceListHandler(BaseHTTPRequestHandler):
+    """
+    Прайс-лист на локальном сервере: ETag отдаётся, если он задан у сервера
+    """
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.server.etag and self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-yaml')
+        if self.server.etag:
+            self.send_header('ETag', self.server.etag)
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PriceListFetchTests(TestCase):
+    """
+    Загрузка прайс-листа по URL: условный GET, 304 и пропуск неизменившегося содержимого
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PriceListHandler)
+        with open(PRICE_LIST, 'rb') as stream:
+            self.server.body = stream.read()
+        self.server.etag = '"v1"'
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/shop1.yaml'
+        self.user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def import_url(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/partner/update', {'url': self.url}, format='json')
+        return self.client.get(f'/api/v1/partner/update/{response.json()["job"]}').json()
+
+    def test_conditional_get(self):
+        status = self.import_url()
+        self.assertEqual(status['phase'], ImportJob.DONE)
+        self.assertGreater(status['result']['created'], 0)
+        self.assertNotIn('If-None-Match', self.server.requests[-1])
+
+        status = self.import_url()
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], '"v1"')
+        self.assertEqual(status['result'], {'not_modified': True, 'processed': 0})
+        self.assertIsNotNone(PriceListSource.objects.get(user=self.user).checked_at)
+
+    def test_unchanged_content_skipped_by_hash(self):
+        self.server.etag = None
+        self.import_url()
+        source = PriceListSource.objects.get(user=self.user)
+        self.assertTrue(source.content_hash)
+
+        fetched = fetch_price_list(source)
+        self.assertTrue(fetched.not_modified)
+        status = self.import_url()
+        self.assertEqual(status['result'], {'not_modified': True, 'processed': 0})
+
+        self.server.body += b'\n'
+        fetched = fetch_price_list(source)
+        self.assertFalse(fetched.not_modified)
+        fetched.stream.close()
+
+
+class KeysetCursorTests(TestCase):
+    """
+    Подделанный курсор постраничного вывода даёт 404, а не ошибку сервера
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_products(self, data):
+        cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        return self.client.get('/api/v1/products', {'pagination': 'cursor', 'cursor': cursor})
+
+    def test_tampered_cursor(self):
+        for data in (
+            {'o': 'price', 'p': None, 'r': 0},
+            {'o': 5, 'p': [1, 1], 'r': 0},
+            {'o': 'price', 'p': ['x', 'y'], 'r': 0},
+            {'o': 'price', 'p': [[1], 2], 'r': 0},
+            {'o': 'price', 'p': [1], 'r': 0},
+            {'o': 'name', 'p': [1, 1], 'r': 0},
+            ['price', [1, 1]],
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.get_products(data).status_code, 404)
+        response = self.client.get('/api/v1/products', {'pagination': 'cursor', 'cursor': 'not-base64!'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_valid_cursor(self):
+        response = self.get_products({'o': 'price', 'p': [100, 1], 'r': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+
+class SearchTests(TestCase):
+    """
+    Поиск по каталогу через индекс SQLite FTS5
+    """
+
+    def setUp(self):
+        # Версия каталога в тестах не меняется, страницы других тестов в кеше совпали бы по ключу
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.shop = Shop.objects.create(name='Магазин', state=True)
+        self.category = Category.objects.create(name='Смартфоны')
+        self.backend = get_search_backend()
+        self.client = APIClient()
+
+    def offer(self, name, model):
+        product = Product.objects.create(name=name, category=self.category)
+        return ProductInfo.objects.create(
+            product=product, shop=self.shop, model=model, quantity=5, price=100, price_rrc=120
+        )
+
+    def test_deleted_offer_removed_from_index(self):
+        offer = self.offer('Смартфон Apple iPhone', 'iphone-15')
+        self.assertEqual(self.backend.search('iphone', 10), [offer.pk])
+
+        offer.delete()
+        self.assertEqual(self.backend.search('iphone', 10), [])
+
+    def test_prefix_and_all_words(self):
+        iphone = self.offer('Смартфон Apple iPhone XR', 'apple/iphone/xr')
+        galaxy = self.offer('Смартфон Samsung Galaxy S10', 'samsung/galaxy/s10')
+        tv = self.offer('Телевизор Samsung QLED', 'samsung/qled')
+
+        self.assertEqual(set(self.backend.search('samsung', 10)), {galaxy.pk, tv.pk})
+        # Каждое слово ищется по префиксу, без учёта регистра, и должны совпасть все слова
+        self.assertEqual(set(self.backend.search('смарт', 10)), {iphone.pk, galaxy.pk})
+        self.assertEqual(self.backend.search('SAMS gal', 10), [galaxy.pk])
+        self.assertEqual(self.backend.search('смартфон qled', 10), [])
+        self.assertEqual(self.backend.search('  !! ', 10), [])
+
+    def test_ranked_by_name_then_model_then_parameters(self):
+        by_param = self.offer('Наушники', 'buds')
+        ProductParameter.objects.create(
+            product_info=by_param, parameter=Parameter.objects.create(name='Совместимость'), value='Galaxy'
+        )
+        self.backend.index([by_param.pk])
+        by_model = self.offer('Смартфон', 'galaxy-a50')
+        by_name = self.offer('Смартфон Galaxy S10', 's10')
+        self.assertEqual(self.backend.search('galaxy', 10), [by_name.pk, by_model.pk, by_param.pk])
+
+    def search_names(self, query):
+        response = self.client.get('/api/v1/products', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['product']['name'] for item in response.json()['results']]
+
+    def test_products_search(self):
+        self.offer('Смартфон Samsung Galaxy S10', 'samsung/galaxy/s10')
+        self.offer('Телевизор Samsung QLED', 'samsung/qled')
+        self.assertEqual(self.search_names('samsung gal'), ['Смартфон Samsung Galaxy S10'])
+        self.assertEqual(len(self.search_names('')), 2)
+
+        # Без FTS5 поиск идёт по подстрокам названия, все слова должны встретиться
+        with override_settings(SEARCH_BACKEND='backend.search.DatabaseSearchBackend'):
+            self.assertEqual(self.search_names('sung QLED'), ['Телевизор Samsung QLED'])
+            self.assertEqual(len(self.search_names('samsung')), 2)
+            self.assertEqual(self.search_names('samsung iphone'), [])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    """
+    Очередь писем: повтор по dedup_key, задержка повторов, одна пачка - одному обработчику
+    """
+
+    def test_dedup_key(self):
+        first = queue_email('Заказ', 'текст', ['a@example.com'], dedup_key='order:1:customer')
+        second = queue_email('Заказ', 'другой текст', ['a@example.com'], dedup_key='order:1:customer')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+    def test_sent_after_commit_without_broker(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                queue_email('Тема', 'текст', ['a@example.com'])
+            self.assertEqual(mail.outbox, [])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.SENT)
+
+    def test_not_sent_after_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                queue_email('Тема', 'текст', ['a@example.com'])
+                raise RuntimeError
+        self.assertEqual((callbacks, mail.outbox), ([], []))
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=False)
+    def test_one_dispatch_per_transaction(self):
+        with mock.patch('backend.tasks.send_queued_emails_task.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    queue_email('Тема', 'текст', ['a@example.com'])
+                    queue_email('Тема', 'текст', ['b@example.com'])
+            self.assertEqual(len(callbacks), 1)
+            self.assertEqual(delay.call_count, 1)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=False)
+    def test_dispatch_after_savepoint_rollback(self):
+        with mock.patch('backend.tasks.send_queued_emails_task.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    with self.assertRaises(RuntimeError), transaction.atomic():
+                        queue_email('Тема', 'текст', ['a@example.com'])
+                        raise RuntimeError
+                    queue_email('Тема', 'текст', ['b@example.com'])
+            self.assertEqual(len(callbacks), 1)
+            self.assertEqual(delay.call_count, 1)
+
+    def test_retry_backoff(self):
+        email = queue_email('Тема', 'текст', ['a@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            self.assertEqual(send_queued_emails(), 0)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), (OutgoingEmail.PENDING, 1, 'down'))
+        self.assertGreaterEqual(email.next_attempt_at - email.created_at, retry_delay(1))
+        self.assertLess(retry_delay(1), retry_delay(2))
+        # Повтор ещё не наступил
+        self.assertEqual(send_queued_emails(), 0)
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_emails(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.SENT, 2))
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1)
+    def test_failed_after_max_attempts(self):
+        email = queue_email('Тема', 'текст', ['a@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            send_queued_emails()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.FAILED)
+
+    def test_claim_exclusive(self):
+        for index in range(5):
+            queue_email('Тема', 'текст', [f'user{index}@example.com'])
+        first = claim_due_emails(3)
+        second = claim_due_emails(10)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({email.pk for email in first} & {email.pk for email in second})
+        self.assertEqual(claim_due_emails(10), [])
+
+        # Письма, зависшие у упавшего обработчика, забираются снова после EMAIL_OUTBOX_CLAIM_TIMEOUT
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in first]).update(
+            claimed_at=timezone.now() - timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT + 1)
+        )
+        self.assertEqual(len(claim_due_emails(10)), 3)
+
+
+class BasketTests(TestCase):
+    """
+    Запись позиций корзины
+    """
+
+    def setUp(self):
+        shop = Shop.objects.create(name='Магазин', state=True)
+        product = Product.objects.create(name='Смартфон', category=Category.objects.create(name='Смартфоны'))
+        self.offers = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, model=f'phone-{index}', quantity=10, price=1000, price_rrc=1200)
+            for index in range(5)
+        ])
+        self.user = User.objects.create_user('buyer@example.com', 'password', is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def changed_since(self, since):
+        response = self.client.get('/api/v1/order/', {'since': format_timestamp(since)})
+        return [order['state'] for order in response.json()]
+
+    def test_edit_marks_basket_changed(self):
+        basket = Order.objects.create(user=self.user, state='basket')
+        since = basket.updated_at
+        self.assertEqual(self.changed_since(since), [])
+
+        events = get_order_events()
+        with mock.patch.object(events, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/basket', {'items': [{'product_info': self.offers[0].pk, 'quantity': 2}]},
+                             format='json')
+        self.assertEqual(self.changed_since(since), ['basket'])
+        basket.refresh_from_db()
+        publish.assert_called_once_with(self.user.pk, order_event(basket.pk, 'basket', basket.updated_at))
+
+        since = basket.updated_at
+        self.client.delete('/api/v1/basket', {'items': [self.offers[1].pk]}, format='json')
+        self.assertEqual(self.changed_since(since), [])
+        self.client.delete('/api/v1/basket', {'items': [self.offers[0].pk]}, format='json')
+        self.assertEqual(self.changed_since(since), ['basket'])
+
+    def request_queries(self, method, items):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)('/api/v1/basket', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_lines(self):
+        Order.objects.create(user=self.user, state='basket')
+        one = self.request_queries('post', [{'product_info': self.offers[0].pk, 'quantity': 1}])
+        # Новые и уже лежащие в корзине позиции записываются одним upsert
+        lines = [{'product_info': offer.pk, 'quantity': 2} for offer in self.offers]
+        self.assertEqual(self.request_queries('post', lines), one)
+        self.assertEqual(
+            dict(OrderItem.objects.values_list('product_info', 'quantity')), {offer.pk: 2 for offer in self.offers}
+        )
+
+        one = self.request_queries('delete', [self.offers[0].pk])
+        self.assertEqual(self.request_queries('delete', [offer.pk for offer in self.offers[1:]]), one)
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_invalid_line_rejects_whole_request(self):
+        response = self.client.post('/api/v1/basket', {'items': [
+            {'product_info': self.offers[0].pk, 'quantity': 1},
+            {'product_info': self.offers[1].pk, 'quantity': 11},
+            {'product_info': 0, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([item['product_info'] for item in response.json()['Items']], [self.offers[1].pk, 0])
+        self.assertFalse(OrderItem.objects.exists())
+
+
+async def read_stream(response):
+    return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+
+class OrderEventsTests(TestCase):
+    """
+    Поток изменений заказов order/events
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer@example.com', 'password', is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_changes_since_under_wsgi(self):
+        now = timezone.now()
+        old = Order.objects.create(user=self.user, state='delivered')
+        Order.objects.filter(pk=old.pk).update(updated_at=now - timedelta(hours=1))
+        new = Order.objects.create(user=self.user, state=Order.NEW)
+        basket = Order.objects.create(user=self.user, state='basket')
+        since = format_timestamp(now - timedelta(minutes=1))
+        expected = 'retry: 3000\n\n' + ''.join(
+            sse_event(order_event(order.pk, order.state, order.updated_at))
+            for order in Order.objects.filter(pk__in=[new.pk, basket.pk]).order_by('updated_at')
+        )
+
+        # Под WSGI поток отдаёт пропущенные изменения и закрывается
+        response = self.client.get('/api/v1/order/events', {'since': since})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(async_to_sync(read_stream)(response), expected)
+
+        response = self.client.get('/api/v1/order/events', HTTP_LAST_EVENT_ID=since)
+        self.assertEqual(async_to_sync(read_stream)(response), expected)
+        response = self.client.get('/api/v1/order/events')
+        self.assertEqual(async_to_sync(read_stream)(response), 'retry: 3000\n\n')
+
+    def test_invalid_requests(self):
+        response = self.client.get('/api/v1/order/events', {'since': 'вчера'})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.content.decode().startswith('event: error\n'))
+        self.assertEqual(APIClient().get('/api/v1/order/events').status_code, 401)
+
+    def test_live_events(self):
+        self.enterContext(override_settings(
+            ORDER_EVENTS={**settings.ORDER_EVENTS, 'HEARTBEAT': 0.05, 'STREAM_TIMEOUT': 0.3},
+        ))
+        events = get_order_events()
+        event = order_event(1, Order.NEW, timezone.now())
+
+        async def listen():
+            stream = OrderEventsView().stream(self.user.pk, None, keep_open=True)
+            chunks = [await anext(stream)]
+            events.publish(self.user.pk, event)
+            chunks.append(await anext(stream))
+            # Повтор уже отданного события и события чужих заказов в поток не попадают
+            events.publish(self.user.pk, event)
+            events.publish(self.user.pk + 1, order_event(2, Order.NEW, timezone.now()))
+            chunks.append(await anext(stream))
+            self.assertEqual(events.subscribers(), 1)
+            rest = [chunk async for chunk in stream]
+            return chunks, rest
+
+        chunks, rest = async_to_sync(listen)()
+        self.assertEqual(chunks, ['retry: 3000\n\n', sse_event(event), ': ping\n\n'])
+        self.assertTrue(rest)
+        self.assertEqual(set(rest), {': ping\n\n'})
+        # По истечении STREAM_TIMEOUT поток закрывается и снимает подписку
+        self.assertEqual(events.subscribers(), 0)
+
+
+class OrderTotalTests(TestCase):
+    """
+    Суммы заказов считаются в базе: аннотацией with_total() или одним агрегирующим запросом
+    """
+
+    def setUp(self):
+        shop = Shop.objects.create(name='Магазин', state=True)
+        product = Product.objects.create(name='Смартфон', category=Category.objects.create(name='Смартфоны'))
+        self.offers = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, model=f'phone-{index}', quantity=10, price=price, price_rrc=price)
+            for index, price in enumerate((100, 250))
+        ])
+        self.user = User.objects.create_user('buyer@example.com', 'password', is_active=True)
+        self.basket = Order.objects.create(user=self.user, state='basket')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=self.basket, product_info=self.offers[0], quantity=3),
+            OrderItem(order=self.basket, product_info=self.offers[1], quantity=2),
+        ])
+        # Оформленный заказ: цена из снимка, сумма сохранена при оформлении
+        self.placed = Order.objects.create(user=self.user, state=Order.NEW, total_sum=120)
+        OrderItem.objects.create(order=self.placed, product_info=self.offers[0], quantity=1, price=120)
+
+    def test_totals_computed_in_database(self):
+        with self.assertNumQueries(1):
+            totals = dict(Order.objects.with_total().values_list('state', 'total'))
+        self.assertEqual(totals, {'basket': 800, Order.NEW: 120})
+        with self.assertNumQueries(1):
+            self.assertEqual(self.basket.calculate_total(), 800)
+        empty = Order.objects.create(user=self.user, state='basket')
+        self.assertEqual(empty.calculate_total(), 0)
+
+        # Корзина следует за ценами каталога, оформленный заказ - нет
+        ProductInfo.objects.filter(pk=self.offers[0].pk).update(price=200)
+        self.assertEqual(dict(Order.objects.with_total().values_list('id', 'total')),
+                         {self.basket.pk: 1100, self.placed.pk: 120, empty.pk: 0})
+        self.assertEqual(self.placed.calculate_total(), 120)
+
+    def test_serializer_reads_annotation(self):
+        orders = list(Order.objects.with_total().prefetch_related(ORDERED_ITEMS_PREFETCH).order_by('id'))
+        with self.assertNumQueries(0):
+            data = OrderSerializer(orders, many=True).data
+        self.assertEqual([order['total_sum'] for order in data], [800, 120])
+
+
+class PartnerOrdersTests(TestCase):
+    """
+    Заказы поставщика: только позиции его магазинов и их сумма из снимка
+    """
+
+    def setUp(self):
+        self.partner = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        self.shops = [Shop.objects.create(name=f'Магазин {index}', user=self.partner) for index in range(2)]
+        other_shop = Shop.objects.create(name='Чужой магазин')
+        buyer = User.objects.create_user('buyer@example.com', 'password', is_active=True)
+
+        self.new = Order.objects.create(user=buyer, state=Order.NEW)
+        self.sent = Order.objects.create(user=buyer, state='sent')
+        basket = Order.objects.create(user=buyer, state='basket')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=self.new, shop=self.shops[0], quantity=2, price=100, product_name='Смартфон', model='a'),
+            OrderItem(order=self.new, shop=self.shops[1], quantity=1, price=500, product_name='Чехол', model='b',
+                      shop_name='Магазин 1'),
+            OrderItem(order=self.new, shop=other_shop, quantity=1, price=900, product_name='Наушники', model='c'),
+            OrderItem(order=self.sent, shop=self.shops[0], quantity=3, price=10, product_name='Кабель', model='d'),
+            OrderItem(order=basket, shop=self.shops[0], quantity=1),
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.partner)
+
+    def orders(self, **params):
+        response = self.client.get('/api/v1/partner/orders', params)
+        self.assertEqual(response.status_code, 200)
+        return {order['id']: order for order in response.json()}
+
+    def test_only_partner_lines(self):
+        orders = self.orders()
+        self.assertEqual(set(orders), {self.new.pk, self.sent.pk})
+        self.assertEqual(orders[self.new.pk]['total_sum'], 700)
+        self.assertEqual(sorted(item['product_info']['model'] for item in orders[self.new.pk]['ordered_items']),
+                         ['a', 'b'])
+        self.assertEqual(orders[self.sent.pk]['total_sum'], 30)
+
+    def test_filter_by_shop_and_state(self):
+        orders = self.orders(shop=self.shops[1].pk)
+        self.assertEqual(set(orders), {self.new.pk})
+        self.assertEqual(orders[self.new.pk]['total_sum'], 500)
+        self.assertEqual([item['product_info']['shop_name'] for item in orders[self.new.pk]['ordered_items']],
+                         ['Магазин 1'])
+
+        self.assertEqual(set(self.orders(state='sent')), {self.sent.pk})
+        self.assertEqual(self.orders(shop=self.shops[1].pk, state='sent'), {})
+
+    def test_invalid_requests(self):
+        response = self.client.get('/api/v1/partner/orders', {'shop': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+        buyer = APIClient()
+        buyer.force_authenticate(User.objects.get(email='buyer@example.com'))
+        self.assertEqual(buyer.get('/api/v1/partner/orders').status_code, 403)
+
+
+class AsyncViewTests(TestCase):
+    """
+    Асинхронные представления (ASYNC_VIEWS=True) отвечают так же, как синхронные
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        shop_user = User.objects.create_user('shop@example.com', 'password', type='shop', is_active=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_price_list(shop_user, {
+                'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Товары'}], 'goods': price_list_goods(3),
+            })
+        self.offers = list(ProductInfo.objects.order_by('id'))
+        self.user = User.objects.create_user('buyer@example.com', 'password', is_active=True)
+        self.factory = APIRequestFactory()
+
+    def call(self, view_class, method='get', path='/', data=None, user=None, **extra):
+        request = getattr(self.factory, method)(path, data, format='json' if method != 'get' else None, **extra)
+        if user is not None:
+            force_authenticate(request, user=user)
+        view = view_class.as_view()
+        response = async_to_sync(view)(request) if view_class.view_is_async else view(request)
+        # 304 отдаётся обычным HttpResponse без рендеринга
+        return response.render() if hasattr(response, 'render') else response
+
+    def test_catalog_lists(self):
+        for sync_view, async_view in ((ProductInfoView, AsyncProductInfoView), (CategoryView, AsyncCategoryView),
+                                      (ShopView, AsyncShopView)):
+            with self.subTest(view=sync_view.__name__):
+                expected = self.call(sync_view)
+                response = self.call(async_view)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response['ETag'], expected['ETag'])
+
+                with self.assertNumQueries(1):
+                    response = self.call(async_view, HTTP_IF_NONE_MATCH=expected['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+        # Повторный запрос страницы товаров отдаётся из кеша после чтения версии каталога
+        with self.assertNumQueries(1):
+            response = self.call(AsyncProductInfoView)
+        self.assertEqual(response.data['count'], 3)
+
+    def test_basket_and_orders(self):
+        response = self.call(AsyncBasketView, user=self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ordered_items'], [])
+
+        response = self.call(AsyncBasketView, 'post', data={'items': [
+            {'product_info': offer.pk, 'quantity': 2} for offer in self.offers
+        ]}, user=self.user)
+        self.assertEqual(response.data['Status'], True)
+        response = self.call(AsyncBasketView, 'delete', data={'items': [self.offers[0].pk]}, user=self.user)
+        self.assertEqual(response.data['Deleted'], 1)
+
+        basket = self.call(AsyncBasketView, user=self.user)
+        self.assertEqual(basket.content, self.call(BasketView, user=self.user).content)
+        self.assertEqual(basket.data['total_sum'], 4000)
+        self.assertEqual(self.call(AsyncOrderView, user=self.user).content, self.call(OrderView, user=self.user).content)
+
+    def test_authentication_errors(self):
+        for view_class in (AsyncBasketView, AsyncOrderView):
+            with self.subTest(view=view_class.__name__):
+                self.assertEqual(self.call(view_class).status_code, 401)
+
+
+class AdminChangelistTests(TestCase):
+    """
+    Списки админки по большим таблицам: связанные объекты выбираются соединением,
+    а число строк без фильтров оценивается вместо COUNT(*)
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin@example.com', 'password')
+        self.client.force_login(self.admin)
+
+    def create_orders(self, count, start=0):
+        users = User.objects.bulk_create([
+            User(email=f'buyer{index}@example.com', is_active=True) for index in range(start, start + count)
+        ])
+        Order.objects.bulk_create([Order(user=user, state=Order.NEW) for user in users])
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/backend/order/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.create_orders(3)
+        _, few = self.changelist()
+        self.create_orders(20, start=3)
+        response, many = self.changelist()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(response.context['cl'].result_count, 23)
+
+    def test_estimated_count_without_filters(self):
+        self.create_orders(5)
+        self.enterContext(mock.patch.object(EstimatedCountPaginator, 'threshold', 2))
+        response, queries = self.changelist()
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql and 'backend_order' in sql])
+        self.assertEqual(response.context['cl'].result_count, Order.objects.order_by('-pk').first().pk)
+
+        # С фильтром считаются только отобранные строки, без COUNT(*) по всей таблице
+        Order.objects.filter(pk=Order.objects.first().pk).update(state='sent')
+        response, queries = self.changelist(state__exact='sent')
+        counts = [sql for sql in queries if 'COUNT(' in sql and 'backend_order' in sql]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('WHERE', counts[0])
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class CheckoutTests(TransactionTestCase):
+    """
+    Оформление заказа с резервированием: конкурирующие покупки, повторное оформление, отмена
+    """
+
+    def setUp(self):
+        self.shop = Shop.objects.create(name='Магазин')
+        product = Product.objects.create(name='Смартфон', category=Category.objects.create(name='Смартфоны'))
+        self.offer = ProductInfo.objects.create(
+            product=product, shop=self.shop, model='phone', quantity=1, price=1000, price_rrc=1200
+        )
+
+    def buyer(self, index, quantity=1):
+        user = User.objects.create_user(f'buyer{index}@example.com', 'password', is_active=True)
+        contact = Contact.objects.create(user=user, city='Москва', street='Ленина', phone='1')
+        basket = Order.objects.create(user=user, state='basket')
+        OrderItem.objects.create(order=basket, product_info=self.offer, shop=self.shop, quantity=quantity)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client, contact
+
+    def checkout(self, client, contact):
+        return client.post('/api/v1/order/', {'contact': contact.id}, format='json')
+
+    def test_competing_checkouts_for_last_unit(self):
+        buyers = [self.buyer(index) for index in range(2)]
+        barrier = threading.Barrier(len(buyers))
+
+        def place(buyer):
+            barrier.wait()
+            try:
+                return self.checkout(*buyer)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(len(buyers)) as executor:
+            responses = list(executor.map(place, buyers))
+
+        self.assertEqual(sorted(response.status_code for response in responses), [200, 409])
+        rejected = next(response for response in responses if response.status_code == 409).json()
+        self.assertEqual(rejected['short'], [{'product_info': self.offer.id, 'requested': 1, 'available': 0}])
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.quantity, 0)
+        self.assertEqual(Order.objects.filter(state=Order.NEW).count(), 1)
+
+    def test_double_checkout(self):
+        client, contact = self.buyer(0)
+        ProductInfo.objects.filter(pk=self.offer.pk).update(quantity=5)
+        basket = Order.objects.get(state='basket')
+
+        self.assertEqual(self.checkout(client, contact).status_code, 200)
+        with self.assertRaisesMessage(CheckoutError, 'Корзина уже оформлена'):
+            checkout(basket, contact)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.quantity, 4)
+
+    def test_checkout_with_deleted_offer(self):
+        client, contact = self.buyer(0)
+        other = ProductInfo.objects.create(
+            product=self.offer.product, shop=self.shop, model='phone-2', quantity=5, price=500, price_rrc=600
+        )
+        basket = Order.objects.get(state='basket')
+        OrderItem.objects.create(order=basket, product_info=other, shop=self.shop, quantity=1)
+        other.delete()
+
+        response = self.checkout(client, contact)
+        self.assertEqual(response.status_code, 409)
+        basket.refresh_from_db()
+        self.assertEqual(basket.state, 'basket')
+        self.assertEqual(list(basket.ordered_items.values_list('product_info', flat=True)), [self.offer.pk])
+        # После очистки корзины заказ оформляется
+        self.assertEqual(self.checkout(client, contact).status_code, 200)
+        self.assertEqual(list(Order.objects.get(pk=basket.pk).ordered_items.values_list('product_name', flat=True)),
+                         ['Смартфон'])
+
+    def test_order_list_shape(self):
+        client, contact = self.buyer(0)
+        ProductInfo.objects.filter(pk=self.offer.pk).update(quantity=5)
+        self.assertEqual(self.checkout(client, contact).status_code, 200)
+        basket = Order.objects.create(user=contact.user, state='basket')
+        OrderItem.objects.create(order=basket, product_info=self.offer, shop=self.shop, quantity=2)
+        # Изменения каталога после оформления не видны в заказе, но видны в корзине
+        ProductInfo.objects.filter(pk=self.offer.pk).update(price=1500)
+
+        orders = {order['state']: order for order in client.get('/api/v1/order/').json()}
+        self.assertEqual(set(orders), {'new', 'basket'})
+        self.assertEqual(orders['new']['ordered_items'], [{
+            'product_info': {'id': self.offer.pk, 'model': 'phone', 'product': {'name': 'Смартфон', 'category': None},
+                             'shop': self.shop.pk, 'shop_name': self.shop.name,
+                             'quantity': None, 'price': 1000, 'price_rrc': None},
+            'quantity': 1,
+        }])
+        self.assertEqual(orders['new']['total_sum'], 1000)
+        self.assertEqual(orders['basket']['ordered_items'][0]['product_info'], {
+            'id': self.offer.pk, 'model': 'phone', 'product': {'name': 'Смартфон', 'category': 'Смартфоны'},
+            'shop': self.shop.pk, 'shop_name': self.shop.name, 'quantity': 4, 'price': 1500, 'price_rrc': 1200,
+        })
+        self.assertEqual(orders['basket']['total_sum'], 3000)
+
+        self.offer.delete()
+        orders = {order['state']: order for order in client.get('/api/v1/order/').json()}
+        self.assertEqual(orders['new']['ordered_items'][0]['product_info']['id'], None)
+        self.assertEqual(orders['new']['ordered_items'][0]['product_info']['product'],
+                         {'name': 'Смартфон', 'category': None})
+
+    def test_cancel_returns_stock(self):
+        client, contact = self.buyer(0)
+        self.assertEqual(self.checkout(client, contact).status_code, 200)
+        order = Order.objects.get(state=Order.NEW)
+
+        response = client.post(f'/api/v1/order/{order.id}/cancel')
+        self.assertEqual(response.status_code, 200)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.quantity, 1)
+        self.assertEqual(client.post(f'/api/v1/order/{order.id}/cancel').status_code, 409)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.quantity, 1)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tokens'},
+})
+class TokenCacheTests(TestCase):
+    """
+    Кеш токенов: в общем кеше только поля токена, пользователь - в памяти процесса
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('cached@example.com', 'password', is_active=True)
+        self.key = Token.objects.create(user=self.user).key
+        patcher = mock.patch.object(token_cache, 'shared_alias', 'tokens')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.client = APIClient(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def test_shared_cache_holds_token_fields_only(self):
+        self.assertEqual(self.client.get('/api/v1/user/contact/').status_code, 200)
+
+        shared = token_cache.shared
+        self.assertEqual(shared.get(token_cache_key(self.key)), CachedToken(self.key, self.user.pk, mock.ANY))
+        self.assertIsNone(shared.get(token_cache_key(user_cache_key(self.user.pk))))
+
+        # Другой процесс: токен из общего кеша, пользователь - одним запросом по первичному ключу
+        token_cache.clear()
+        authentication = CachedTokenAuthentication()
+        with self.assertNumQueries(1):
+            user, token = authentication.authenticate_credentials(self.key)
+        self.assertEqual((user, token.key), (self.user, self.key))
+        with self.assertNumQueries(0):
+            authentication.authenticate_credentials(self.key)
+
+    def test_deactivated_user_rejected(self):
+        self.assertEqual(self.client.get('/api/v1/user/contact/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/v1/user/contact/').status_code, 401)
+
+
+class DeviceTokenTests(TestCase):
+    """
+    Истёкшие токены устройств удаляются при выдаче нового токена и периодической задачей
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('device@example.com', 'password', is_active=True)
+        self.other = User.objects.create_user('other@example.com', 'password', is_active=True)
+
+    def expired(self, user, **kwargs):
+        return DeviceToken.objects.create(user=user, expires_at=timezone.now() - timedelta(seconds=1), **kwargs)
+
+    def test_issue_prunes_expired_tokens_of_user(self):
+        self.expired(self.user)
+        self.expired(self.user, revoked_at=timezone.now())
+        others = self.expired(self.other)
+        _, revoked = issue_device_token(self.user, 'phone')
+        revoke_device_tokens(DeviceToken.objects.filter(pk=revoked.pk))
+
+        _, record = issue_device_token(self.user, 'phone')
+        # Отозванный, но не истёкший токен остаётся: он нужен списку отзыва
+        self.assertEqual(set(DeviceToken.objects.filter(user=self.user)), {revoked, record})
+        self.assertTrue(DeviceToken.objects.filter(pk=others.pk).exists())
+
+    def test_prune_task(self):
+        _, record = issue_device_token(self.other)
+        self.expired(self.user)
+        self.expired(self.other, revoked_at=timezone.now())
+
+        self.assertEqual(prune_device_tokens_task.delay().get(), 2)
+        self.assertEqual(list(DeviceToken.objects.all()), [record])
+
+
+class SignedTokenAuthenticationTests(TestCase):
+    """
+    Подписанные токены устройств: проверка подписи, срока действия и отзыва без чтения токена из базы
+    """
+
+    def setUp(self):
+        token_cache.clear()
+        revocation_list.reset()
+        self.addCleanup(token_cache.clear)
+        self.addCleanup(revocation_list.reset)
+        self.user = User.objects.create_user('device@example.com', 'password', is_active=True)
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/v1/user/login', {'email': 'device@example.com', 'password': 'password'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['Token']
+
+    def status_with(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        return self.client.get('/api/v1/user/contact/').status_code
+
+    def test_accepted_without_reading_token(self):
+        token = self.login()
+        self.assertEqual(self.status_with(token), 200)
+        # Пользователь уже в кеше процесса: подпись и срок проверяются без запросов к базе
+        with self.assertNumQueries(0):
+            user, auth = SignedTokenAuthentication().authenticate_credentials(token)
+        self.assertEqual((user.pk, auth.user_id), (self.user.pk, self.user.pk))
+
+    def test_tampered_signature_rejected(self):
+        token = self.login()
+        user_id, token_id, expires, signature = token.split('.')
+        # Последний символ подписи заменяется на заведомо другой
+        tampered = signature[:-1] + ('B' if signature.endswith('A') else 'A')
+        self.assertEqual(self.status_with(f'{user_id}.{token_id}.{expires}.{tampered}'), 401)
+        self.assertEqual(self.status_with(f'{user_id}.{token_id}.{int(expires) + 3600}.{signature}'), 401)
+        self.assertEqual(self.status_with(f'{self.user.pk + 1}.{token_id}.{expires}.{signature}'), 401)
+
+    def test_expired_token_rejected(self):
+        token = self.login()
+        expires = int(token.split('.')[2])
+        with mock.patch('backend.authentication.time.time', return_value=expires + 1):
+            self.assertEqual(self.status_with(token), 401)
+
+    def test_revoked_by_logout(self):
+        token = self.login()
+        other = self.login()
+        self.assertEqual(self.status_with(token), 200)
+        self.assertEqual(self.client.post('/api/v1/user/logout').status_code, 200)
+
+        self.assertEqual(self.status_with(token), 401)
+        # Выход отзывает только токен этого устройства
+        self.assertEqual(self.status_with(other), 200)
+        # Другие процессы узнают об отзыве из базы при обновлении списка отзыва
+        revocation_list.reset()
+        self.assertEqual(self.status_with(token), 401)
+
+    def test_password_change_invalidates_tokens(self):
+        token = self.login()
+        self.assertEqual(self.status_with(token), 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new-password')
+            self.user.save()
+        self.assertEqual(self.status_with(token), 401)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Частые запросы используют свои индексы (как check_query_plans, но в тестах)
+    """
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor == 'postgresql':
+            # На пустых таблицах PostgreSQL предпочитает последовательное чтение
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset, index in hot_queries():
+            with self.subTest(name):
+                self.assertIn(index, queryset.explain())
+
+
+@override_settings(METRICS_ENFORCE_QUERY_BUDGETS=True)
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Маршруты с бюджетом SQL-запросов на заполненной базе (как check_query_budgets).
+    Транзакции настоящие: в TestCase точки сохранения добавили бы запросы, которых нет в работе сервера
+    """
+
+    def test_routes_within_budgets(self):
+        buyer, partner, contact, offers = check_query_budgets.seed(20)
+        Shop.objects.update(state=True)
+        client, tokens = APIClient(), {}
+        self.addCleanup(token_cache.clear)
+        for user, method, url, data in check_query_budgets.requests(buyer, partner, contact, offers):
+            budget = settings.QUERY_BUDGETS[f'{method.upper()} {resolve(url.split("?")[0]).view_name}']
+            with self.subTest(f'{method.upper()} {url}'):
+                check_query_budgets.authenticate(client, user, tokens)
+                with collect_metrics() as metrics:
+                    response = getattr(client, method)(url, data, format='json')
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(metrics.queries, budget)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Чтение с реплики replica1 (копия тестовой базы в отдельном файле), закрепление за основной
+    базой после записи и возврат к основной базе, если файла реплики нет
+    """
+
+    # Алиас replica1 появляется в setUpClass, '__all__' включает его при настройке класса
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # Реплика - отдельный файл, а не зеркало тестовой базы (TEST.MIRROR): данные в ней отстают
+        cls.directory = tempfile.mkdtemp()
+        cls.replica_path = os.path.join(cls.directory, 'replica.sqlite3')
+        connections.settings['replica1'] = dict(connections[DEFAULT_DB_ALIAS].settings_dict, NAME=cls.replica_path)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.user = User.objects.create_user('replica@example.com', 'password', is_active=True)
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Смартфоны')
+
+        self.enterContext(override_settings(
+            DATABASE_REPLICAS=['replica1'],
+            DB_REPLICA_PIN_CACHE='pins',
+            CACHES=dict(settings.CACHES, pins={'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                               'LOCATION': os.path.join(self.directory, 'pins')}),
+        ))
+        connections['replica1'].close()
+        call_command('sync_sqlite_replicas', stdout=io.StringIO())
+        health.reset()
+        self.addCleanup(health.reset)
+        token_cache.clear()
+
+        # Изменения после копирования есть только в основной базе
+        Category.objects.filter(pk=self.category.pk).update(name='Телефоны')
+        self.order = Order.objects.create(user=self.user, state=Order.NEW)
+        self.client = APIClient(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def category_names(self):
+        response = self.client.get('/api/v1/categories/')
+        self.assertEqual(response.status_code, 200)
+        return [category['name'] for category in response.json()['results']]
+
+    def order_ids(self):
+        return [order['id'] for order in self.client.get('/api/v1/order/').json()]
+
+    def test_catalog_reads_from_replica(self):
+        self.assertEqual(self.category_names(), ['Смартфоны'])
+        # Запись вне представлений с replica_reads всегда на основной базе
+        self.assertEqual(Category.objects.get(pk=self.category.pk).name, 'Телефоны')
+
+    def test_write_pins_rest_of_request(self):
+        token = _state.set(RoutingState())
+        try:
+            _state.get().replica_reads = True
+            self.assertEqual(Category.objects.get(pk=self.category.pk).name, 'Смартфоны')
+            Category.objects.filter(pk=self.category.pk).update(name='Мобильные')
+            self.assertEqual(Category.objects.get(pk=self.category.pk).name, 'Мобильные')
+        finally:
+            _state.reset(token)
+
+    def test_write_pins_credentials_until_expiry(self):
+        self.assertEqual(self.order_ids(), [])
+        response = self.client.post(
+            '/api/v1/user/contact/', {'city': 'Москва', 'street': 'Ленина', 'house': '1', 'phone': '1'}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.order_ids(), [self.order.id])
+        # Другие учётные данные не закреплены
+        self.assertEqual(APIClient().get('/api/v1/categories/').json()['results'][0]['name'], 'Смартфоны')
+
+        expired = time.time() + settings.DB_REPLICA_PIN_SECONDS + 1
+        with mock.patch('django.core.cache.backends.filebased.time', mock.Mock(time=lambda: expired)):
+            self.assertEqual(self.order_ids(), [])
+
+    def test_process_local_pin_cache_rejected(self):
+        self.assertEqual(check_replica_pin_cache(None), [])
+        with override_settings(DB_REPLICA_PIN_CACHE='default'):
+            self.assertEqual([error.id for error in check_replica_pin_cache(None)], ['backend.E002'])
+
+    def test_missing_replica_falls_back_to_primary(self):
+        connections['replica1'].close()
+        os.remove(self.replica_path)
+        with self.assertLogs('backend.routers', 'WARNING'):
+            self.assertEqual(self.category_names(), ['Телефоны'])
+        # Проверка доступности не создаёт пустой файл реплики
+        self.assertFalse(os.path.exists(self.replica_path))
+
+
+class MigrationUpgradeTests(TransactionTestCase):
+    """
+    Обновление базы, созданной базовой версией проекта (схема 0001_initial), до текущих миграций
+    """
+
+    def test_upgrade_from_baseline_schema(self):
+        baseline = [('backend', '0001_initial')]
+        executor = MigrationExecutor(connection)
+        executor.migrate(baseline)
+        try:
+            old = executor.loader.project_state(baseline).apps
+            user = old.get_model('backend', 'User').objects.create(
+                email='old@example.com', password=make_password('password'), is_active=True,
+            )
+            shop = old.get_model('backend', 'Shop').objects.create(name='Магазин', user=user)
+            product = old.get_model('backend', 'Product').objects.create(
+                name='Смартфон', category=old.get_model('backend', 'Category').objects.create(name='Смартфоны'),
+            )
+            offer = old.get_model('backend', 'ProductInfo').objects.create(
+                product=product, shop=shop, model='phone', quantity=5, price=1000, price_rrc=1200,
+            )
+            order = old.get_model('backend', 'Order').objects.create(user=user, state='new')
+            # Базовая версия могла записать одно предложение в заказ дважды
+            for quantity in (2, 1):
+                old.get_model('backend', 'OrderItem').objects.create(order=order, product_info=offer, quantity=quantity)
+        finally:
+            # Как при обновлении по README: 0001 уже записана в базе, применяются 0002 и следующие
+            call_command('migrate', 'backend', fake_initial=True, verbosity=0)
+
+        tables = connection.introspection.table_names()
+        for table in ('backend_catalogentry', 'backend_devicetoken', 'backend_importjob', 'backend_outgoingemail',
+                      'backend_pricelistsource', 'backend_categoryfacet', 'backend_catalogversion'):
+            self.assertIn(table, tables)
+        item = OrderItem.objects.get()
+        self.assertEqual((item.quantity, item.product_name, item.price), (3, 'Смартфон', 1000))
+        self.assertEqual(Order.objects.get().total_sum, 3000)
+
+        call_command('rebuild_catalog', stdout=io.StringIO())
+        self.assertEqual(APIClient().get('/api/v1/products').json()['count'], 1)
+        response = APIClient().post('/api/v1/user/login', {'email': 'old@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(DeviceToken.objects.filter(user__email='old@example.com').exists())
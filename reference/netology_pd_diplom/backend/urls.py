@@ -1,12 +1,23 @@
+from django.conf import settings
 from django.urls import path
+from backend.async_views import OrderEventsView
 from backend.views import (
-    BasketView, CategoryView, ContactView, OrderView, PartnerUpdate, 
-    ProductInfoView, RegisterAccount, ConfirmAccount, LoginAccount, ShopView
+    BasketView, CategoryView, ContactView, DeviceTokenView, OrderCancelView, OrderView, PartnerOrders, PartnerUpdate, PartnerUpdateStatus,
+    ProductInfoView, RegisterAccount, ConfirmAccount, LoginAccount, LogoutAccount, MetricsView, ShopView, TokenCacheStats
     )
+
+if settings.ASYNC_VIEWS:
+    from backend.async_views import (
+        AsyncBasketView as BasketView, AsyncCategoryView as CategoryView, AsyncOrderView as OrderView,
+        AsyncProductInfoView as ProductInfoView, AsyncShopView as ShopView,
+    )
+
 app_name = 'backend'
 
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/<uuid:job_id>', PartnerUpdateStatus.as_view(), name='partner-update-status'),
+    path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
     path('user/register', RegisterAccount.as_view(), name='user-register'),
     path('basket', BasketView.as_view(), name='basket'),
     path('user/register/confirm', ConfirmAccount.as_view(), name='user-register-confirm'),
@@ -14,7 +25,14 @@ urlpatterns = [
     path('shops/', ShopView.as_view(), name='shops'),
     path('products', ProductInfoView.as_view(), name='products'),
     path('order/', OrderView.as_view(), name='order'),
+    path('order/events', OrderEventsView.as_view(), name='order-events'),
+    path('order/<int:order_id>/cancel', OrderCancelView.as_view(), name='order-cancel'),
     path('user/login', LoginAccount.as_view(), name='user-login'),
+    path('user/logout', LogoutAccount.as_view(), name='user-logout'),
+    path('user/devices', DeviceTokenView.as_view(), name='user-devices'),
+    path('user/devices/<uuid:token_id>', DeviceTokenView.as_view(), name='user-device'),
+    path('user/token-cache', TokenCacheStats.as_view(), name='user-token-cache'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('user/contact/', ContactView.as_view(), name='user-contact-create-or-list'),
     path('user/contact/<int:pk>/', ContactView.as_view(), name='user-contact-update-or-delete'),
 ]
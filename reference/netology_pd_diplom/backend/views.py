@@ -1,30 +1,57 @@
-from rest_framework.filters import SearchFilter
+import time
+
 from rest_framework.generics import ListAPIView
 from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework import status
 from django_filters.rest_framework import DjangoFilterBackend
 from backend.models import (
-    Contact, Order, OrderItem, Parameter, ProductParameter, 
-    Shop, Category, Product, ProductInfo, User
+    Contact, Order, OrderItem, Shop, Category, User, ImportJob, CatalogEntry, DeviceToken
 )
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import UploadedFile
+from django.core.validators import URLValidator
 from django.db import transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum, prefetch_related_objects
 from django.http import JsonResponse
 from django.contrib.auth import authenticate
-from django.core.mail import send_mail
 from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.utils.crypto import get_random_string
 from .serializers import (
-    BasketSerializer, CategorySerializer, ContactSerializer,
-    OrderSerializer, ProductInfoSerializer, RegisterSerializer, 
-    ShopSerializer
+    BasketSerializer, CatalogEntrySerializer, CatalogEntryValuesSerializer, CategorySerializer,
+    CategoryValuesSerializer, ContactSerializer, ImportJobSerializer, OrderHistorySerializer, OrderSerializer,
+    PartnerOrderSerializer, RegisterSerializer, ShopSerializer, ShopValuesSerializer
+)
+from backend.authentication import SignedToken, issue_device_token, revoke_device_tokens, token_cache
+from backend.basket import BasketError, add_items, remove_items
+from backend.catalog import catalog_cache_key, catalog_etag, get_catalog_version
+from backend.checkout import (
+    CheckoutError, UnavailableItemsError, cancel_order, checkout, drop_unavailable_items,
 )
+from backend.events import parse_since
+from backend.facets import ParameterFilterBackend, compute_facets, facets_requested
+from backend.filters import CatalogEntryFilter
+from backend.mail import queue_email
+from backend.metrics import MetricsPermission, PrometheusRenderer, render_prometheus
+from backend.pagination import CatalogPagination, OrderKeysetPagination
+from backend.renderers import UJSONRenderer
+from backend.parsers import detect_format
+from backend.search import CatalogSearchFilter
 from backend.signals import new_user_registered
-import json
-import yaml
+from backend.tasks import import_price_list_task
+
+# Позиции заказа вместе с товаром и категорией одним запросом; магазин в ответе - только id
+ORDERED_ITEMS_PREFETCH = Prefetch(
+    'ordered_items', queryset=OrderItem.objects.select_related('product_info__product__category')
+)
 
 
 class RegisterAccount(APIView):
@@ -73,15 +100,84 @@ class LoginAccount(APIView):
         user = authenticate(username=request.data.get('email'), password=request.data.get('password'))
         if user:
             if user.is_active:
-                token, _ = Token.objects.get_or_create(user=user)
-                return Response({'Status': True, 'Token': token.key})
+                # Отдельный подписанный токен на каждое устройство, его можно отозвать в user/devices
+                token, record = issue_device_token(user, str(request.data.get('device', '')))
+                return Response({'Status': True, 'Token': token, 'Expires': record.expires_at})
             return Response({'Status': False, 'Errors': 'Пользователь не активен'}, status=status.HTTP_403_FORBIDDEN)
         return Response({'Status': False, 'Errors': 'Неверный логин или пароль'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
+class LogoutAccount(APIView):
+    """
+    Выход: удаляет токен пользователя, он сразу перестаёт приниматься
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.auth, SignedToken):
+            revoke_device_tokens(DeviceToken.objects.filter(id=request.auth.id, user=request.user))
+        else:
+            Token.objects.filter(user=request.user).delete()
+        return Response({'Status': True})
+
+
+class DeviceTokenView(APIView):
+    """
+    Токены устройств пользователя: список действующих и отзыв одного или всех
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        current = request.auth.id if isinstance(request.auth, SignedToken) else None
+        tokens = DeviceToken.objects.filter(
+            user=request.user, revoked_at__isnull=True, expires_at__gt=timezone.now()
+        ).order_by('-created_at')
+        return Response([
+            {
+                'id': token.id, 'device': token.device, 'created_at': token.created_at,
+                'expires_at': token.expires_at, 'current': token.id.hex == current,
+            }
+            for token in tokens
+        ])
+
+    def delete(self, request, token_id=None, *args, **kwargs):
+        tokens = DeviceToken.objects.filter(user=request.user)
+        if token_id is not None:
+            tokens = tokens.filter(id=token_id)
+        return Response({'Status': True, 'Revoked': revoke_device_tokens(tokens)})
+
+
+class TokenCacheStats(APIView):
+    """
+    Счётчики кеша токенов текущего процесса
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(token_cache.stats())
+
+
+class MetricsView(APIView):
+    """
+    Счётчики запросов к API текущего процесса в формате Prometheus
+    """
+    permission_classes = [MetricsPermission]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request, *args, **kwargs):
+        stats = token_cache.stats()
+        return Response(render_prometheus([
+            ('token_cache_hits_total', 'counter', 'Попадания в кеш токенов процесса', stats['hits']),
+            ('token_cache_shared_hits_total', 'counter', 'Попадания в общий кеш токенов', stats['shared_hits']),
+            ('token_cache_misses_total', 'counter', 'Промахи кеша токенов', stats['misses']),
+            ('token_cache_evictions_total', 'counter', 'Вытеснения из кеша токенов', stats['evictions']),
+            ('token_cache_size', 'gauge', 'Записей в кеше токенов', stats['size']),
+        ]))
+
+
 class PartnerUpdate(APIView):
     """
-    Загрузка прайс-листа поставщика (JSON или YAML)
+    Загрузка прайс-листа поставщика (JSON или YAML): файлом или по ссылке url
     """
 
     permission_classes = [IsAuthenticated]
@@ -92,54 +188,77 @@ class PartnerUpdate(APIView):
             return Response({'status': False, 'error': 'Только для пользователей типа "shop"'}, status=403)
 
         file = request.FILES.get('file')
-        if not file:
-            return Response({'status': False, 'error': 'Файл не передан'}, status=400)
-
-        try:
+        url = request.data.get('url')
+        if file:
             # Определяем формат файла
-            if file.name.endswith('.yaml') or file.name.endswith('.yml'):
-                data = yaml.safe_load(file)
-            elif file.name.endswith('.json'):
-                data = json.load(file)
-            else:
+            fmt = detect_format(file.name)
+            if fmt is None:
                 return Response({'status': False, 'error': 'Неверный формат файла'}, status=400)
-        except Exception as e:
-            return Response({'status': False, 'error': f'Ошибка чтения файла: {str(e)}'}, status=400)
+            job = ImportJob.objects.create(user=user, file=file, format=fmt)
+        elif url:
+            try:
+                URLValidator(schemes=['http', 'https'])(url)
+            except ValidationError:
+                return Response({'status': False, 'error': 'Неверный URL прайс-листа'}, status=400)
+            job = ImportJob.objects.create(user=user, url=url)
+        else:
+            return Response({'status': False, 'error': 'Не передан файл или url'}, status=400)
 
-        shop, _ = Shop.objects.get_or_create(name=data['shop'], user=user)
+        transaction.on_commit(lambda: import_price_list_task.delay(str(job.id)))
 
-        with transaction.atomic():
-            for category in data.get('categories', []):
-                cat_obj, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                cat_obj.shops.add(shop)
+        return Response({'status': True, 'message': 'Прайс-лист принят в обработку', 'job': job.id},
+                        status=status.HTTP_202_ACCEPTED)
 
-            ProductInfo.objects.filter(shop=shop).delete()
 
-            for item in data.get('goods', []):
-                product, _ = Product.objects.get_or_create(
-                    name=item['name'],
-                    category_id=item['category']
-                )
+class PartnerOrders(APIView):
+    """
+    Заказы с товарами магазинов поставщика: только его позиции и их сумма.
+    Позиции выбираются по индексу OrderItem(shop, order) без соединения с ProductInfo
+    """
 
-                product_info = ProductInfo.objects.create(
-                    product=product,
-                    shop=shop,
-                    model=item.get('model', ''),
-                    quantity=item.get('quantity', 0),
-                    price=item.get('price', 0),
-                    price_rrc=item.get('price_rrc', 0)
-                )
+    permission_classes = [IsAuthenticated]
 
-                for name, value in item.get('parameters', {}).items():
-                    param_obj, _ = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.create(
-                        product_info=product_info,
-                        parameter=param_obj,
-                        value=value
-                    )
+    def get(self, request, *args, **kwargs):
+        if request.user.type != 'shop':
+            return Response({'status': False, 'error': 'Только для пользователей типа "shop"'}, status=403)
+
+        shops = Shop.objects.filter(user=request.user).values('id')
+        shop_id = request.query_params.get('shop')
+        if shop_id:
+            if not shop_id.isdigit():
+                return Response({'status': False, 'error': 'Неверный идентификатор магазина'}, status=400)
+            shops = shops.filter(id=shop_id)
+        items = OrderItem.objects.filter(shop__in=shops)
+        # Цены и названия - из снимка позиций, сделанного при оформлении
+        shop_total = items.filter(order=OuterRef('pk')).values('order').annotate(
+            total=Sum(F('quantity') * F('price'))
+        ).values('total')
+        orders = Order.objects.filter(pk__in=items.values('order')).exclude(state='basket').annotate(
+            shop_total=Subquery(shop_total)
+        ).select_related('contact').prefetch_related(
+            Prefetch('ordered_items', to_attr='shop_items', queryset=items),
+        )
+        if request.query_params.get('state'):
+            orders = orders.filter(state=request.query_params['state'])
+
+        if OrderKeysetPagination.is_requested(request):
+            paginator = OrderKeysetPagination()
+            page = paginator.paginate_queryset(orders, request, view=self)
+            return paginator.get_paginated_response(PartnerOrderSerializer(page, many=True).data)
+        return Response(PartnerOrderSerializer(orders.order_by('-dt'), many=True).data)
+
+
+class PartnerUpdateStatus(APIView):
+    """
+    Статус фонового импорта прайс-листа
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+        return Response({'status': True, **ImportJobSerializer(job).data})
 
-        return Response({'status': True, 'message': 'Прайс-лист успешно обновлен'})
-    
 
 class BasketView(APIView):
     """
@@ -148,15 +267,12 @@ class BasketView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        basket, _ = Order.objects.get_or_create(user=request.user, state='basket')
-        ordered_items = basket.ordered_items.select_related('product_info__product', 'product_info__shop')
+        basket, _ = Order.objects.with_total().prefetch_related(
+            ORDERED_ITEMS_PREFETCH,
+        ).get_or_create(user=request.user, state='basket')
+        serializer = OrderSerializer(basket)
 
-        total_sum = sum([item.quantity * item.product_info.price for item in ordered_items])
-        serializer = OrderSerializer(basket, context={'total_sum': total_sum})
-        data = serializer.data
-        data['total_sum'] = total_sum
-
-        return Response(data)
+        return Response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         items = request.data.get('items')
@@ -164,26 +280,13 @@ class BasketView(APIView):
             return Response({'Status': False, 'Error': 'Не передан список товаров'}, status=status.HTTP_400_BAD_REQUEST)
 
         basket, _ = Order.objects.get_or_create(user=request.user, state='basket')
+        try:
+            results = add_items(basket, items)
+        except BasketError as error:
+            return Response({'Status': False, 'Error': str(error), 'Items': error.results},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        for item in items:
-            product_info_id = item.get('product_info')
-            quantity = item.get('quantity', 1)
-
-            if not product_info_id:
-                continue
-
-            try:
-                product_info = ProductInfo.objects.get(id=product_info_id)
-            except ProductInfo.DoesNotExist:
-                return Response({'Status': False, 'Error': f'product_info с id={product_info_id} не найден'}, status=404)
-
-            OrderItem.objects.update_or_create(
-                order=basket,
-                product_info=product_info,
-                defaults={'quantity': quantity}
-            )
-
-        return Response({'Status': True})
+        return Response({'Status': True, 'Items': results})
 
     def delete(self, request, *args, **kwargs):
         items = request.data.get('items')
@@ -194,40 +297,143 @@ class BasketView(APIView):
         if not basket:
             return Response({'Status': False, 'Error': 'Корзина не найдена'}, status=404)
 
-        deleted_count = 0
-        for item in items:
-            product_info_id = item.get('product_info')
-            if not product_info_id:
-                continue
-
-            deleted_count += OrderItem.objects.filter(
-                order=basket,
-                product_info_id=product_info_id
-            ).delete()[0]
+        try:
+            results = remove_items(basket, items)
+        except BasketError as error:
+            return Response({'Status': False, 'Error': str(error), 'Items': error.results}, status=400)
 
-        return Response({'Status': True, 'Deleted': deleted_count})
+        deleted_count = sum(1 for result in results if result['result'] == 'deleted')
+        return Response({'Status': True, 'Deleted': deleted_count, 'Items': results})
     
-class CategoryView(ListAPIView):
-    queryset = Category.objects.all()
+class ValuesListMixin:
+    """
+    Список для чтения без ModelSerializer: строки queryset.values() превращаются в словари
+    через values_serializer_class и кодируются ujson. serializer_class нужен только для схемы API
+    """
+    values_serializer_class = None
+    renderer_classes = [UJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        serializer_class = self.values_serializer_class
+        if serializer_class is None:
+            return super().list(request, *args, **kwargs)
+        queryset = serializer_class.prepare(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer_class(page).data)
+        return Response(serializer_class(queryset).data)
+
+
+class CatalogConditionalMixin:
+    """
+    Условный GET для списков каталога: ETag и Last-Modified строятся из версии каталога,
+    на If-None-Match и If-Modified-Since отвечаем 304 без выборки и сериализации.
+    shop_scope_param - параметр запроса, сужающий версию до одного магазина;
+    stock_epoch - в ответе есть остатки, которые меняются без смены версии,
+    поэтому ETag меняется не реже раза в CATALOG_CACHE_TIMEOUT
+    """
+    shop_scope_param = None
+    stock_epoch = False
+
+    def get_catalog_scope(self, request):
+        shop_id = request.query_params.get(self.shop_scope_param, '') if self.shop_scope_param else ''
+        return int(shop_id) if shop_id.isdigit() else None
+
+    def get_validators(self, request, state):
+        epoch = None
+        last_modified = int(state.updated_at.timestamp()) if state.updated_at else None
+        if self.stock_epoch:
+            epoch = int(time.time() // settings.CATALOG_CACHE_TIMEOUT)
+            last_modified = max(last_modified or 0, epoch * settings.CATALOG_CACHE_TIMEOUT)
+        return quote_etag(catalog_etag(request, state, epoch)), last_modified
+
+    def add_validators(self, response, etag, last_modified):
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, public=True, max_age=settings.CATALOG_HTTP_MAX_AGE, must_revalidate=True)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        self.catalog_state = get_catalog_version(self.get_catalog_scope(request))
+        etag, last_modified = self.get_validators(request, self.catalog_state)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.add_validators(response, etag, last_modified)
+
+
+class CategoryView(CatalogConditionalMixin, ValuesListMixin, ListAPIView):
+    queryset = Category.objects.order_by('id')
     serializer_class = CategorySerializer
+    values_serializer_class = CategoryValuesSerializer
     permission_classes = []
+    replica_reads = True
 
-class ShopView(ListAPIView):
-    queryset = Shop.objects.filter(state=True)
+class ShopView(CatalogConditionalMixin, ValuesListMixin, ListAPIView):
+    queryset = Shop.objects.filter(state=True).order_by('id')
     serializer_class = ShopSerializer
+    values_serializer_class = ShopValuesSerializer
     permission_classes = [] 
+    replica_reads = True
 
-class ProductInfoView(ListAPIView):
-    queryset = ProductInfo.objects.select_related('product', 'shop', 'product__category')
-    serializer_class = ProductInfoSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    filterset_fields = ['shop', 'product__category']
-    search_fields = ['product__name']
+class ProductInfoView(CatalogConditionalMixin, ValuesListMixin, ListAPIView):
+    """
+    Список товаров из денормализованного каталога с кешированием ответов и условным GET.
+    Фильтр по параметрам: param_<id>=значение, сводка значений параметров: facets=true
+    """
+    queryset = CatalogEntry.objects.order_by('product_info_id')
+    serializer_class = CatalogEntrySerializer
+    values_serializer_class = CatalogEntryValuesSerializer
+    filter_backends = [DjangoFilterBackend, CatalogSearchFilter, ParameterFilterBackend]
+    filterset_class = CatalogEntryFilter
+    search_fields = ['product_name']
+    pagination_class = CatalogPagination
     permission_classes = []
+    shop_scope_param = 'shop'
+    stock_epoch = True
+    replica_reads = True
+
+    def list(self, request, *args, **kwargs):
+        key = catalog_cache_key(request, self.catalog_state.version)
+        data = cache.get(key)
+        if data is None:
+            data = self.build_page(request, *args, **kwargs)
+            cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return Response(data)
+
+    def build_page(self, request, *args, **kwargs):
+        data = super().list(request, *args, **kwargs).data
+        if facets_requested(request):
+            queryset = self.get_queryset()
+            for backend in self.filter_backends:
+                if backend is not ParameterFilterBackend:
+                    queryset = backend().filter_queryset(request, queryset, self)
+            data['facets'] = compute_facets(request, queryset)
+        return data
+
+
+def prefetch_order_items(orders):
+    """
+    Загружает позиции заказов: у оформленных - только снимок из OrderItem,
+    у корзины - вместе с предложением, товаром, категорией и магазином из каталога
+    """
+    orders = list(orders)
+    prefetch_related_objects([order for order in orders if order.state != 'basket'], 'ordered_items')
+    prefetch_related_objects(
+        [order for order in orders if order.state == 'basket'],
+        Prefetch('ordered_items', queryset=OrderItem.objects.select_related(
+            'product_info__product__category', 'product_info__shop',
+        )),
+    )
+    return orders
 
 
 class OrderView(APIView):
     permission_classes = [IsAuthenticated]
+    # История заказов (GET) читается с реплики, оформление - на основной базе
+    replica_reads = True
 
     def post(self, request, *args, **kwargs):
         user = request.user
@@ -245,63 +451,93 @@ class OrderView(APIView):
         if not basket:
             return Response({"status": False, "error": "Корзина пуста"}, status=400)
 
-        with transaction.atomic():
-            basket.contact = contact
-            basket.state = 'new'
-            basket.save()
-
-        # Email для пользователя
-        send_mail(
-            'Подтверждение заказа',
-            f'Ваш заказ #{basket.id} успешно оформлен.',
-            'no-reply@example.com',
-            [user.email],
-            fail_silently=False
-        )
-
-        # Email админу
-        items = basket.ordered_items.select_related('product_info__product', 'product_info__shop')
-        items_list = '\n'.join([
-    f"{item.product_info.product.name} | {item.quantity} шт. | {item.product_info.price} ₽"
-    for item in items
-])
-
-        admin_message = f"""
-        Новый заказ #{basket.id}
-
-        Пользователь: {user.email}
-        Контакт:
-          Город: {contact.city}
-          Адрес: {contact.street}, {contact.house or '-'}
-          Телефон: {contact.phone}
-
-        Товары:
-        {items_list}
+        # Товар резервируется при оформлении; письма ставятся в очередь в той же транзакции
+        try:
+            with transaction.atomic():
+                checkout(basket, contact)
+
+                # Email для пользователя
+                queue_email(
+                    'Подтверждение заказа',
+                    f'Ваш заказ #{basket.id} успешно оформлен.',
+                    [user.email],
+                    from_email='no-reply@example.com',
+                    dedup_key=f'order:{basket.id}:customer',
+                )
 
-        Итого: {sum([item.quantity * item.product_info.price for item in items])} ₽
-        """
+                # Email админу
+                items = basket.ordered_items.values_list('product_name', 'quantity', 'price')
+                items_list = '\n'.join([
+                    f"{name} | {quantity} шт. | {price} ₽"
+                    for name, quantity, price in items
+                ])
+
+                admin_message = f"""
+                Новый заказ #{basket.id}
+
+                Пользователь: {user.email}
+                Контакт:
+                  Город: {contact.city}
+                  Адрес: {contact.street}, {contact.house or '-'}
+                  Телефон: {contact.phone}
+
+                Товары:
+                {items_list}
+
+                Итого: {basket.total_sum} ₽
+                """
+
+                queue_email(
+                    'Новый заказ от клиента',
+                    admin_message,
+                    ['admin@example.com'],
+                    from_email='no-reply@example.com',
+                    dedup_key=f'order:{basket.id}:admin',
+                )
+        except CheckoutError as error:
+            if isinstance(error, UnavailableItemsError):
+                # Покупатель увидит изменившуюся корзину, повторное оформление пройдёт
+                drop_unavailable_items(basket)
+            return Response({"status": False, "error": str(error), "short": error.short}, status=409)
 
-        send_mail(
-            'Новый заказ от клиента',
-            admin_message,
-            'no-reply@example.com',
-            ['admin@example.com'],
-            fail_silently=False
-        )
-    
         return Response({'status': True, 'message': 'Заказ успешно оформлен'})
 
     def get(self, request, *args, **kwargs):
         """
-        Получение списка заказов пользователя
+        Получение списка заказов пользователя вместе с корзиной.
+        Позиции оформленных заказов читаются из снимка, сделанного при оформлении, позиции корзины - из каталога.
+        С параметром cursor или pagination=cursor список выдаётся постранично по ключу,
+        с since=<время ISO 8601> - только заказы, изменённые после этого времени
         """
-        orders = Order.objects.filter(user=request.user).select_related('contact').prefetch_related(
-            'ordered_items__product_info__product', 
-            'ordered_items__product_info__shop'
-        )
-        serializer = OrderSerializer(orders, many=True)
+        orders = Order.objects.filter(user=request.user).with_total().select_related('contact')
+        if 'since' in request.query_params:
+            since = parse_since(request.query_params['since'])
+            if since is None:
+                return Response({"status": False, "error": "Неверный формат since"}, status=400)
+            orders = orders.filter(updated_at__gt=since)
+        if OrderKeysetPagination.is_requested(request):
+            paginator = OrderKeysetPagination()
+            page = prefetch_order_items(paginator.paginate_queryset(orders, request, view=self))
+            return paginator.get_paginated_response(OrderHistorySerializer(page, many=True).data)
+
+        serializer = OrderHistorySerializer(prefetch_order_items(orders), many=True)
         return Response(serializer.data)
 
+class OrderCancelView(APIView):
+    """
+    Отмена заказа покупателем с возвратом товара на склад
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, order_id, *args, **kwargs):
+        order = get_object_or_404(Order.objects.exclude(state='basket'), id=order_id, user=request.user)
+        try:
+            cancel_order(order)
+        except CheckoutError as error:
+            return Response({"status": False, "error": str(error)}, status=409)
+        return Response({"status": True, "message": "Заказ отменён"})
+
+
 class ContactView(APIView):
     permission_classes = [IsAuthenticated]
 
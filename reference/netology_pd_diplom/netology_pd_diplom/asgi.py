@@ -0,0 +1,18 @@
+"""
+ASGI config for netology_pd_diplom project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Catalog, basket and order views are served by their async variants (ASYNC_VIEWS).
+
+Run with, for example:
+    uvicorn netology_pd_diplom.asgi:application --workers 4
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'netology_pd_diplom.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+application = get_asgi_application()
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from datetime import timedelta
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -32,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',
+    'backend.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,19 +65,69 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'netology_pd_diplom.wsgi.application'
+ASGI_APPLICATION = 'netology_pd_diplom.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# Параметры базы задаются переменными окружения, по умолчанию локальный SQLite
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.sqlite3')
+
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'OPTIONS': {
+                # WAL: чтение не блокируется записью; IMMEDIATE: транзакция сразу берёт блокировку
+                # на запись и ждёт её до timeout вместо ошибки "database is locked"
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': int(os.environ.get('DB_TIMEOUT', 20)),
+            },
+            # Тестовая база в файле: в памяти SQLite не ждёт блокировку, а сразу отвечает
+            # "database table is locked", и параллельное оформление заказов не проверить.
+            # Номер процесса в имени: одновременные прогоны тестов на одном хосте не мешают друг другу
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), f'test_netology_pd_diplom_{os.getpid()}.sqlite3')},
+        }
+    }
+else:
+    # DB_POOL=True включает пул соединений psycopg 3 (нужен psycopg[pool]),
+    # иначе соединения переиспользуются между запросами в течение DB_CONN_MAX_AGE секунд
+    DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', 'netology_pd_diplom'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': not DB_POOL,
+            'OPTIONS': {'pool': True} if DB_POOL else {},
+        }
     }
 
-
-}
+# Реплики для чтения: DB_REPLICAS - через запятую пути к файлам SQLite (копии основной базы,
+# обновляются командой sync_sqlite_replicas) или хосты PostgreSQL. Алиасы replica1, replica2, ...
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        **{'NAME' if DB_ENGINE == 'django.db.backends.sqlite3' else 'HOST': replica.strip()},
+        # В тестах реплика - та же тестовая база
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+# Сколько секунд после записи запросы с теми же учётными данными читают с основной базы
+# (закрепление хранится в кеше DB_REPLICA_PIN_CACHE)
+DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+# Как часто перепроверять недоступную реплику
+DB_REPLICA_HEALTH_INTERVAL = 10
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -112,6 +166,9 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 AUTH_USER_MODEL = 'backend.User'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -125,6 +182,13 @@ EMAIL_PORT = '2525'
 DEFAULT_FROM_EMAIL = 'no-reply@example.com'
 SERVER_EMAIL = EMAIL_HOST_USER
 
+# Очередь писем: размер пачки на одно SMTP-соединение, число попыток,
+# базовая задержка повтора (удваивается с каждой попыткой) и срок захвата пачки, сек.
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 10 * 60
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 40,
@@ -138,7 +202,7 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'backend.authentication.SignedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -146,3 +210,118 @@ REST_FRAMEWORK = {
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Кеш по умолчанию - в памяти процесса. SHARED_CACHE_URL задаёт общий кеш 'shared' для процессов сервера
+# и воркеров Celery: redis://... (RedisCache, нужен пакет redis) или каталог FileBasedCache (один хост)
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+SHARED_CACHE_URL = os.environ.get('SHARED_CACHE_URL')
+if SHARED_CACHE_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache' if SHARED_CACHE_URL.startswith('redis')
+        else 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SHARED_CACHE_URL,
+    }
+
+# Celery: без внешнего брокера задачи выполняются синхронно в процессе
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'memory://')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get(
+    'CELERY_TASK_ALWAYS_EAGER', str(CELERY_BROKER_URL == 'memory://')
+) == 'True'
+CELERY_TASK_EAGER_PROPAGATES = False
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# celery beat: повторная отправка писем, не ушедших с первой попытки, и удаление истёкших токенов устройств
+CELERY_BEAT_SCHEDULE = {
+    'send-queued-emails': {
+        'task': 'backend.tasks.send_queued_emails_task',
+        'schedule': 60.0,
+    },
+    'prune-device-tokens': {
+        'task': 'backend.tasks.prune_device_tokens_task',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
+
+# Кеш хода импорта: задача пишет его из воркера, partner/update/<id> читает в процессе сервера,
+# поэтому с внешним брокером нужен общий кеш (проверка backend.E001)
+IMPORT_PROGRESS_CACHE = 'shared' if SHARED_CACHE_URL else 'default'
+
+# Кеш закрепления чтения за основной базой после записи: его читают все процессы сервера,
+# поэтому с репликами нужен общий кеш (проверка backend.E002)
+DB_REPLICA_PIN_CACHE = 'shared' if SHARED_CACHE_URL else 'default'
+
+# Загрузка прайс-листов по URL: таймауты (соединение, чтение) и предельный размер
+PRICE_LIST_FETCH_TIMEOUT = (5, 60)
+PRICE_LIST_MAX_SIZE = 512 * 1024 * 1024
+
+# Время жизни закешированных ответов каталога, сек. Кеш также сбрасывается при импорте
+CATALOG_CACHE_TIMEOUT = 300
+# Cache-Control: max-age ответов каталога для клиентов, сек. После него клиент
+# перепроверяет ответ по ETag и получает 304, если каталог не менялся
+CATALOG_HTTP_MAX_AGE = int(os.environ.get('CATALOG_HTTP_MAX_AGE', 30))
+
+# Асинхронные представления каталога, корзины и заказов; включается в asgi.py.
+# Под WSGI они работают, но каждый запрос поднимает свой цикл событий
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
+# События смены состояния заказов для потока order/events. По умолчанию подписки хранятся в памяти
+# процесса (один процесс сервера); ORDER_EVENTS_CACHE - псевдоним общего кеша из CACHES (например, Redis),
+# через который события доходят до потоков во всех процессах. HEARTBEAT - интервал пинга, сек.;
+# STREAM_TIMEOUT - через сколько секунд поток закрывается и клиент переподключается с Last-Event-ID
+ORDER_EVENTS_CACHE = os.environ.get('ORDER_EVENTS_CACHE')
+ORDER_EVENTS = {
+    'BACKEND': 'backend.events.CacheOrderEvents' if ORDER_EVENTS_CACHE else 'backend.events.LocalOrderEvents',
+    'OPTIONS': {'cache': ORDER_EVENTS_CACHE} if ORDER_EVENTS_CACHE else {},
+    'HEARTBEAT': 15,
+    'STREAM_TIMEOUT': 300,
+    'RETRY_MS': 3000,
+}
+
+# Поисковый индекс каталога: по умолчанию FTS5 для SQLite, иначе поиск подстроки.
+# SEARCH_MAX_RESULTS - предел совпадений, до которого результаты сортируются по релевантности
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND')
+SEARCH_MAX_RESULTS = 5000
+
+# Кеш проверенных токенов: размер LRU в процессе и время жизни записи, сек.
+# SHARED_CACHE - псевдоним из CACHES для общего кеша между процессами (например, Redis)
+TOKEN_AUTH_CACHE = {
+    'MAXSIZE': 10000,
+    'TTL': 60,
+    'SHARED_CACHE': os.environ.get('TOKEN_AUTH_SHARED_CACHE'),
+    'SHARED_TTL': 300,
+}
+
+# Подписанные токены устройств: срок действия и период обновления списка отозванных токенов, сек.
+AUTH_TOKEN_TTL = timedelta(days=30)
+AUTH_TOKEN_REVOCATION_REFRESH = 5
+
+# Сколько самых частых значений каждого параметра возвращать в фасетах
+FACET_VALUES_LIMIT = 50
+
+# Замеры запросов к API: заголовок Server-Timing с временем в базе и сериализаторах,
+# адреса, с которых доступен /api/v1/metrics без входа администратора
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', str(DEBUG)) == 'True'
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Предельное число SQL-запросов на запрос к маршруту ('backend:basket' или 'GET backend:basket').
+# Превышение пишется в лог, при METRICS_ENFORCE_QUERY_BUDGETS=True (в тестах) - исключение.
+# Бюджеты включают аутентификацию на пустом кеше токенов: до 2 запросов для подписанного токена
+# (пользователь и список отзыва), 1 для токена Token; проверяется командой check_query_budgets
+QUERY_BUDGETS = {
+    'GET backend:products': 6,
+    'GET backend:categories': 5,
+    'GET backend:shops': 5,
+    # Первый просмотр создаёт корзину: поиск, BEGIN и INSERT вместо одного чтения
+    'GET backend:basket': 7,
+    'POST backend:basket': 8,
+    'DELETE backend:basket': 7,
+    'GET backend:order': 5,
+    # Письма о заказе только ставятся в очередь OutgoingEmail (по 4 запроса на письмо), с брокером SMTP - вне запроса.
+    # Без брокера после фиксации письма отправляются в запросе одной пачкой: ещё 6 запросов при любом числе писем
+    'POST backend:order': 22 + (6 if CELERY_TASK_ALWAYS_EAGER else 0),
+    'GET backend:partner-orders': 5,
+    'GET backend:user-contact-create-or-list': 4,
+}
+METRICS_ENFORCE_QUERY_BUDGETS = os.environ.get('METRICS_ENFORCE_QUERY_BUDGETS', 'False') == 'True'